@@ -1,6 +1,7 @@
 ﻿const state = {
     meteoData: null,
     currentCommune: null,
+    pendingCommune: null,
     currentMetric: 'temperature',
     currentMapMetric: 'all',
     compareMetric: 'temp_max',
@@ -23,19 +24,32 @@
     selectedCommuneName: null,
     selectedCommuneKey: null,
     compareSelection: [],
+    communeRequests: {},
     geojsonCache: {
         department: null,
-        communes: null
+        communes: null,
+        manifest: undefined,
+        level: null,
+        levels: {}
     },
     spatial: {
         enabled: false,
         index: null,
+        // Records of scripts/layer_server.py (api/index.json) when the dashboard is served by it.
+        live: null,
         layer: null,
         cache: {},
         currentKey: null,
         communeGeoIndex: {},
         summaryCache: {},
-        debounceId: null
+        debounceId: null,
+        // Time-series layers (--series): header promises per path, decompressed chunks (LRU), current frame.
+        series: {},
+        seriesChunks: new Map(),
+        seriesKey: null,
+        step: null,
+        failedKey: null,
+        playId: null
     },
     heatLayer: null,
     heatmapEnabled: false,
@@ -94,6 +108,8 @@ function setupEventListeners() {
     spatialToggle.addEventListener('change', handleSpatialToggle);
     spatialVariable.addEventListener('change', scheduleSpatialUpdate);
     spatialPeriod.addEventListener('change', scheduleSpatialUpdate);
+    document.getElementById('spatialTime').addEventListener('input', handleSpatialTimeInput);
+    document.getElementById('spatialPlay').addEventListener('click', toggleSpatialPlayback);
     heatmapToggle.addEventListener('change', (event) => setHeatmapEnabled(event.target.checked));
     compareBtn.addEventListener('click', compareCommunes);
     searchInput.addEventListener('input', (event) => {
@@ -115,7 +131,11 @@ function setupEventListeners() {
 
 async function loadData() {
     try {
-        const response = await fetch('meteo_data.json');
+        // Resume + series chargees a la demande ; meteo_data.json complet en repli (anciens exports).
+        let response = await fetch('meteo_summary.json');
+        if (!response.ok) {
+            response = await fetch('meteo_data.json');
+        }
         if (!response.ok) {
             throw new Error('Unable to load JSON file.');
         }
@@ -186,10 +206,57 @@ function populateCommuneSelect() {
     document.getElementById('compare2').innerHTML = '<option value="">Commune 2</option>' + options;
 }
 
-function selectCommune(communeName) {
+function formatRawDate(raw) {
+    const value = String(raw);
+    return `${value.slice(6, 8)}/${value.slice(4, 6)}/${value.slice(0, 4)}`;
+}
+
+function seriesToDonnees(series) {
+    const variables = Object.keys(series).filter((key) => key !== 'nom' && key !== 'dates');
+    return series.dates.map((raw, idx) => {
+        const day = { date: formatRawDate(raw), date_raw: raw };
+        variables.forEach((variable) => {
+            day[variable] = series[variable][idx];
+        });
+        return day;
+    });
+}
+
+function loadCommuneSeries(communeName) {
+    const commune = state.meteoData.communes[communeName];
+    if (!commune) return Promise.resolve(null);
+    if (commune.donnees) return Promise.resolve(commune);
+    if (!state.communeRequests[communeName]) {
+        state.communeRequests[communeName] = fetch(commune.serie)
+            .then((response) => {
+                if (!response.ok) throw new Error(`Unable to load ${commune.serie}`);
+                return response.json();
+            })
+            .then((series) => {
+                commune.donnees = seriesToDonnees(series);
+                return commune;
+            })
+            .finally(() => {
+                delete state.communeRequests[communeName];
+            });
+    }
+    return state.communeRequests[communeName];
+}
+
+async function selectCommune(communeName) {
     const resolvedName = resolveCommuneName(communeName);
-    const commune = state.meteoData.communes[resolvedName];
-    if (!commune) return;
+    if (!state.meteoData.communes[resolvedName]) return;
+
+    state.pendingCommune = resolvedName;
+    let commune;
+    try {
+        commune = await loadCommuneSeries(resolvedName);
+    } catch (error) {
+        console.error('Error loading commune series:', error);
+        return;
+    }
+    // Une autre commune a pu etre selectionnee pendant le chargement.
+    if (state.pendingCommune !== resolvedName) return;
 
     state.currentCommune = resolvedName;
     showChartEmptyState(false);
@@ -207,10 +274,16 @@ function selectCommune(communeName) {
 }
 
 function renderCommuneKpis(commune) {
-    const validTemps = commune.donnees.filter((d) => d.temp_moy !== null).map((d) => d.temp_moy);
-    const avgTemp = validTemps.length ? validTemps.reduce((a, b) => a + b, 0) / validTemps.length : null;
-    const totalPrecip = commune.donnees.reduce((sum, d) => sum + (d.precipitation || 0), 0);
-    const maxWind = Math.max(...commune.donnees.map((d) => d.vent_max || 0));
+    // Agregats precalcules du resume ; recalcul sur les jours avec l'ancien meteo_data.json.
+    let avgTemp = commune.temp_moyenne;
+    let totalPrecip = commune.precip_totale;
+    let maxWind = commune.vent_max ?? 0;
+    if (avgTemp === undefined) {
+        const validTemps = commune.donnees.filter((d) => d.temp_moy !== null).map((d) => d.temp_moy);
+        avgTemp = validTemps.length ? validTemps.reduce((a, b) => a + b, 0) / validTemps.length : null;
+        totalPrecip = commune.donnees.reduce((sum, d) => sum + (d.precipitation || 0), 0);
+        maxWind = commune.donnees.reduce((max, d) => Math.max(max, d.vent_max || 0), 0);
+    }
     const lastDay = commune.donnees[commune.donnees.length - 1];
 
     const cards = [
@@ -334,8 +407,24 @@ function highlightMarker(communeName) {
     }
 }
 
-async function loadGeoJsonLayers() {
+function registerLambert93() {
     proj4.defs('EPSG:2154', '+proj=lcc +lat_1=49 +lat_2=44 +lat_0=46.5 +lon_0=3 +x_0=700000 +y_0=6600000 +ellps=GRS80 +units=m +no_defs');
+}
+
+async function loadGeoJsonLayers() {
+    const manifest = await loadBoundaryManifest();
+    if (manifest) {
+        await showBoundaryLevel(boundaryLevelForZoom(manifest, state.map.getZoom()));
+        state.map.on('zoomend', () => {
+            const level = boundaryLevelForZoom(manifest, state.map.getZoom());
+            if (level.name !== state.geojsonCache.level) {
+                showBoundaryLevel(level);
+            }
+        });
+        return;
+    }
+
+    registerLambert93();
     const targetCrs = 'EPSG:4326';
 
     let deptReprojected = state.geojsonCache.department;
@@ -361,9 +450,48 @@ async function loadGeoJsonLayers() {
         state.geojsonCache.communes = communesReprojected;
     }
 
+    addBoundaryLayers(deptReprojected, communesReprojected);
+}
+
+async function loadBoundaryManifest() {
+    if (state.geojsonCache.manifest !== undefined) return state.geojsonCache.manifest;
+    try {
+        const response = await fetch('data/boundaries/manifest.json');
+        state.geojsonCache.manifest = response.ok ? await response.json() : null;
+    } catch (error) {
+        state.geojsonCache.manifest = null;
+    }
+    return state.geojsonCache.manifest;
+}
+
+function boundaryLevelForZoom(manifest, zoom) {
+    const levels = manifest.levels.slice().sort((a, b) => a.max_zoom - b.max_zoom);
+    return levels.find((level) => zoom <= level.max_zoom) || levels[levels.length - 1];
+}
+
+async function showBoundaryLevel(level) {
+    state.geojsonCache.level = level.name;
+    let cached = state.geojsonCache.levels[level.name];
+    if (!cached) {
+        const [department, communes] = await Promise.all([
+            fetch(level.departement).then((response) => response.json()),
+            fetch(level.communes).then((response) => response.json())
+        ]);
+        cached = { department, communes };
+        state.geojsonCache.levels[level.name] = cached;
+    }
+    if (state.geojsonCache.level !== level.name) return;
+    addBoundaryLayers(cached.department, cached.communes);
+    updateMapSelection();
+}
+
+function addBoundaryLayers(departmentGeo, communesGeo) {
+    if (state.departmentLayer) state.map.removeLayer(state.departmentLayer);
+    if (state.communeLayer) state.map.removeLayer(state.communeLayer);
+
     const canvasRenderer = L.canvas({ padding: 0.5 });
 
-    state.departmentLayer = L.geoJSON(deptReprojected, {
+    state.departmentLayer = L.geoJSON(departmentGeo, {
         style: {
             color: '#1f3faa',
             weight: 3,
@@ -372,7 +500,7 @@ async function loadGeoJsonLayers() {
         renderer: canvasRenderer
     }).addTo(state.map);
 
-    state.communeLayer = L.geoJSON(communesReprojected, {
+    state.communeLayer = L.geoJSON(communesGeo, {
         style: defaultCommuneStyle,
         renderer: canvasRenderer,
         onEachFeature: (feature, layer) => {
@@ -383,8 +511,9 @@ async function loadGeoJsonLayers() {
                 layer.bindPopup(`<strong>${displayName}</strong>`);
                 state.communeFeatureIndex[normalizeName(displayName)] = layer;
                 state.spatial.communeGeoIndex[normalizeName(displayName)] = {
+                    insee: feature.properties?.insee,
                     geometry: feature.geometry,
-                    bounds: computeGeometryBounds(feature.geometry)
+                    bounds: feature.bbox ? bboxToBounds(feature.bbox) : computeGeometryBounds(feature.geometry)
                 };
             }
             layer.on({
@@ -465,7 +594,7 @@ function reprojectCoords(coords, sourceCrs, targetCrs) {
 
 function getMetricValue(commune, metric) {
     if (metric === 'all') return null;
-    const last = commune.donnees[commune.donnees.length - 1];
+    const last = commune.donnees ? commune.donnees[commune.donnees.length - 1] : commune.dernier_jour;
     if (!last) return null;
     if (metric === 'temperature') return last.temp_moy ?? null;
     if (metric === 'precipitation') return last.precipitation ?? 0;
@@ -474,6 +603,7 @@ function getMetricValue(commune, metric) {
 }
 
 function getCommuneHeatValue(commune) {
+    if (!commune.donnees) return commune.temp_moyenne ?? null;
     const temps = commune.donnees.filter((d) => d.temp_moy !== null && d.temp_moy !== undefined).map((d) => d.temp_moy);
     if (!temps.length) return null;
     return temps.reduce((a, b) => a + b, 0) / temps.length;
@@ -591,6 +721,7 @@ function createAnalyticsCharts() {
 
     const tempData = Object.entries(state.meteoData.communes)
         .map(([nom, data]) => {
+            if (!data.donnees) return { commune: nom, value: data.temp_moyenne };
             const temps = data.donnees.filter((d) => d.temp_moy !== null).map((d) => d.temp_moy);
             const avg = temps.length ? temps.reduce((a, b) => a + b, 0) / temps.length : 0;
             return { commune: nom, value: avg };
@@ -599,6 +730,7 @@ function createAnalyticsCharts() {
 
     const precipData = Object.entries(state.meteoData.communes)
         .map(([nom, data]) => {
+            if (!data.donnees) return { commune: nom, value: data.precip_totale };
             const total = data.donnees.reduce((sum, d) => sum + (d.precipitation || 0), 0);
             return { commune: nom, value: total };
         })
@@ -1149,6 +1281,7 @@ function resetMapStyles() {
 
 function resetSelection() {
     state.currentCommune = null;
+    state.pendingCommune = null;
     state.selectedCommuneName = null;
     state.selectedCommuneKey = null;
     state.compareSelection = [];
@@ -1250,15 +1383,25 @@ async function loadSpatialIndex() {
         console.warn('Spatial index not available:', error);
         state.spatial.index = null;
     }
+    try {
+        const response = await fetch('api/index.json');
+        state.spatial.live = response.ok ? (await response.json()).layers : null;
+    } catch (error) {
+        state.spatial.live = null;
+    }
     updateSpatialControlsAvailability();
 }
 
+function hasSpatialLayers() {
+    return Boolean(state.spatial.index?.layers?.length || state.spatial.live?.length);
+}
+
 function updateSpatialControlsAvailability() {
     const toggle = document.getElementById('spatialToggle');
     const label = document.getElementById('spatialToggleLabel');
     const variableSelect = document.getElementById('spatialVariable');
     const periodSelect = document.getElementById('spatialPeriod');
-    const hasLayers = Boolean(state.spatial.index?.layers?.length);
+    const hasLayers = hasSpatialLayers();
 
     toggle.disabled = !hasLayers;
     variableSelect.disabled = !hasLayers;
@@ -1268,6 +1411,7 @@ function updateSpatialControlsAvailability() {
         toggle.checked = false;
         state.spatial.enabled = false;
         label.textContent = 'OFF';
+        setSpatialTimeControls(null);
         clearSpatialLayer();
         updateSpatialSummary('Aucune couche spatiale disponible.');
         updateStationLegend();
@@ -1302,13 +1446,15 @@ function scheduleSpatialUpdate() {
 
 function applySpatialLayer() {
     if (!state.spatial.enabled) {
+        setSpatialTimeControls(null);
         clearSpatialLayer();
         updateStationLegend();
         updateSpatialSummary();
         return;
     }
 
-    if (!state.spatial.index?.layers?.length) {
+    if (!hasSpatialLayers()) {
+        setSpatialTimeControls(null);
         clearSpatialLayer();
         updateSpatialSummary('Aucune couche spatiale disponible.');
         return;
@@ -1318,18 +1464,43 @@ function applySpatialLayer() {
     const periodType = document.getElementById('spatialPeriod').value;
     const record = pickSpatialRecord(variable, periodType);
     if (!record) {
+        setSpatialTimeControls(null);
         clearSpatialLayer();
         updateSpatialSummary('Aucune periode disponible pour cette variable.');
         return;
     }
+    if (record.live) {
+        showLiveLayer(record);
+        return;
+    }
+    if (record.series) {
+        showSeriesLayer(record);
+        return;
+    }
+    setSpatialTimeControls(null);
     showSpatialLayer(record);
 }
 
 function pickSpatialRecord(variable, periodType) {
-    const candidates = state.spatial.index.layers.filter(
+    // Live layers cover every period, the static index only what was generated.
+    const live = state.spatial.live?.find(
+        (item) => item.variable === variable && item.period_type === periodType
+    );
+    if (live) return live;
+    if (!state.spatial.index?.layers) return null;
+    const layers = state.spatial.index.layers;
+    const range = state.spatial.index.lookup?.[variable]?.[periodType];
+    if (state.spatial.index.lookup) {
+        // Compacted index: layers sorted by period inside each [start, end) range,
+        // a time series ("series-<type>") sorts after the dated layers.
+        return range && range[1] > range[0] ? layers[range[1] - 1] : null;
+    }
+    const candidates = layers.filter(
         (item) => item.variable === variable && item.period_type === periodType
     );
     if (!candidates.length) return null;
+    const series = candidates.find((item) => item.series);
+    if (series) return series;
     const sorted = candidates.slice().sort((a, b) => parseSpatialPeriod(a) - parseSpatialPeriod(b));
     return sorted[sorted.length - 1];
 }
@@ -1341,7 +1512,7 @@ function parseSpatialPeriod(record) {
     return parseInt(record.period, 10);
 }
 
-function showSpatialLayer(record) {
+function showSpatialLayer(record, loadPoints = () => loadSpatialPoints(record)) {
     const key = `${record.variable}:${record.period_type}:${record.period}`;
     if (state.spatial.currentKey === key && state.spatial.layer) {
         updateSpatialLegend(record);
@@ -1362,20 +1533,26 @@ function showSpatialLayer(record) {
         return;
     }
 
-    const geojsonPath = normalizeSpatialPath(record.geojson);
     showMapLoader(true, 'Chargement analyse spatiale...');
-    fetch(geojsonPath)
-        .then((response) => response.json())
-        .then((geojson) => {
-            const layerData = buildSpatialLayer(geojson, record);
+    loadPoints()
+        .then((points) => {
+            const layerData = buildSpatialLayer(points, record);
             state.spatial.cache[key] = layerData;
+            // Another layer (or frame) was requested while this one loaded.
+            if (state.spatial.currentKey !== key) return;
             state.spatial.layer = layerData.layer;
             layerData.layer.addTo(state.map);
             bringSpatialLayersToFront();
             updateSpatialLegend(record, layerData.stats);
             updateSpatialSummary();
         })
-        .catch((error) => console.warn('Spatial layer load error:', error))
+        .catch((error) => {
+            console.warn('Spatial layer load error:', error);
+            if (state.spatial.currentKey !== key) return;
+            // Playback moves on past a frame that cannot be loaded (live period without data).
+            state.spatial.failedKey = key;
+            updateSpatialSummary('Couche spatiale indisponible pour cette periode.');
+        })
         .finally(() => showMapLoader(false));
 }
 
@@ -1385,24 +1562,289 @@ function bringSpatialLayersToFront() {
     if (state.communeLayer) state.communeLayer.bringToFront();
 }
 
-function buildSpatialLayer(geojson, record) {
-    const points = extractSpatialPoints(geojson);
+async function loadSpatialPoints(record) {
+    if (record.raster) {
+        const headerPath = normalizeSpatialPath(record.raster);
+        const headerResponse = await fetch(headerPath);
+        if (!headerResponse.ok) throw new Error(`HTTP ${headerResponse.status}`);
+        const header = await headerResponse.json();
+        if (record.live) {
+            // Computed on request: the stats come with the layer, not with the index.
+            record.stats = header.stats;
+            record.communes = header.communes;
+        }
+        const dataPath = headerPath.slice(0, headerPath.lastIndexOf('/') + 1) + header.data;
+        const response = await fetch(dataPath);
+        let buffer = await response.arrayBuffer();
+        if (header.compression === 'gzip') {
+            const stream = new Blob([buffer]).stream().pipeThrough(new DecompressionStream('gzip'));
+            buffer = await new Response(stream).arrayBuffer();
+        }
+        return decodeRasterPoints(header, buffer);
+    }
+    const geojson = await fetch(normalizeSpatialPath(record.geojson)).then((response) => response.json());
+    return extractSpatialPoints(geojson);
+}
+
+function showLiveLayer(record) {
+    // One layer per period, computed (or read from its cache) by the server; the time slider walks the periods.
+    const seriesKey = `live:${record.variable}:${record.period_type}`;
+    if (state.spatial.seriesKey !== seriesKey) {
+        dropSeriesFrames(state.spatial.seriesKey);
+        state.spatial.seriesKey = seriesKey;
+        state.spatial.step = record.periods.length - 1;
+    }
+    setSpatialTimeControls(record);
+    const period = record.periods[state.spatial.step];
+    const params = new URLSearchParams({
+        variable: record.variable,
+        period,
+        method: record.method,
+        grid: String(record.grid)
+    });
+    const frame = { ...record, period, series_key: seriesKey, raster: `${record.live}?${params}` };
+    dropSeriesFrames(seriesKey, `${frame.variable}:${frame.period_type}:${frame.period}`);
+    showSpatialLayer(frame);
+}
+
+function showSeriesLayer(record) {
+    const seriesKey = `${record.variable}:${record.period_type}:${record.series}`;
+    loadSeriesHeader(record)
+        .then((header) => {
+            if (state.spatial.seriesKey !== seriesKey) {
+                // New series: start on the latest period, like the single layers.
+                dropSeriesFrames(state.spatial.seriesKey);
+                state.spatial.seriesKey = seriesKey;
+                state.spatial.step = header.periods.length - 1;
+            }
+            setSpatialTimeControls(header);
+            const step = state.spatial.step;
+            const frame = { ...record, period: header.periods[step], series_key: seriesKey };
+            dropSeriesFrames(seriesKey, `${frame.variable}:${frame.period_type}:${frame.period}`);
+            showSpatialLayer(frame, () => loadSeriesPoints(header, step));
+            // Prefetch the chunk of the next frame (playback / scrubbing forward).
+            if (step + 1 < header.periods.length) {
+                loadSeriesChunk(header, seriesChunkIndex(header, step + 1)).catch(() => {});
+            }
+        })
+        .catch((error) => {
+            console.warn('Spatial series load error:', error);
+            clearSpatialLayer();
+            updateSpatialSummary('Serie spatiale indisponible.');
+        });
+}
+
+function loadSeriesHeader(record) {
+    const path = normalizeSpatialPath(record.series);
+    if (!state.spatial.series[path]) {
+        state.spatial.series[path] = fetch(path)
+            .then((response) => {
+                if (!response.ok) throw new Error(`HTTP ${response.status}`);
+                return response.json();
+            })
+            .then((header) => ({
+                ...header,
+                dataPath: path.slice(0, path.lastIndexOf('/') + 1) + header.data,
+                fullBuffer: null,
+                coordinates: null
+            }));
+        state.spatial.series[path].catch(() => delete state.spatial.series[path]);
+    }
+    return state.spatial.series[path];
+}
+
+function seriesChunkIndex(header, step) {
+    return header.chunks.findIndex((chunk) => step >= chunk.start && step < chunk.start + chunk.count);
+}
+
+function loadSeriesChunk(header, chunkIndex) {
+    const cacheKey = `${header.dataPath}#${chunkIndex}`;
+    const chunks = state.spatial.seriesChunks;
+    if (chunks.has(cacheKey)) {
+        const pending = chunks.get(cacheKey);
+        chunks.delete(cacheKey);
+        chunks.set(cacheKey, pending);
+        return pending;
+    }
+    const chunk = header.chunks[chunkIndex];
+    const first = chunk.byte_offset;
+    const last = first + chunk.byte_length - 1;
+    const pending = (async () => {
+        let buffer;
+        if (header.fullBuffer) {
+            buffer = header.fullBuffer.slice(first, last + 1);
+        } else {
+            // Only the bytes of this chunk; a server ignoring Range sends the whole file (200), kept for the next chunks.
+            const response = await fetch(header.dataPath, { headers: { Range: `bytes=${first}-${last}` } });
+            if (!response.ok) throw new Error(`HTTP ${response.status}`);
+            buffer = await response.arrayBuffer();
+            if (response.status !== 206) {
+                header.fullBuffer = buffer;
+                buffer = buffer.slice(first, last + 1);
+            }
+        }
+        if (header.compression === 'gzip') {
+            const stream = new Blob([buffer]).stream().pipeThrough(new DecompressionStream('gzip'));
+            buffer = await new Response(stream).arrayBuffer();
+        }
+        return buffer;
+    })();
+    chunks.set(cacheKey, pending);
+    pending.catch(() => chunks.delete(cacheKey));
+    while (chunks.size > 8) {
+        chunks.delete(chunks.keys().next().value);
+    }
+    return pending;
+}
+
+function seriesCoordinates(header) {
+    // Cell centres in WGS84, computed once per series and shared by every frame.
+    if (!header.coordinates) {
+        registerLambert93();
+        const [rows, cols] = header.shape;
+        const [west, north] = header.origin;
+        const res = header.resolution;
+        const lons = new Float64Array(rows * cols);
+        const lats = new Float64Array(rows * cols);
+        for (let row = 0; row < rows; row += 1) {
+            const y = north - (row + 0.5) * res;
+            for (let col = 0; col < cols; col += 1) {
+                const [lon, lat] = proj4(header.crs, 'EPSG:4326', [west + (col + 0.5) * res, y]);
+                lons[row * cols + col] = lon;
+                lats[row * cols + col] = lat;
+            }
+        }
+        header.coordinates = { lons, lats };
+    }
+    return header.coordinates;
+}
+
+async function loadSeriesPoints(header, step) {
+    const chunkIndex = seriesChunkIndex(header, step);
+    const chunk = header.chunks[chunkIndex];
+    const buffer = await loadSeriesChunk(header, chunkIndex);
+    const cells = header.shape[0] * header.shape[1];
+    const offset = (step - chunk.start) * cells;
+    const data = header.dtype === 'float32'
+        ? new Float32Array(buffer, offset * 4, cells)
+        : new Uint16Array(buffer, offset * 2, cells);
+    const { lons, lats } = seriesCoordinates(header);
+    const points = [];
+    for (let idx = 0; idx < cells; idx += 1) {
+        const raw = data[idx];
+        if (header.dtype === 'float32' ? Number.isNaN(raw) : raw === header.nodata) continue;
+        points.push({ lon: lons[idx], lat: lats[idx], value: chunk.offset + raw * chunk.scale });
+    }
+    return points;
+}
+
+function dropSeriesFrames(seriesKey, keepKey = null) {
+    // Only the displayed frame of a series stays in the layer cache (a year of daily frames would pile up
+    // marker layers); other frames are rebuilt from the cached chunks.
+    if (!seriesKey) return;
+    Object.keys(state.spatial.cache).forEach((key) => {
+        if (key !== keepKey && state.spatial.cache[key].record?.series_key === seriesKey) {
+            delete state.spatial.cache[key];
+        }
+    });
+}
+
+function setSpatialTimeControls(header) {
+    const group = document.getElementById('spatialTimeGroup');
+    const slider = document.getElementById('spatialTime');
+    if (!group || !slider) return;
+    if (!header) {
+        stopSpatialPlayback();
+        dropSeriesFrames(state.spatial.seriesKey);
+        state.spatial.seriesKey = null;
+        group.hidden = true;
+        return;
+    }
+    group.hidden = false;
+    slider.max = String(header.periods.length - 1);
+    slider.value = String(state.spatial.step);
+    document.getElementById('spatialTimeLabel').textContent = header.periods[state.spatial.step];
+}
+
+function handleSpatialTimeInput(event) {
+    state.spatial.step = Number(event.target.value);
+    if (state.spatial.debounceId) {
+        clearTimeout(state.spatial.debounceId);
+    }
+    state.spatial.debounceId = setTimeout(() => applySpatialLayer(), 60);
+}
+
+function toggleSpatialPlayback() {
+    if (state.spatial.playId) {
+        stopSpatialPlayback();
+        return;
+    }
+    document.getElementById('spatialPlay').textContent = 'Pause';
+    state.spatial.playId = setInterval(() => {
+        const slider = document.getElementById('spatialTime');
+        const count = Number(slider.max) + 1;
+        // Previous frame still loading: wait for it rather than queueing frames.
+        const current = state.spatial.currentKey;
+        if (!state.spatial.enabled || !count || (!state.spatial.cache[current] && state.spatial.failedKey !== current)) {
+            return;
+        }
+        state.spatial.step = (state.spatial.step + 1) % count;
+        applySpatialLayer();
+    }, 700);
+}
+
+function stopSpatialPlayback() {
+    if (state.spatial.playId) {
+        clearInterval(state.spatial.playId);
+        state.spatial.playId = null;
+    }
+    const button = document.getElementById('spatialPlay');
+    if (button) button.textContent = 'Lecture';
+}
+
+function decodeRasterPoints(header, buffer) {
+    registerLambert93();
+    const [rows, cols] = header.shape;
+    const [west, north] = header.origin;
+    const res = header.resolution;
+    const data = header.dtype === 'float32' ? new Float32Array(buffer) : new Uint16Array(buffer);
+    const points = [];
+    for (let row = 0; row < rows; row += 1) {
+        const y = north - (row + 0.5) * res;
+        for (let col = 0; col < cols; col += 1) {
+            const raw = data[row * cols + col];
+            if (header.dtype === 'float32' ? Number.isNaN(raw) : raw === header.nodata) continue;
+            const [lon, lat] = proj4(header.crs, 'EPSG:4326', [west + (col + 0.5) * res, y]);
+            points.push({ lon, lat, value: header.offset + raw * header.scale });
+        }
+    }
+    return points;
+}
+
+function buildSpatialLayer(points, record) {
     const stats = buildSpatialStats(points, record.stats);
+    if (record.tiles) {
+        // Pre-rendered XYZ pyramid (same palette, layer min / max): only the tiles in view are fetched.
+        const [minZoom, maxZoom] = record.tile_zooms;
+        const layer = L.tileLayer(normalizeSpatialPath(record.tiles), {
+            minNativeZoom: minZoom,
+            maxNativeZoom: maxZoom,
+            bounds: L.latLngBounds(record.tile_bounds),
+            opacity: 0.8
+        });
+        return { layer, points, stats, record };
+    }
     const renderer = L.canvas({ padding: 0.5 });
     const paletteMetric = record.variable === 'temperature' ? 'temperature' : record.variable;
-    const layer = L.geoJSON(geojson, {
-        renderer,
-        pointToLayer: (feature, latlng) => {
-            const value = feature.properties?.value ?? 0;
-            const color = interpolateColor(stats.min, stats.max, value, paletteMetric);
-            return L.circleMarker(latlng, {
-                radius: 3,
-                weight: 0,
-                fillColor: color,
-                fillOpacity: 0.8
-            });
-        }
-    });
+    const layer = L.layerGroup(
+        points.map((point) => L.circleMarker([point.lat, point.lon], {
+            renderer,
+            radius: 3,
+            weight: 0,
+            fillColor: interpolateColor(stats.min, stats.max, point.value, paletteMetric),
+            fillOpacity: 0.8
+        }))
+    );
     return { layer, points, stats, record };
 }
 
@@ -1507,7 +1949,10 @@ function updateSpatialSummary(message) {
     }
 
     const label = metricLabel(cache.record?.variable || document.getElementById('spatialVariable').value);
-    const html = `<strong>${label}</strong>: ${summary.value.toFixed(2)} (${summary.method})`;
+    const range = summary.min !== undefined
+        ? `, min ${summary.min.toFixed(2)} / max ${summary.max.toFixed(2)}`
+        : '';
+    const html = `<strong>${label}</strong>: ${summary.value.toFixed(2)} (${summary.method}${range})`;
     state.spatial.summaryCache[summaryKey] = html;
     body.innerHTML = html;
 }
@@ -1515,6 +1960,14 @@ function updateSpatialSummary(message) {
 function computeSpatialSummary(communeName, layerData) {
     const key = normalizeName(communeName);
     const target = state.spatial.communeGeoIndex[key];
+    // Precomputed per-commune stats from the layer index: [moyenne, min, max, nb mailles].
+    const zonal = target?.insee ? layerData.record?.communes?.[target.insee] : null;
+    if (zonal) {
+        const [value, min, max, cells] = zonal;
+        return cells > 0
+            ? { value, min, max, method: 'moyenne commune' }
+            : { value, method: 'valeur au centre' };
+    }
     if (!target || !layerData.points.length) {
         return null;
     }
@@ -1569,6 +2022,10 @@ function computeGeometryBounds(geometry) {
     return bounds;
 }
 
+function bboxToBounds(bbox) {
+    return { minLon: bbox[0], minLat: bbox[1], maxLon: bbox[2], maxLat: bbox[3] };
+}
+
 function walkGeometryCoords(geometry, cb) {
     if (!geometry) return;
     const { type, coordinates } = geometry;
@@ -1740,7 +2197,7 @@ function animatePanel(elementId) {
     });
 }
 
-function compareCommunes() {
+async function compareCommunes() {
     const commune1 = document.getElementById('compare1').value;
     const commune2 = document.getElementById('compare2').value;
 
@@ -1749,8 +2206,14 @@ function compareCommunes() {
         return;
     }
 
-    const data1 = state.meteoData.communes[commune1];
-    const data2 = state.meteoData.communes[commune2];
+    let data1;
+    let data2;
+    try {
+        [data1, data2] = await Promise.all([loadCommuneSeries(commune1), loadCommuneSeries(commune2)]);
+    } catch (error) {
+        console.error('Error loading commune series:', error);
+        return;
+    }
     const metric = state.compareMetric;
 
     const ctx = document.getElementById('comparisonChart').getContext('2d');
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Preparation des limites communales et departementales pour le dashboard
+Reprojection EPSG:2154 -> EPSG:4326, simplification par niveau de zoom (topologie partagee),
+quantification des coordonnees et calcul des emprises
+"""
+
+import json
+import os
+from datetime import datetime
+
+import numpy as np
+
+try:
+    import shapely
+    from shapely.geometry import shape, mapping
+except ImportError as exc:
+    raise SystemExit("Missing dependency: shapely") from exc
+
+try:
+    from pyproj import Transformer
+except ImportError as exc:
+    raise SystemExit("Missing dependency: pyproj") from exc
+
+# Niveaux de detail : zoom Leaflet maximal, tolerance de simplification (m, EPSG:2154), decimales
+LEVELS = [
+    {'name': 'z9', 'max_zoom': 9, 'tolerance': 250, 'decimals': 4},
+    {'name': 'z11', 'max_zoom': 11, 'tolerance': 60, 'decimals': 5},
+    {'name': 'z19', 'max_zoom': 19, 'tolerance': 10, 'decimals': 5},
+]
+
+LAYERS = {
+    'communes': {'source': 'data/raw/communes_13.geojson', 'properties': ['nom', 'insee']},
+    'departement': {'source': 'data/raw/departement_13.geojson', 'properties': ['nom', 'code']},
+}
+
+def load_features(path, keep):
+    """Charge un GeoJSON EPSG:2154 et ne garde que les proprietes utiles"""
+    with open(path, 'r', encoding='utf-8') as f:
+        geo = json.load(f)
+    geoms = [shape(feat['geometry']) for feat in geo['features']]
+    props = [{k: feat['properties'].get(k) for k in keep} for feat in geo['features']]
+    print(f"{path} : {len(geoms)} entites, {int(shapely.get_num_coordinates(geoms).sum())} sommets")
+    return geoms, props
+
+def simplify_coverage(geoms, tolerance):
+    """Simplifie l'ensemble des polygones en conservant les limites communes"""
+    if hasattr(shapely, 'coverage_simplify'):
+        return list(shapely.coverage_simplify(geoms, tolerance))
+    # shapely < 2.1 : simplification independante (petits decalages possibles aux limites)
+    return [g.simplify(tolerance, preserve_topology=True) for g in geoms]
+
+def reproject_and_quantize(geoms, transformer, decimals):
+    """Reprojette en EPSG:4326 et arrondit les coordonnees"""
+    def project(coords):
+        lon, lat = transformer.transform(coords[:, 0], coords[:, 1])
+        return np.round(np.column_stack([lon, lat]), decimals)
+    return [shapely.transform(g, project) for g in geoms]
+
+def build_feature_collection(geoms, props, decimals):
+    """Construit la FeatureCollection avec une emprise (bbox) par entite"""
+    features = []
+    for geom, prop in zip(geoms, props):
+        if geom.is_empty:
+            continue
+        features.append({
+            'type': 'Feature',
+            'bbox': [round(v, decimals) for v in geom.bounds],
+            'properties': prop,
+            'geometry': mapping(geom)
+        })
+    return {'type': 'FeatureCollection', 'features': features}
+
+def save_compact_json(data, output_file):
+    """Sauvegarde en JSON compact"""
+    with open(output_file, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False, separators=(',', ':'))
+    return os.path.getsize(output_file)
+
+def main():
+    output_dir = 'data/boundaries'
+
+    print("="*70)
+    print("PREPARATION DES LIMITES ADMINISTRATIVES - DEPARTEMENT 13")
+    print("="*70)
+
+    for layer in LAYERS.values():
+        if not os.path.exists(layer['source']):
+            print(f"\nERREUR: Fichier introuvable : {layer['source']}")
+            return
+
+    os.makedirs(output_dir, exist_ok=True)
+    transformer = Transformer.from_crs('EPSG:2154', 'EPSG:4326', always_xy=True)
+
+    manifest = {
+        'crs': 'EPSG:4326',
+        'date_generation': datetime.now().strftime('%d/%m/%Y %H:%M:%S'),
+        'levels': [],
+        'bbox': {}
+    }
+    sources = {name: load_features(layer['source'], layer['properties']) for name, layer in LAYERS.items()}
+
+    for level in LEVELS:
+        entry = {'name': level['name'], 'max_zoom': level['max_zoom'], 'tolerance_m': level['tolerance']}
+        for name, (geoms, props) in sources.items():
+            simplified = simplify_coverage(geoms, level['tolerance'])
+            projected = reproject_and_quantize(simplified, transformer, level['decimals'])
+            collection = build_feature_collection(projected, props, level['decimals'])
+            filename = f"{name}_13.{level['name']}.geojson"
+            size = save_compact_json(collection, os.path.join(output_dir, filename))
+            entry[name] = f"{output_dir}/{filename}"
+            nb_coords = int(shapely.get_num_coordinates(projected).sum())
+            print(f"  {level['name']:4s} {name:12s} : {nb_coords:6d} sommets, {size / 1024:8.1f} Ko")
+        manifest['levels'].append(entry)
+
+    full = {name: reproject_and_quantize(geoms, transformer, 6) for name, (geoms, _) in sources.items()}
+    minx, miny, maxx, maxy = shapely.total_bounds(full['departement'])
+    manifest['bbox']['departement'] = [minx, miny, maxx, maxy]
+    manifest['bbox']['communes'] = {
+        props['insee']: list(geom.bounds) for geom, props in zip(full['communes'], sources['communes'][1])
+    }
+
+    save_compact_json(manifest, os.path.join(output_dir, 'manifest.json'))
+    print(f"\nManifeste cree : {output_dir}/manifest.json")
+    print("="*70)
+
+if __name__ == "__main__":
+    main()
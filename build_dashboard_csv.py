@@ -3,24 +3,158 @@
 """
 Script de traitement des donnees meteorologiques avec generation de carte
 Departement 13 - Bouches-du-Rhone
+Source de reference : store Parquet partitionne (data/store), lu par les scripts d'interpolation ;
+meteo_data.json et le cube sont des artefacts derives ; le dashboard charge meteo_summary.json
+puis la serie de chaque commune (web/communes/<num_poste>.json) a la demande
 """
 
 import pandas as pd
+import numpy as np
+import argparse
+import gzip
+import hashlib
 import json
 from datetime import datetime
 import os
+import sys
 
-def load_meteo_data(csv_file):
-    """Charge et nettoie les donnees meteorologiques"""
-    print(f"Chargement du fichier : {csv_file}")
+# Outils communs aux scripts (scripts/stage_profiler.py pour --profile)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scripts'))
+from stage_profiler import StageProfiler, run_profile_path, write_profile
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Variables du dashboard -> colonnes Meteo-France
+VARIABLE_COLUMNS = {
+    'precipitation': 'RR',
+    'temp_min': 'TN',
+    'temp_max': 'TX',
+    'temp_moy': 'TM',
+    'vent_moy': 'FFM',
+    'vent_max': 'FXI',
+}
+
+# Colonnes lues dans les fichiers Meteo-France (les 58 colonnes ne sont pas toutes utiles)
+STATION_COLUMNS = ['NUM_POSTE', 'NOM_USUEL', 'LAT', 'LON', 'ALTI', 'AAAAMMJJ']
+CSV_DTYPES = {
+    'NUM_POSTE': str,
+    'NOM_USUEL': str,
+    'LAT': 'float64',
+    'LON': 'float64',
+    'ALTI': 'float32',
+    'AAAAMMJJ': str,
+    **{column: 'float32' for column in VARIABLE_COLUMNS.values()}
+}
+CATEGORY_COLUMNS = ['NUM_POSTE', 'NOM_USUEL']
+# Colonnes codees a la lecture (load_meteo_data) : categories et dates
+CODE_COLUMNS = CATEGORY_COLUMNS + ['AAAAMMJJ']
+# Agregats precalcules a cote du cube (web/meteo_cube/rollups.npz)
+ROLLUP_LEVELS = ['month', 'season', 'year']
+
+def read_csv_chunks(csv_file, chunksize):
+    """Lit un fichier (csv ou csv.gz) par blocs, colonnes utiles uniquement, types compacts"""
+    reader = pd.read_csv(
+        csv_file,
+        sep=';',
+        usecols=STATION_COLUMNS + list(VARIABLE_COLUMNS.values()),
+        dtype=CSV_DTYPES,
+        chunksize=chunksize
+    )
+    for chunk in reader:
+        for column in CATEGORY_COLUMNS:
+            chunk[column] = chunk[column].astype('category')
+        yield chunk
+
+def chunk_codes(values, lookup):
+    """Codes globaux (ordre de premiere apparition) des valeurs d'une colonne categorielle d'un bloc"""
+    mapping = np.array([lookup.setdefault(value, len(lookup)) for value in values.cat.categories] + [-1],
+                       dtype=np.int32)
+    # Code -1 (valeur manquante) -> dernier element de mapping, -1 lui aussi
+    return mapping[values.cat.codes.to_numpy()]
+
+def drop_superseded(columns, keys):
+    """Ecarte des blocs deja lus les jours-station repris plus loin (la derniere occurrence l'emporte)"""
+    # Derniere ligne de chaque groupe de cles egales apres un tri stable = derniere occurrence
+    flat = np.concatenate(keys)
+    order = np.argsort(flat, kind='stable')
+    flat = flat[order]
+    last = np.ones(len(flat), dtype=bool)
+    last[:-1] = flat[1:] != flat[:-1]
+    keep = np.zeros(len(flat), dtype=bool)
+    keep[order[last]] = True
+    del flat, order, last
     
-    if not os.path.exists(csv_file):
-        print(f"ERREUR: Le fichier {csv_file} n'existe pas!")
-        return None
+    start = 0
+    for index, block in enumerate(keys):
+        mask = keep[start:start + len(block)]
+        start += len(block)
+        if not mask.all():
+            keys[index] = block[mask]
+            for parts in columns.values():
+                parts[index] = parts[index][mask]
+    return int(keep.sum())
+
+def load_meteo_data(csv_files, chunksize=500000):
+    """Charge et nettoie les donnees meteorologiques (un ou plusieurs fichiers, lecture par blocs)"""
+    if isinstance(csv_files, str):
+        csv_files = [csv_files]
+    
+    # Chaque bloc est range colonne par colonne des sa lecture (categories et dates -> codes globaux) avec
+    # une cle entiere par jour-station : ni liste de DataFrames ni copie concatenee de la table complete
+    columns = {}
+    lookups = {column: {} for column in CODE_COLUMNS}
+    keys = []
+    nb_lignes = nb_gardees = nb_en_memoire = 0
+    for csv_file in csv_files:
+        print(f"Chargement du fichier : {csv_file}")
+        if not os.path.exists(csv_file):
+            print(f"ERREUR: Le fichier {csv_file} n'existe pas!")
+            return None
+        for chunk in read_csv_chunks(csv_file, chunksize):
+            date_dtype = chunk['AAAAMMJJ'].dtype
+            chunk['AAAAMMJJ'] = chunk['AAAAMMJJ'].astype('category')
+            for column in chunk.columns:
+                if column in CODE_COLUMNS:
+                    values = chunk_codes(chunk[column], lookups[column])
+                else:
+                    values = chunk[column].to_numpy()
+                columns.setdefault(column, []).append(values)
+            keys.append((columns['NUM_POSTE'][-1].astype(np.int64) << 32) + columns['AAAAMMJJ'][-1])
+            nb_lignes += len(chunk)
+            nb_en_memoire += len(chunk)
+            del chunk
+            # Doublons (fichiers qui se recouvrent) ecartes au fil de la lecture, des que les lignes gardees
+            # ont double depuis le dernier passage : la memoire reste proportionnelle aux jours-station uniques
+            if nb_en_memoire > 2 * nb_gardees:
+                nb_gardees = nb_en_memoire = drop_superseded(columns, keys)
+    if keys:
+        nb_gardees = drop_superseded(columns, keys)
+    del keys
+    
+    # Assemblage colonne par colonne : les blocs d'une colonne sont liberes avant de passer a la suivante
+    df = pd.DataFrame(index=pd.RangeIndex(nb_gardees))
+    for column in list(columns):
+        values = np.concatenate(columns.pop(column))
+        if column in CATEGORY_COLUMNS:
+            values = pd.Categorical.from_codes(values, categories=list(lookups[column]))
+            values = values.remove_unused_categories()
+        elif column in CODE_COLUMNS:
+            values = pd.array(list(lookups[column]), dtype=date_dtype).take(values, allow_fill=True)
+        df[column] = values
+    del columns
     
-    df = pd.read_csv(csv_file, sep=';', dtype={'NUM_POSTE': str, 'AAAAMMJJ': str})
-    print(f"Nombre total de lignes : {len(df)}")
+    print(f"Nombre total de lignes : {len(df)} ({nb_lignes - len(df)} doublons ecartes)")
     print(f"Nombre de communes : {df['NOM_USUEL'].nunique()}")
+    print(f"Memoire utilisee : {df.memory_usage(deep=True).sum() / 1024 ** 2:.1f} Mo")
     return df
 
 def convert_date(date_str):
@@ -31,49 +165,91 @@ def convert_date(date_str):
     except:
         return date_str
 
-def process_commune_data(df):
+def to_float64(column):
+    """Repasse une colonne float32 en float64 via sa representation decimale la plus courte (0.1 reste 0.1)"""
+    # Peu de valeurs distinctes (mesures au dixieme) : la conversion texte est faite une fois par valeur
+    uniques, inverse = np.unique(column.to_numpy(dtype=np.float32), return_inverse=True)
+    decimals = np.array([float(str(value)) for value in uniques], dtype=np.float64)
+    return pd.Series(decimals[inverse], index=column.index, name=column.name)
+
+def daily_frame(df):
+    """Jours-station tries par commune (ordre d'apparition) puis par date, variables du dashboard en float64"""
+    names = [str(nom) for nom in pd.unique(df['NOM_USUEL'])]
+    date_raw = df['AAAAMMJJ'].astype(str)
+    # Peu de dates distinctes : la conversion est faite une fois par date, pas par ligne
+    unique_dates = pd.unique(date_raw)
+    daily = pd.DataFrame({
+        'nom': pd.Categorical(df['NOM_USUEL'].astype(str), categories=names),
+        'num_poste': df['NUM_POSTE'].astype(str),
+        'latitude': df['LAT'].astype('float64'),
+        'longitude': df['LON'].astype('float64'),
+        'altitude': df['ALTI'],
+        'date': date_raw.map(dict(zip(unique_dates, map(convert_date, unique_dates)))),
+        'date_raw': date_raw,
+        **{variable: to_float64(df[column]) for variable, column in VARIABLE_COLUMNS.items()}
+    })
+    return daily.sort_values(['nom', 'date_raw'], kind='stable').reset_index(drop=True)
+
+def donnees_frame(communes_data):
+    """Meme table que daily_frame, reconstruite a partir des donnees par commune (mode incremental)"""
+    names = list(communes_data)
+    counts = [len(data['donnees']) for data in communes_data.values()]
+    daily = pd.DataFrame.from_records(
+        [jour for data in communes_data.values() for jour in data['donnees']],
+        columns=['date', 'date_raw', *VARIABLE_COLUMNS]
+    )
+    daily[list(VARIABLE_COLUMNS)] = daily[list(VARIABLE_COLUMNS)].astype('float64')
+    # Precipitation absente : 0 entier dans les donnees, NaN ici comme dans daily_frame
+    missing = [type(jour['precipitation']) is int for data in communes_data.values() for jour in data['donnees']]
+    daily.loc[np.array(missing, dtype=bool), 'precipitation'] = np.nan
+    daily.insert(0, 'nom', pd.Categorical(np.repeat(names, counts), categories=names))
+    return daily
+
+def group_starts(daily):
+    """Indices de debut de chaque commune dans une table triee par commune"""
+    codes = daily['nom'].cat.codes.to_numpy()
+    return np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]]) if len(codes) else np.array([], dtype=int)
+
+def process_commune_data(daily):
     """Traite les donnees par commune avec coordonnees GPS"""
-    communes_data = {}
+    columns = {'date': daily['date'].tolist(), 'date_raw': daily['date_raw'].tolist()}
+    for variable in VARIABLE_COLUMNS:
+        values = daily[variable]
+        # Valeurs absentes : null, sauf les precipitations comptees a 0
+        missing = 0 if variable == 'precipitation' else None
+        columns[variable] = values.astype(object).where(values.notna(), missing).tolist()
+    keys = list(columns)
+    rows = [dict(zip(keys, values)) for values in zip(*columns.values())]
     
-    for nom_commune in df['NOM_USUEL'].unique():
-        commune_df = df[df['NOM_USUEL'] == nom_commune].copy()
-        commune_df['DATE'] = commune_df['AAAAMMJJ'].apply(convert_date)
-        commune_df = commune_df.sort_values('AAAAMMJJ')
-        
-        lat = float(commune_df['LAT'].iloc[0])
-        lon = float(commune_df['LON'].iloc[0])
-        
-        commune_info = {
+    communes_data = {}
+    starts = group_starts(daily)
+    for start, end in zip(starts, np.r_[starts[1:], len(daily)]):
+        nom_commune = daily['nom'].iat[start]
+        lat = float(daily['latitude'].iat[start])
+        lon = float(daily['longitude'].iat[start])
+        communes_data[nom_commune] = {
             'nom': nom_commune,
-            'num_poste': commune_df['NUM_POSTE'].iloc[0],
+            'num_poste': daily['num_poste'].iat[start],
             'latitude': lat,
             'longitude': lon,
-            'altitude': int(commune_df['ALTI'].iloc[0]),
+            'altitude': int(daily['altitude'].iat[start]),
             'coordinates': [lon, lat],
-            'donnees': []
+            'donnees': rows[start:end]
         }
-        
-        for _, row in commune_df.iterrows():
-            jour_data = {
-                'date': row['DATE'],
-                'date_raw': row['AAAAMMJJ'],
-                'precipitation': float(row['RR']) if pd.notna(row['RR']) else 0,
-                'temp_min': float(row['TN']) if pd.notna(row['TN']) else None,
-                'temp_max': float(row['TX']) if pd.notna(row['TX']) else None,
-                'temp_moy': float(row['TM']) if pd.notna(row['TM']) else None,
-                'vent_moy': float(row['FFM']) if pd.notna(row['FFM']) else None,
-                'vent_max': float(row['FXI']) if pd.notna(row['FXI']) else None,
-            }
-            commune_info['donnees'].append(jour_data)
-        
-        communes_data[nom_commune] = commune_info
     
     return communes_data
 
-def calculate_statistics(communes_data):
+def extreme_index(values, mask, largest):
+    """Premier jour-station atteignant l'extremum parmi `mask` (None si aucun)"""
+    if not mask.any():
+        return None
+    candidates = np.where(mask, values, -np.inf if largest else np.inf)
+    return int(np.argmax(candidates) if largest else np.argmin(candidates))
+
+def calculate_statistics(daily):
     """Calcule des statistiques globales"""
     stats = {
-        'nb_communes': len(communes_data),
+        'nb_communes': len(daily['nom'].cat.categories),
         'date_debut': None,
         'date_fin': None,
         'temp_max_globale': -100,
@@ -84,40 +260,47 @@ def calculate_statistics(communes_data):
         'commune_precip_max': ''
     }
     
-    all_dates = []
+    # Memes regles que le parcours jour par jour : 0 ignore pour les temperatures, premier record conserve
+    extremes = [
+        ('temp_max', 'temp_max_globale', 'commune_temp_max', True),
+        ('temp_min', 'temp_min_globale', 'commune_temp_min', False),
+        ('precipitation', 'precip_max', 'commune_precip_max', True),
+    ]
+    for variable, key, commune_key, largest in extremes:
+        values = daily[variable].to_numpy(dtype=float)
+        beats = values > stats[key] if largest else values < stats[key]
+        mask = beats if variable == 'precipitation' else (values != 0) & beats
+        idx = extreme_index(values, mask, largest)
+        if idx is not None:
+            stats[key] = float(values[idx])
+            stats[commune_key] = daily['nom'].iat[idx]
     
-    for nom_commune, data in communes_data.items():
-        for jour in data['donnees']:
-            all_dates.append(jour['date_raw'])
-            
-            if jour['temp_max'] and jour['temp_max'] > stats['temp_max_globale']:
-                stats['temp_max_globale'] = jour['temp_max']
-                stats['commune_temp_max'] = nom_commune
-            
-            if jour['temp_min'] and jour['temp_min'] < stats['temp_min_globale']:
-                stats['temp_min_globale'] = jour['temp_min']
-                stats['commune_temp_min'] = nom_commune
-            
-            if jour['precipitation'] > stats['precip_max']:
-                stats['precip_max'] = jour['precipitation']
-                stats['commune_precip_max'] = nom_commune
-    
-    if all_dates:
-        all_dates.sort()
-        stats['date_debut'] = convert_date(all_dates[0])
-        stats['date_fin'] = convert_date(all_dates[-1])
+    if len(daily):
+        stats['date_debut'] = convert_date(daily['date_raw'].min())
+        stats['date_fin'] = convert_date(daily['date_raw'].max())
     
     return stats
 
-def create_geojson_features(communes_data):
+def commune_aggregates(daily):
+    """Temperature moyenne, cumul de precipitations et vent max de chaque commune sur toute la periode"""
+    grouped = daily.groupby('nom', observed=False, sort=False)
+    aggregates = pd.DataFrame({
+        'temp_moyenne': grouped['temp_moy'].mean(),
+        'precip_totale': grouped['precipitation'].sum(min_count=1),
+        'vent_max': grouped['vent_max'].max()
+    })
+    # Sans mesure : 0 pour la temperature et le cumul (comme le calcul jour par jour), null pour le vent
+    defaults = {'temp_moyenne': 0, 'precip_totale': 0, 'vent_max': None}
+    return {
+        str(nom): {key: (defaults[key] if pd.isna(value) else float(value)) for key, value in row.items()}
+        for nom, row in aggregates.to_dict('index').items()
+    }
+
+def create_geojson_features(communes_data, aggregates):
     """Cree des features GeoJSON pour les communes"""
     features = []
     
     for nom_commune, data in communes_data.items():
-        temp_values = [j['temp_moy'] for j in data['donnees'] if j['temp_moy'] is not None]
-        temp_moy_commune = sum(temp_values) / len(temp_values) if temp_values else 0
-        precip_total = sum([j['precipitation'] for j in data['donnees']])
-        
         feature = {
             "type": "Feature",
             "geometry": {
@@ -128,8 +311,8 @@ def create_geojson_features(communes_data):
                 "nom": nom_commune,
                 "num_poste": data['num_poste'],
                 "altitude": data['altitude'],
-                "temp_moyenne": round(temp_moy_commune, 1),
-                "precip_totale": round(precip_total, 1),
+                "temp_moyenne": round(aggregates[nom_commune]['temp_moyenne'], 1),
+                "precip_totale": round(aggregates[nom_commune]['precip_totale'], 1),
                 "latitude": data['latitude'],
                 "longitude": data['longitude']
             }
@@ -152,16 +335,315 @@ def calculate_bounds(communes_data):
         'center_lon': sum(lons) / len(lons)
     }
 
+def build_station_cube(df, communes_data, base=None):
+    """Construit le cube stations x jours x variables (float32, NaN si absent), en completant `base` si fourni"""
+    names = list(communes_data.keys())
+    dates = np.array(sorted(df['AAAAMMJJ'].unique()))
+    if base is not None:
+        dates = np.union1d(base['dates'], dates.astype(str))
+    variables = list(VARIABLE_COLUMNS.keys())
+
+    values = np.full((len(names), len(dates), len(variables)), np.nan, dtype=np.float32)
+    if base is not None:
+        base_station_idx = pd.Index(names).get_indexer(base['names'])
+        base_date_idx = np.searchsorted(dates, base['dates'])
+        values[np.ix_(base_station_idx, base_date_idx)] = base['values']
+
+    station_idx = pd.Categorical(df['NOM_USUEL'], categories=names).codes
+    date_idx = np.searchsorted(dates, df['AAAAMMJJ'].to_numpy().astype(str))
+    for var_idx, variable in enumerate(variables):
+        column = pd.to_numeric(df[VARIABLE_COLUMNS[variable]], errors='coerce')
+        values[station_idx, date_idx, var_idx] = column.to_numpy(dtype=np.float32)
+
+    return {
+        'values': values,
+        'names': np.array(names),
+        'lat': np.array([communes_data[n]['latitude'] for n in names], dtype=np.float64),
+        'lon': np.array([communes_data[n]['longitude'] for n in names], dtype=np.float64),
+        'dates': dates.astype(str),
+        'variables': np.array(variables)
+    }
+
+def rollup_labels(dates, level):
+    """Periode de chaque date AAAAMMJJ : mois AAAA-MM, saison AAAA-DJF (decembre compte l'hiver suivant), annee"""
+    dates = pd.Series(dates, dtype=str)
+    if level == 'month':
+        return (dates.str[:4] + '-' + dates.str[4:6]).to_numpy(dtype=str)
+    if level == 'year':
+        return dates.str[:4].to_numpy(dtype=str)
+    month = dates.str[4:6].astype(int)
+    year = dates.str[:4].astype(int) + (month == 12)
+    season = month.map({12: 'DJF', 1: 'DJF', 2: 'DJF', 3: 'MAM', 4: 'MAM', 5: 'MAM',
+                        6: 'JJA', 7: 'JJA', 8: 'JJA', 9: 'SON', 10: 'SON', 11: 'SON'})
+    return (year.astype(str) + '-' + season).to_numpy(dtype=str)
+
+def build_rollups(cube):
+    """Agregats mensuels, saisonniers et annuels par station (cumul pour les precipitations, moyenne sinon)"""
+    values = np.asarray(cube['values'], dtype=np.float64)
+    present = ~np.isnan(values)
+    filled = np.where(present, values, 0.0)
+    cumulative = np.array([variable == 'precipitation' for variable in cube['variables']])
+    rollups = {}
+    for level in ROLLUP_LEVELS:
+        # Dates triees : chaque periode est un bloc contigu de l'axe des jours
+        labels = rollup_labels(cube['dates'], level)
+        starts = np.flatnonzero(np.r_[True, labels[1:] != labels[:-1]]) if len(labels) else np.array([], dtype=int)
+        if not len(starts):
+            sums = np.zeros((values.shape[0], 0, values.shape[2]))
+            counts = np.zeros(sums.shape, dtype=np.int32)
+        else:
+            sums = np.add.reduceat(filled, starts, axis=1)
+            counts = np.add.reduceat(present, starts, axis=1, dtype=np.int32)
+        aggregated = np.where(cumulative, sums, sums / np.maximum(counts, 1))
+        rollups[f'{level}_periods'] = labels[starts]
+        rollups[f'{level}_values'] = np.where(counts > 0, aggregated, np.nan)
+        rollups[f'{level}_counts'] = counts
+    return rollups
+
+def save_station_cube(cube, output_dir):
+    """Sauvegarde le cube (values.npy memory-mappable + axes.npz)"""
+    os.makedirs(output_dir, exist_ok=True)
+    np.save(os.path.join(output_dir, 'values.npy'), cube['values'])
+    np.savez(
+        os.path.join(output_dir, 'axes.npz'),
+        names=cube['names'],
+        lat=cube['lat'],
+        lon=cube['lon'],
+        dates=cube['dates'],
+        variables=cube['variables']
+    )
+    rollups = build_rollups(cube)
+    np.savez(os.path.join(output_dir, 'rollups.npz'), names=cube['names'], dates=cube['dates'], **rollups)
+    print(f"Cube stations x jours x variables cree : {output_dir} {cube['values'].shape}")
+    counts = [f"{len(rollups[level + '_periods'])} {level}" for level in ROLLUP_LEVELS]
+    print(f"Agregats par station : {', '.join(counts)}")
+
+def load_station_cube(cube_dir):
+    """Recharge le cube ecrit par save_station_cube (None s'il est absent)"""
+    values_path = os.path.join(cube_dir, 'values.npy')
+    axes_path = os.path.join(cube_dir, 'axes.npz')
+    if not os.path.exists(values_path) or not os.path.exists(axes_path):
+        return None
+    with np.load(axes_path) as axes:
+        cube = {key: axes[key] for key in axes.files}
+    cube['values'] = np.load(values_path)
+    return cube
+
+def file_checksum(path):
+    """Empreinte SHA-256 du fichier source"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def build_manifest(checksums, df, previous=None):
+    """Manifeste d'ingestion : empreinte des fichiers et derniere date vue par station"""
+    last_dates = dict(previous['derniere_date']) if previous else {}
+    for num_poste, last in df.groupby('NUM_POSTE', observed=True)['AAAAMMJJ'].max().items():
+        last_dates[num_poste] = max(last, last_dates.get(num_poste, ''))
+    return {
+        'sources': {
+            path: {'sha256': checksum, 'taille': os.path.getsize(path)}
+            for path, checksum in checksums.items()
+        },
+        'date_generation': datetime.now().strftime('%d/%m/%Y %H:%M:%S'),
+        'derniere_date': last_dates
+    }
+
+def load_previous_run(output_file, cube_dir, manifest_file):
+    """Recharge le JSON, le cube et le manifeste du run precedent (None si incomplet ou incoherent)"""
+    if not os.path.exists(output_file) or not os.path.exists(manifest_file):
+        return None
+    cube = load_station_cube(cube_dir)
+    if cube is None:
+        return None
+    with open(manifest_file, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    with open(output_file, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    if list(cube['variables']) != list(VARIABLE_COLUMNS) or not set(cube['names']) <= set(data['communes']):
+        return None
+    return {'manifest': manifest, 'data': data, 'cube': cube}
+
+def select_changed_rows(df, cube, manifest):
+    """Repere les jours-station nouveaux (apres la derniere date vue) ou revises (valeurs differentes du cube)"""
+    last = df['NUM_POSTE'].astype(str).map(manifest['derniere_date']).fillna('')
+    new_days = (df['AAAAMMJJ'] > last).to_numpy()
+
+    station_idx = pd.Index(cube['names']).get_indexer(df['NOM_USUEL'])
+    date_idx = np.searchsorted(cube['dates'], df['AAAAMMJJ'].to_numpy().astype(str))
+    date_idx = np.minimum(date_idx, len(cube['dates']) - 1)
+    known = (station_idx >= 0) & (cube['dates'][date_idx] == df['AAAAMMJJ'].to_numpy().astype(str))
+
+    current = np.column_stack([
+        pd.to_numeric(df[column], errors='coerce').to_numpy(dtype=np.float32)
+        for column in VARIABLE_COLUMNS.values()
+    ])
+    previous = cube['values'][np.where(known, station_idx, 0), date_idx]
+    same = ((current == previous) | (np.isnan(current) & np.isnan(previous))).all(axis=1)
+
+    revised = ~new_days & ~(known & same)
+    return new_days, revised
+
+def merge_commune_data(communes_data, updates):
+    """Ajoute ou remplace les jours mis a jour dans les donnees par commune"""
+    for nom_commune, info in updates.items():
+        if nom_commune not in communes_data:
+            communes_data[nom_commune] = info
+            continue
+        days = {jour['date_raw']: jour for jour in communes_data[nom_commune]['donnees']}
+        days.update({jour['date_raw']: jour for jour in info['donnees']})
+        communes_data[nom_commune]['donnees'] = [days[d] for d in sorted(days)]
+    return communes_data
+
+def update_statistics(stats, daily, changed_daily, revised):
+    """Met a jour les statistiques avec les nouveaux jours (recalcul complet si des jours ont ete revises)"""
+    if revised:
+        return calculate_statistics(daily)
+
+    partial = calculate_statistics(changed_daily)
+    stats = dict(stats)
+    stats['nb_communes'] = len(daily['nom'].cat.categories)
+    if partial['temp_max_globale'] > stats['temp_max_globale']:
+        stats['temp_max_globale'] = partial['temp_max_globale']
+        stats['commune_temp_max'] = partial['commune_temp_max']
+    if partial['temp_min_globale'] < stats['temp_min_globale']:
+        stats['temp_min_globale'] = partial['temp_min_globale']
+        stats['commune_temp_min'] = partial['commune_temp_min']
+    if partial['precip_max'] > stats['precip_max']:
+        stats['precip_max'] = partial['precip_max']
+        stats['commune_precip_max'] = partial['commune_precip_max']
+
+    parse = lambda d: datetime.strptime(d, '%d/%m/%Y')
+    if partial['date_debut'] and (not stats['date_debut'] or parse(partial['date_debut']) < parse(stats['date_debut'])):
+        stats['date_debut'] = partial['date_debut']
+    if partial['date_fin'] and (not stats['date_fin'] or parse(partial['date_fin']) > parse(stats['date_fin'])):
+        stats['date_fin'] = partial['date_fin']
+    return stats
+
+def describe_changes(mode, checksums, changed_df, new_count, revised_count):
+    """Resume des periodes a rafraichir pour les couches spatiales"""
+    dates = sorted(changed_df['AAAAMMJJ'].astype(str).unique())
+    return {
+        'mode': mode,
+        'sources': checksums,
+        'dates': dates,
+        'months': sorted({f"{d[:4]}-{d[4:6]}" for d in dates}),
+        'communes': sorted(str(nom) for nom in changed_df['NOM_USUEL'].unique()),
+        'new_days': int(new_count),
+        'revised_days': int(revised_count)
+    }
+
+def build_station_table(df):
+    """Table colonnes du store : une ligne par jour-station, variables du dashboard en float32"""
+    table = df[STATION_COLUMNS].copy()
+    for variable, column in VARIABLE_COLUMNS.items():
+        table[variable] = df[column].astype('float32')
+    table['departement'] = df['NUM_POSTE'].astype(str).str[:2]
+    table['annee'] = df['AAAAMMJJ'].str[:4].astype('int32')
+    return table.sort_values(['NUM_POSTE', 'AAAAMMJJ'])
+
+def save_station_store(df, output_dir, partitions=None):
+    """Ecrit le store Parquet partitionne par departement et annee (seulement `partitions` si fourni)"""
+    if pa is None:
+        print("pyarrow non disponible, store Parquet non cree.")
+        return
+    table = build_station_table(df)
+    if partitions is not None:
+        keys = pd.MultiIndex.from_frame(table[['departement', 'annee']])
+        table = table[keys.isin(partitions)]
+    pq.write_to_dataset(
+        pa.Table.from_pandas(table, preserve_index=False),
+        output_dir,
+        partition_cols=['departement', 'annee'],
+        existing_data_behavior='delete_matching',
+        basename_template='part-{i}.parquet'
+    )
+    print(f"Store Parquet cree : {output_dir} ({len(table)} jours-station)")
+
 def save_json(data, output_file):
     """Sauvegarde les donnees en JSON"""
     with open(output_file, 'w', encoding='utf-8') as f:
         json.dump(data, f, ensure_ascii=False, indent=2)
     print(f"Fichier JSON cree : {output_file}")
 
+def commune_shard_path(data):
+    """Chemin (relatif a web/) de la serie d'une commune"""
+    return f"communes/{data['num_poste']}.json"
+
+def build_commune_shard(data):
+    """Serie d'une commune en colonnes : dates AAAAMMJJ une seule fois, puis un tableau par variable"""
+    shard = {'nom': data['nom'], 'dates': [j['date_raw'] for j in data['donnees']]}
+    for variable in VARIABLE_COLUMNS:
+        shard[variable] = [j[variable] for j in data['donnees']]
+    return shard
+
+def build_summary(output_data, aggregates):
+    """Resume du dashboard : metadonnees, GeoJSON et index des communes sans les series journalieres"""
+    communes = {}
+    for nom_commune, data in output_data['communes'].items():
+        commune_agg = aggregates[nom_commune]
+        communes[nom_commune] = {
+            **{key: value for key, value in data.items() if key != 'donnees'},
+            'serie': commune_shard_path(data),
+            'nb_jours': len(data['donnees']),
+            'temp_moyenne': round(commune_agg['temp_moyenne'], 2),
+            'precip_totale': round(commune_agg['precip_totale'], 1),
+            'vent_max': commune_agg['vent_max'],
+            'dernier_jour': data['donnees'][-1] if data['donnees'] else None
+        }
+    return {'metadata': output_data['metadata'], 'communes': communes, 'geojson': output_data['geojson']}
+
+def save_compact_json(data, output_file):
+    """JSON compact + variantes pre-compressees .gz et .br (si le module brotli est installe)"""
+    payload = json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+    variants = {output_file: payload, output_file + '.gz': gzip.compress(payload, 9, mtime=0)}
+    if brotli is not None:
+        variants[output_file + '.br'] = brotli.compress(payload, quality=11)
+    for path, content in variants.items():
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+    return {os.path.splitext(path)[1]: len(content) for path, content in variants.items()}
+
+def save_dashboard_payload(output_data, aggregates, web_dir, changed=None):
+    """Ecrit le resume et les series par commune (seulement celles modifiees en mode incremental)"""
+    os.makedirs(os.path.join(web_dir, 'communes'), exist_ok=True)
+    summary_file = os.path.join(web_dir, 'meteo_summary.json')
+    sizes = save_compact_json(build_summary(output_data, aggregates), summary_file)
+    print(f"Resume cree : {summary_file} "
+          f"({', '.join(f'{ext} {size / 1024:.0f} Ko' for ext, size in sizes.items())})")
+    
+    written = 0
+    for nom_commune, data in output_data['communes'].items():
+        shard_file = os.path.join(web_dir, commune_shard_path(data))
+        if changed is not None and nom_commune not in changed and os.path.exists(shard_file):
+            continue
+        save_compact_json(build_commune_shard(data), shard_file)
+        written += 1
+    print(f"Series par commune : {written} fichiers dans {os.path.join(web_dir, 'communes')}")
+
 def main():
-    # Chemin direct vers le fichier CSV depuis la racine
-    input_file = 'data/raw/Q_13_latest-2025-2026_RR-T-Vent.csv'
+    parser = argparse.ArgumentParser(description="Traitement des donnees meteorologiques du departement 13")
+    # Chemin direct vers le fichier CSV depuis la racine ; archives (csv.gz) et autres departements en plus
+    parser.add_argument('--input', nargs='+', default=['data/raw/Q_13_latest-2025-2026_RR-T-Vent.csv'],
+                        help="Fichiers Meteo-France (csv ou csv.gz) ; en cas de doublon le dernier l'emporte")
+    parser.add_argument('--chunksize', type=int, default=500000, help="Lignes lues par bloc")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Ne traite que les jours-station nouveaux ou revises depuis la derniere ingestion")
+    parser.add_argument('--profile', action='store_true',
+                        help="Temps (mur / CPU), pic memoire et volumes par etape dans web/profiles/")
+    args = parser.parse_args()
+    profiler = StageProfiler(args.profile)
+
+    input_files = args.input
     output_file = 'web/meteo_data.json'
+    cube_dir = 'web/meteo_cube'
+    store_dir = 'data/store'
+    manifest_file = 'web/ingestion_manifest.json'
+    changes_file = 'web/changed_periods.json'
     
     print("="*70)
     print("TRAITEMENT DES DONNEES METEOROLOGIQUES - DEPARTEMENT 13")
@@ -169,8 +651,9 @@ def main():
     print(f"Repertoire de travail : {os.getcwd()}")
     
     # Verifier que le fichier existe
-    if not os.path.exists(input_file):
-        print(f"\nERREUR: Fichier introuvable : {input_file}")
+    missing = [path for path in input_files if not os.path.exists(path)]
+    if missing:
+        print(f"\nERREUR: Fichier introuvable : {', '.join(missing)}")
         print("\nVerification des fichiers disponibles...")
         if os.path.exists('data/raw'):
             print("Fichiers dans data/raw :")
@@ -178,19 +661,71 @@ def main():
                 print(f"  - {f}")
         return
     
-    df = load_meteo_data(input_file)
-    if df is None:
+    checksums = {path: file_checksum(path) for path in input_files}
+    previous = load_previous_run(output_file, cube_dir, manifest_file) if args.incremental else None
+    if args.incremental and previous is None:
+        print("\nAucune ingestion precedente exploitable : traitement complet.")
+    
+    previous_checksums = {path: source['sha256'] for path, source in previous['manifest'].get('sources', {}).items()} \
+        if previous else None
+    if previous and previous_checksums == checksums:
+        print("\nFichiers sources inchanges depuis la derniere ingestion, rien a faire.")
+        save_json(describe_changes('unchanged', checksums, pd.DataFrame({'AAAAMMJJ': [], 'NOM_USUEL': []}), 0, 0),
+                  changes_file)
         return
     
-    print("\nTraitement des donnees par commune...")
-    communes_data = process_commune_data(df)
-    print(f"Nombre de communes traitees : {len(communes_data)}")
+    with profiler.stage('load_csv', files=len(input_files)) as counts:
+        df = load_meteo_data(input_files, args.chunksize)
+        counts['rows'] = 0 if df is None else len(df)
+    if df is None:
+        return
     
-    print("\nCalcul des statistiques...")
-    stats = calculate_statistics(communes_data)
+    if previous is None:
+        print("\nTraitement des donnees par commune...")
+        with profiler.stage('daily_frame', rows=len(df)):
+            daily = daily_frame(df)
+        with profiler.stage('process_commune_data') as counts:
+            communes_data = process_commune_data(daily)
+            counts['communes'] = len(communes_data)
+        print(f"Nombre de communes traitees : {len(communes_data)}")
+        
+        print("\nCalcul des statistiques...")
+        with profiler.stage('statistics', rows=len(daily)):
+            stats = calculate_statistics(daily)
+        
+        with profiler.stage('station_cube', rows=len(df)):
+            cube = build_station_cube(df, communes_data)
+        changes = describe_changes('full', checksums, df, len(df), 0)
+    else:
+        with profiler.stage('select_changed_rows', rows=len(df)) as counts:
+            new_days, revised = select_changed_rows(df, previous['cube'], previous['manifest'])
+            changed_df = df[new_days | revised]
+            counts.update(new=int(new_days.sum()), revised=int(revised.sum()))
+        print(f"\nJours-station nouveaux : {int(new_days.sum())}, revises : {int(revised.sum())}")
+        
+        print("\nMise a jour des donnees par commune...")
+        with profiler.stage('daily_frame', rows=len(changed_df)):
+            changed_daily = daily_frame(changed_df)
+        with profiler.stage('process_commune_data') as counts:
+            updates = process_commune_data(changed_daily)
+            communes_data = merge_commune_data(previous['data']['communes'], updates)
+            daily = donnees_frame(communes_data)
+            counts.update(communes=len(communes_data), updated=len(updates))
+        
+        print("\nMise a jour des statistiques...")
+        with profiler.stage('statistics', rows=len(daily)):
+            stats = update_statistics(previous['data']['metadata']['statistiques'], daily, changed_daily,
+                                      bool(revised.any()))
+        
+        with profiler.stage('station_cube', rows=len(changed_df)):
+            cube = build_station_cube(changed_df, communes_data, base=previous['cube'])
+        changes = describe_changes('incremental', checksums, changed_df, new_days.sum(), revised.sum())
     
     print("\nCreation des donnees cartographiques...")
-    geojson_features = create_geojson_features(communes_data)
+    with profiler.stage('geojson', communes=len(communes_data)) as counts:
+        aggregates = commune_aggregates(daily)
+        geojson_features = create_geojson_features(communes_data, aggregates)
+        counts['features'] = len(geojson_features)
     
     bounds = calculate_bounds(communes_data)
     print(f"Centre du departement : {bounds['center_lat']:.4f}N, {bounds['center_lon']:.4f}E")
@@ -213,7 +748,29 @@ def main():
     # Creer le dossier web s'il n'existe pas
     os.makedirs('web', exist_ok=True)
     
-    save_json(output_data, output_file)
+    with profiler.stage('save_json'):
+        save_json(output_data, output_file)
+    with profiler.stage('dashboard_payload', communes=len(communes_data)):
+        save_dashboard_payload(output_data, aggregates, 'web', None if previous is None else set(updates))
+    with profiler.stage('save_station_cube'):
+        save_station_cube(cube, cube_dir)
+    with profiler.stage('station_store') as counts:
+        if previous is None:
+            save_station_store(df, store_dir)
+            counts['rows'] = len(df)
+        elif len(changed_df):
+            # Seules les partitions (departement, annee) touchees sont reecrites
+            touched = build_station_table(changed_df)[['departement', 'annee']].drop_duplicates()
+            save_station_store(df, store_dir, pd.MultiIndex.from_frame(touched))
+            counts['partitions'] = len(touched)
+    with profiler.stage('manifest'):
+        save_json(build_manifest(checksums, df, previous['manifest'] if previous else None), manifest_file)
+        save_json(changes, changes_file)
+    if profiler.enabled:
+        report = profiler.report(script='build_dashboard_csv', mode='full' if previous is None else 'incremental',
+                                 inputs=input_files, rows=len(df), communes=len(communes_data))
+        print(f"Profil d'execution      : {write_profile(run_profile_path('web', 'build_dashboard_csv'), report)}")
+    print(f"Periodes a rafraichir   : {len(changes['dates'])} jours, {len(changes['months'])} mois")
     
     print("\n" + "="*70)
     print("RESUME DES DONNEES")
@@ -235,7 +792,7 @@ def main():
     print(f"\nFichier JSON genere : {output_file}")
     print("\nETAPE SUIVANTE:")
     print("1. Ouvrez web/index.html dans votre navigateur")
-    print("2. Le fichier meteo_data.json a ete cree dans le dossier web/")
+    print("2. Le resume meteo_summary.json et les series communes/ ont ete crees dans le dossier web/")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Process pool helper for the batch mode of the interpolation scripts.
+Each worker is initialised once with the shared state (grid, mask, settings) and then receives
+only the per-layer station values.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+
+def default_workers():
+    return max(1, (os.cpu_count() or 1) - 1)
+
+
+def run_jobs(jobs, worker, initializer, initargs, workers=1):
+    results = [None] * len(jobs)
+    failures = []
+    if workers <= 1 or len(jobs) <= 1:
+        initializer(*initargs)
+        for idx, job in enumerate(jobs):
+            try:
+                results[idx] = worker(job)
+            except Exception as exc:
+                failures.append((job, exc))
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=initializer, initargs=initargs) as pool:
+            futures = {pool.submit(worker, job): idx for idx, job in enumerate(jobs)}
+            for future in as_completed(futures):
+                idx = futures[future]
+                try:
+                    results[idx] = future.result()
+                except Exception as exc:
+                    failures.append((jobs[idx], exc))
+
+    for job, exc in failures:
+        print(f"Failed: {job.get('variable')} {job.get('period')}: {exc}")
+    return [r for r in results if r is not None], failures
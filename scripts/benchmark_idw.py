@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark exact (all-pairs) IDW against the KD-tree neighbour-limited mode.
+Uses the real department grid and a synthetic random station network (--stations counts).
+"""
+
+import argparse
+import json
+import time
+
+import numpy as np
+
+from generate_spatial_layers import build_grid, load_department_mask
+from idw_engine import apply_weights, build_neighbor_weights, build_weights
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Exact vs neighbour-limited IDW benchmark.")
+    parser.add_argument("--departement", default="data/raw/departement_13.geojson", help="Department GeoJSON (EPSG:2154)")
+    parser.add_argument("--grids", type=float, nargs="+", default=[2000, 1000, 500], help="Grid resolutions (m)")
+    parser.add_argument("--stations", type=int, nargs="+", default=[21, 200, 2000], help="Synthetic station counts")
+    parser.add_argument("--neighbors", type=int, default=8, help="k for the neighbour-limited mode")
+    parser.add_argument("--power", type=float, default=2.0, help="IDW power")
+    parser.add_argument("--max-dense", type=float, default=2e8, help="Skip exact mode above cells x stations")
+    parser.add_argument("--seed", type=int, default=13)
+    parser.add_argument("--output", help="Optional JSON results file")
+    return parser.parse_args()
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    args = parse_args()
+    rng = np.random.default_rng(args.seed)
+    _, bounds = load_department_mask(args.departement)
+    minx, miny, maxx, maxy = bounds
+
+    results = []
+    for resolution in args.grids:
+        grid_x, grid_y = build_grid(bounds, resolution)
+        for n_stations in args.stations:
+            station_xy = np.column_stack([rng.uniform(minx, maxx, n_stations), rng.uniform(miny, maxy, n_stations)])
+            values = rng.normal(15, 5, n_stations)
+            row = {"grid": resolution, "cells": int(grid_x.size), "stations": n_stations, "neighbors": args.neighbors}
+
+            local, row["knn_build_s"] = timed(build_neighbor_weights, station_xy, grid_x, grid_y,
+                                              args.power, args.neighbors)
+            local_vals, row["knn_apply_s"] = timed(apply_weights, local, values)
+
+            if grid_x.size * n_stations <= args.max_dense:
+                dense, row["exact_build_s"] = timed(build_weights, station_xy, grid_x, grid_y, args.power)
+                dense_vals, row["exact_apply_s"] = timed(apply_weights, dense, values)
+                row["max_abs_diff"] = float(np.nanmax(np.abs(dense_vals - local_vals)))
+            results.append(row)
+            print(json.dumps(row))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump({"benchmark": "idw", "results": results}, file, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark suite for the ingestion and interpolation pipeline on synthetic data.
+Ingestion: synthetic Meteo-France CSVs (stations x years) through the build_dashboard_csv.py stages.
+Interpolation: grid resolutions over the real department polygon x station counts, through the mask,
+IDW, kriging and exporter stages (GeoTIFF: plain, COG, COG float16). Every stage records wall time and peak
+resident memory (the Linux high-water mark is reset before each stage; elsewhere it is the process-wide peak).
+The results file (JSON) carries the commit and environment, and --baseline prints the ratios against an earlier run.
+
+Example: python scripts/benchmark_pipeline.py --stations 21 200 --years 1 10 --grids 2000 1000 \
+             --output outputs/benchmarks/pipeline.json --baseline outputs/benchmarks/previous.json
+"""
+
+import argparse
+import contextlib
+import gc
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from grid_mask import compute_mask
+from interpolate_surface import (build_grid, export_geojson, export_geotiff, idw_interpolate, kriging_interpolate,
+                                 load_department_mask, raster_transform)
+from kriging_engine import build_distances, fit_linear_variogram, krige_layers
+from png_layer import TILE_INDEX, export_png_layer, export_xyz_tiles
+from raster_layer import export_raster_layer
+from stage_profiler import memory_status, peak_rss_mb, reset_peak_rss
+from synthetic_data import synthetic_stations, write_meteo_csv
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import build_dashboard_csv as dashboard  # noqa: E402
+
+try:
+    from pyproj import Transformer
+except ImportError as exc:
+    raise SystemExit("Missing dependency: pyproj. Please install it in your env.") from exc
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Ingestion + interpolation benchmark on synthetic data.")
+    parser.add_argument("--departement", default="data/raw/departement_13.geojson", help="Department GeoJSON (EPSG:2154)")
+    parser.add_argument("--suites", nargs="+", default=["ingest", "interpolation"], choices=["ingest", "interpolation"])
+    parser.add_argument("--stations", type=int, nargs="+", default=[21, 200, 2000], help="Synthetic station counts")
+    parser.add_argument("--years", type=int, nargs="+", default=[1, 10, 70], help="Synthetic series lengths (ingest)")
+    parser.add_argument("--grids", type=float, nargs="+", default=[2000, 1000, 500], help="Grid resolutions (m)")
+    parser.add_argument("--max-rows", type=float, default=5e6, help="Skip ingest cases above stations x days")
+    parser.add_argument("--max-kriging", type=float, default=5e7,
+                        help="Skip kriging above cells x stations (pykrige: also above 500 stations)")
+    parser.add_argument("--chunksize", type=int, default=500000, help="CSV rows per chunk (ingest)")
+    parser.add_argument("--tile-zooms", type=int, nargs=2, default=[8, 11], help="XYZ tile pyramid zoom range")
+    parser.add_argument("--workdir", default="outputs/benchmarks/work", help="Synthetic CSVs and stage outputs")
+    parser.add_argument("--tracemalloc", action="store_true",
+                        help="Also record peak traced Python allocations (slows Python-heavy stages several times)")
+    parser.add_argument("--seed", type=int, default=13)
+    parser.add_argument("--output", help="JSON results file")
+    parser.add_argument("--baseline", help="Earlier results file to compare against")
+    return parser.parse_args()
+
+
+class StageTimer:
+    def __init__(self, trace_memory):
+        self.trace_memory = trace_memory
+        self.peak_scope = "stage" if reset_peak_rss() else "process"
+        self.results = []
+
+    def run(self, case, stage, func, *args, **kwargs):
+        gc.collect()
+        rss_start = memory_status().get("VmRSS")
+        reset_peak_rss()
+        if self.trace_memory:
+            tracemalloc.start()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            result = func(*args, **kwargs)
+        wall = time.perf_counter() - start
+        row = {**case, "stage": stage, "wall_s": round(wall, 4), "rss_start_mb": rss_start,
+               "peak_rss_mb": peak_rss_mb()}
+        if self.trace_memory:
+            row["peak_traced_mb"] = round(tracemalloc.get_traced_memory()[1] / 1e6, 2)
+            tracemalloc.stop()
+        self.results.append(row)
+        print(json.dumps(row))
+        return result
+
+
+def git_revision():
+    root = Path(__file__).resolve().parent.parent
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=root, capture_output=True, text=True,
+                                check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=root,
+                                    capture_output=True, text=True, check=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, dirty
+
+
+def case_rng(args, *case):
+    # Same stations / values for a given case whatever else is in the sweep (and across commits).
+    return np.random.default_rng([args.seed, *case])
+
+
+def run_ingest(timer, geom, args):
+    workdir = Path(args.workdir)
+    for n_stations in args.stations:
+        stations = synthetic_stations(geom, n_stations, case_rng(args, n_stations))
+        for years in args.years:
+            days = len(pd.date_range(f"{2024 - years + 1}-01-01", "2024-12-31", freq="D"))
+            case = {"suite": "ingest", "stations": n_stations, "years": years, "rows": n_stations * days}
+            if case["rows"] > args.max_rows:
+                print(f"Skipped ingest {n_stations} stations x {years} years ({case['rows']} rows > --max-rows)")
+                continue
+
+            csv_path = workdir / f"synthetic_{n_stations}x{years}_{args.seed}.csv.gz"
+            if not csv_path.exists():
+                timer.run(case, "generate_csv", write_meteo_csv, csv_path, stations, 2024, years,
+                          case_rng(args, n_stations, years))
+            out_dir = workdir / f"ingest_{n_stations}x{years}"
+            out_dir.mkdir(parents=True, exist_ok=True)
+
+            df = timer.run(case, "load_csv", dashboard.load_meteo_data, [str(csv_path)], args.chunksize)
+            daily = timer.run(case, "daily_frame", dashboard.daily_frame, df)
+            communes_data = timer.run(case, "process_commune_data", dashboard.process_commune_data, daily)
+            stats = timer.run(case, "statistics", dashboard.calculate_statistics, daily)
+            aggregates = timer.run(case, "commune_aggregates", dashboard.commune_aggregates, daily)
+            features = timer.run(case, "geojson_features", dashboard.create_geojson_features, communes_data, aggregates)
+            cube = timer.run(case, "station_cube", dashboard.build_station_cube, df, communes_data)
+            timer.run(case, "save_station_cube", dashboard.save_station_cube, cube, str(out_dir / "meteo_cube"))
+
+            output_data = {
+                "metadata": {"statistiques": stats, "bounds": dashboard.calculate_bounds(communes_data)},
+                "communes": communes_data,
+                "geojson": {"type": "FeatureCollection", "features": features}
+            }
+            timer.run(case, "save_json", dashboard.save_json, output_data, str(out_dir / "meteo_data.json"))
+            timer.run(case, "dashboard_payload", dashboard.save_dashboard_payload, output_data, aggregates,
+                      str(out_dir))
+            if dashboard.pa is not None:
+                timer.run(case, "station_store", dashboard.save_station_store, df, str(out_dir / "store"))
+            del df, daily, communes_data, cube, output_data
+
+
+def run_interpolation(timer, geom, bounds, args):
+    workdir = Path(args.workdir) / "interpolation"
+    workdir.mkdir(parents=True, exist_ok=True)
+    transformer = Transformer.from_crs("EPSG:2154", "EPSG:4326", always_xy=True)
+    for resolution in args.grids:
+        grid_x, grid_y = build_grid(bounds, resolution)
+        xs, ys = grid_x[0, :], grid_y[:, 0]
+        for n_stations in args.stations:
+            rng = case_rng(args, n_stations)
+            stations = synthetic_stations(geom, n_stations, rng)
+            station_xy = stations[["x", "y"]].to_numpy()
+            values = rng.normal(15, 5, n_stations)
+            case = {"suite": "interpolation", "stations": n_stations, "grid": resolution, "cells": int(grid_x.size)}
+
+            mask = timer.run(case, "mask", compute_mask, geom, grid_x, grid_y)
+            case["masked_cells"] = int(mask.sum())
+            idw = timer.run(case, "idw", idw_interpolate, station_xy, values, (grid_x[mask], grid_y[mask]))
+            grid_vals = np.full(grid_x.shape, np.nan)
+            grid_vals[mask] = idw
+
+            if grid_x.size * n_stations <= args.max_kriging:
+                variogram = fit_linear_variogram(station_xy, values)
+                distances = timer.run(case, "kriging_distances", build_distances, station_xy, grid_x[mask], grid_y[mask])
+                timer.run(case, "kriging_native", krige_layers, station_xy, distances, values, [variogram])
+                if n_stations <= 500:
+                    try:
+                        timer.run(case, "kriging_pykrige", kriging_interpolate, station_xy, values, (grid_x, grid_y))
+                    except SystemExit as exc:
+                        print(f"Skipped kriging_pykrige: {exc}")
+
+            stem = workdir / f"bench_{int(resolution)}_{n_stations}"
+            timer.run(case, "export_raster", export_raster_layer, f"{stem}.json", grid_vals, xs, ys, resolution)
+            transform = raster_transform(xs, ys, resolution)
+            # export_geotiff keeps the former (plain) layout, so it compares with earlier results files.
+            for stage, profile, encoding in (("export_geotiff", "plain", "float32"),
+                                             ("export_geotiff_cog", "cog", "float32"),
+                                             ("export_geotiff_cog_f16", "cog", "float16")):
+                timer.run(case, stage, export_geotiff, f"{stem}_{profile}_{encoding}.tif", grid_vals, transform,
+                          "EPSG:2154", profile, encoding=encoding)
+            timer.run(case, "export_png", export_png_layer, f"{stem}.png", grid_vals, xs, ys, resolution, "temp_moy")
+            # Cold tile index (first layer on this grid) then warm (every following layer).
+            TILE_INDEX.clear()
+            for stage in ("export_tiles_cold", "export_tiles"):
+                timer.run(case, stage, export_xyz_tiles, workdir / f"tiles_{int(resolution)}_{n_stations}", grid_vals,
+                          xs, ys, resolution, "temp_moy", args.tile_zooms)
+            timer.run(case, "export_geojson", export_geojson, f"{stem}.geojson", grid_x, grid_y, grid_vals, transformer)
+
+
+def case_key(row):
+    return tuple(str(row.get(field)) for field in ("suite", "stage", "stations", "years", "grid"))
+
+
+def compare(results, baseline_path):
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    previous = {case_key(row): row for row in baseline["results"]}
+    print(f"\nAgainst {baseline_path} (commit {baseline.get('commit')}):")
+    for row in results:
+        old = previous.get(case_key(row))
+        if old is None or not old.get("wall_s"):
+            continue
+        ratio = row["wall_s"] / old["wall_s"]
+        size = f"{row['stations']} st x " + (f"{row['years']} y" if row["suite"] == "ingest" else f"{row['grid']:g} m")
+        print(f"  {row['suite']:13s} {row['stage']:22s} {size:20s} {old['wall_s']:9.3f}s -> {row['wall_s']:9.3f}s "
+              f"(x{ratio:.2f})")
+
+
+def main():
+    args = parse_args()
+    geom, bounds = load_department_mask(args.departement)
+    timer = StageTimer(args.tracemalloc)
+
+    if "ingest" in args.suites:
+        run_ingest(timer, geom, args)
+    if "interpolation" in args.suites:
+        run_interpolation(timer, geom, bounds, args)
+
+    commit, dirty = git_revision()
+    report = {
+        "benchmark": "pipeline",
+        "commit": commit,
+        "dirty": dirty,
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "peak_rss_scope": timer.peak_scope,
+        "settings": vars(args),
+        "results": timer.results
+    }
+    if args.output:
+        Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(report, file, ensure_ascii=False, indent=2)
+        print(f"Results: {args.output}")
+    if args.baseline:
+        compare(timer.results, args.baseline)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Leave-one-out cross-validation of the interpolation settings at the station locations (no grid is built).
+Every station is predicted from the other stations, for every period of every variable at once:
+- IDW: the (stations x stations) weight matrix with a zero diagonal is applied to the (stations x periods)
+  value matrix; missing values are renormalised as in idw_engine.py, and --neighbors / --radius keep the
+  k nearest other stations with a value / the in-radius ones, like the grid operator.
+- Kriging (native, linear variogram): one inverse of the kriging matrix per (variogram, stations with data)
+  gives all the leave-one-out residuals, z_i - z_-i = [A^-1 z]_i / [A^-1]_ii (Dubrule, 1983). The variogram
+  is fitted on all the stations of the layer (or of the variable and month with "month"), like a grid run.
+Candidates (--powers for IDW, --variograms for kriging) run in parallel, one job per variable x candidate.
+The CSV holds n / RMSE / MAE / bias per variable, month and candidate, plus a month "all" row per candidate.
+
+Example: python scripts/cross_validation.py --cube web/meteo_cube --powers 1 2 3 --variograms layer month \
+             --output outputs/validation/loo.csv
+"""
+
+import argparse
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+try:
+    from pyproj import Transformer
+except ImportError as exc:
+    raise SystemExit("Missing dependency: pyproj. Please install it in your env.") from exc
+
+from batch_runner import default_workers, run_jobs
+from idw_engine import apply_weights
+from interpolate_surface import VARIABLES, available_dates, list_periods, load_meteo_json, select_station_values
+from kriging_engine import fit_linear_variogram, linear_variogram, pair_distances
+from station_cube import load_cube, period_values, station_axis
+from station_store import load_store
+
+
+WORKER_CONTEXT = {}
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Leave-one-out validation of IDW powers and kriging variograms.")
+    parser.add_argument("--input", default="web/meteo_data.json", help="Path meteo_data.json")
+    parser.add_argument("--cube", help="Station cube folder from build_dashboard_csv.py (replaces --input)")
+    parser.add_argument("--store", help="Parquet station store from build_dashboard_csv.py (e.g. data/store)")
+    parser.add_argument("--from", dest="date_from", help="First day AAAAMMJJ")
+    parser.add_argument("--to", dest="date_to", help="Last day AAAAMMJJ")
+    parser.add_argument("--variables", nargs="+", default=VARIABLES, choices=VARIABLES)
+    parser.add_argument("--period-type", default="date", choices=["date", "month"],
+                        help="Validate the daily layers or the monthly aggregates")
+    parser.add_argument("--methods", nargs="+", default=["idw", "kriging"], choices=["idw", "kriging"])
+    parser.add_argument("--powers", type=float, nargs="+", default=[1.0, 2.0, 3.0], help="IDW powers to compare")
+    parser.add_argument("--neighbors", type=int, help="IDW: only use the k nearest stations")
+    parser.add_argument("--radius", type=float, help="IDW: only use stations within this distance in meters")
+    parser.add_argument("--variograms", nargs="+", default=["layer", "month"], choices=["layer", "month"],
+                        help="Kriging: linear variogram fitted per layer and / or per variable and month")
+    parser.add_argument("--workers", type=int, default=default_workers(), help="Worker processes")
+    parser.add_argument("--output", default="outputs/validation/loo.csv", help="CSV of the error tables")
+    return parser.parse_args()
+
+
+def load_source(args):
+    if args.store:
+        source = load_store(args.store, args.variables, args.date_from, args.date_to)
+        return source, source["dates"]
+    if args.cube:
+        source = load_cube(args.cube)
+        return source, source["dates"]
+    source = load_meteo_json(args.input)
+    return source, available_dates(source)
+
+
+def station_matrix(source, names, variable, period_type, periods):
+    # (stations x periods) values, NaN where a station has no data.
+    if "values" in source:
+        if period_type == "date":
+            cols = [source["date_index"][period] for period in periods]
+            return np.asarray(source["values"][:, cols, source["variable_index"][variable]], dtype=float)
+        return np.column_stack([period_values(source, variable, "month", period) for period in periods])
+    station_index = {name: idx for idx, name in enumerate(names)}
+    matrix = np.full((len(names), len(periods)), np.nan)
+    for col, period in enumerate(periods):
+        for p in select_station_values(source, variable, period_type, period):
+            matrix[station_index[p["name"]], col] = p["value"]
+    return matrix
+
+
+def idw_loo_weights(station_xy, power, neighbors=None, radius=None):
+    # IDW operator over the other stations (the station itself gets no weight): dense (stations x stations),
+    # or with --neighbors the (index, weights, k) form of idw_engine, every other station as a candidate.
+    dist = pair_distances(station_xy)
+    np.fill_diagonal(dist, np.inf)
+    weights = 1 / (np.where(dist == 0, 1e-6, dist) ** power)
+    if radius:
+        weights = np.where(dist <= radius, weights, 0.0)
+    if not neighbors:
+        return weights
+    # Candidates sorted by distance; self and out-of-radius stations point to the padding slot (no value),
+    # so apply_weights() takes the k nearest stations with a value for each period.
+    order = np.argsort(dist, axis=1)[:, :-1]
+    index = np.where(np.take_along_axis(weights, order, axis=1) > 0, order, len(station_xy))
+    return index.astype(np.int32), np.take_along_axis(weights, order, axis=1), neighbors
+
+
+def month_variograms(station_xy, values, periods, mode):
+    # One (slope, nugget) per period: fitted per layer, or pooled over the layers of each month.
+    if mode == "layer":
+        return [fit_linear_variogram(station_xy, values[:, col]) for col in range(values.shape[1])]
+    months = np.array([period[:7] if "-" in period else f"{period[:4]}-{period[4:6]}" for period in periods])
+    fitted = {month: fit_linear_variogram(station_xy, values[:, months == month]) for month in np.unique(months)}
+    return [fitted[month] for month in months]
+
+
+def kriging_loo(station_xy, values, variograms):
+    # Leave-one-out estimates (stations x periods) of ordinary kriging with a linear variogram.
+    estimates = np.full(values.shape, np.nan)
+    groups = {}
+    for col, variogram in enumerate(variograms):
+        present = ~np.isnan(values[:, col])
+        if present.sum() > 1:
+            key = (float(variogram[0]), float(variogram[1]), present.tobytes())
+            groups.setdefault(key, (present, []))[1].append(col)
+
+    dist = pair_distances(station_xy)
+    for (slope, nugget, _), (present, cols) in groups.items():
+        if not (slope or nugget):
+            # Constant field: same weights as any valid variogram (kriging_operator does the same).
+            slope = 1.0
+        idx = np.flatnonzero(present)
+        n = idx.size
+        system = np.zeros((n + 1, n + 1))
+        system[:n, :n] = linear_variogram(dist[np.ix_(idx, idx)], slope, nugget)
+        system[:n, n] = 1.0
+        system[n, :n] = 1.0
+        try:
+            inverse = np.linalg.inv(system)
+        except np.linalg.LinAlgError:
+            continue
+        block = values[np.ix_(idx, cols)]
+        residuals = (inverse[:n, :n] @ block) / np.diag(inverse)[:n, None]
+        estimates[np.ix_(idx, cols)] = block - residuals
+    return estimates
+
+
+def error_rows(values, estimates, periods, base):
+    # n / RMSE / MAE / bias (estimate - observed) per month, then over all the periods.
+    months = np.array([period[:7] if "-" in period else f"{period[:4]}-{period[4:6]}" for period in periods])
+    errors = estimates - values
+    rows = []
+    for month in [*np.unique(months), "all"]:
+        block = errors if month == "all" else errors[:, months == month]
+        block = block[~np.isnan(block)]
+        if block.size == 0:
+            continue
+        rows.append({**base, "month": str(month), "n": int(block.size), "rmse": float(np.sqrt(np.mean(block ** 2))),
+                     "mae": float(np.mean(np.abs(block))), "bias": float(np.mean(block))})
+    return rows
+
+
+def init_worker(settings, station_xy, matrices, periods):
+    WORKER_CONTEXT.update(settings)
+    WORKER_CONTEXT["station_xy"] = station_xy
+    WORKER_CONTEXT["matrices"] = matrices
+    WORKER_CONTEXT["periods"] = periods
+
+
+def run_candidate(job):
+    ctx = WORKER_CONTEXT
+    values = ctx["matrices"][job["variable"]]
+    if job["method"] == "idw":
+        weights = idw_loo_weights(ctx["station_xy"], job["parameter"], ctx["neighbors"], ctx["radius"])
+        estimates = apply_weights(weights, values)
+        parameter = f"power={job['parameter']:g}"
+    else:
+        variograms = month_variograms(ctx["station_xy"], values, ctx["periods"], job["parameter"])
+        estimates = kriging_loo(ctx["station_xy"], values, variograms)
+        parameter = f"variogram={job['parameter']}"
+    return error_rows(values, estimates, ctx["periods"],
+                      {"variable": job["variable"], "method": job["method"], "parameter": parameter})
+
+
+def main():
+    args = parse_args()
+    source, dates = load_source(args)
+    dates = [d for d in sorted(str(d) for d in dates)
+             if (not args.date_from or d >= args.date_from) and (not args.date_to or d <= args.date_to)]
+    periods = [period for _, period in list_periods(dates, args.period_type)]
+    if not periods:
+        raise SystemExit("No periods to validate.")
+
+    transformer = Transformer.from_crs("EPSG:4326", "EPSG:2154", always_xy=True)
+    names, station_xy = station_axis(source, transformer)
+    matrices = {variable: station_matrix(source, names, variable, args.period_type, periods)
+                for variable in args.variables}
+    print(f"Stations: {len(names)}, periods: {len(periods)} ({args.period_type}), variables: {len(matrices)}")
+
+    jobs = []
+    for variable in args.variables:
+        if "idw" in args.methods:
+            jobs.extend({"variable": variable, "method": "idw", "parameter": power} for power in args.powers)
+        if "kriging" in args.methods:
+            jobs.extend({"variable": variable, "method": "kriging", "parameter": mode} for mode in args.variograms)
+    settings = {"neighbors": args.neighbors, "radius": args.radius}
+    results, failures = run_jobs(jobs, run_candidate, init_worker, (settings, station_xy, matrices, periods),
+                                 args.workers)
+
+    table = pd.DataFrame([row for rows in results for row in rows])
+    if table.empty:
+        raise SystemExit("No leave-one-out errors (too few stations with data).")
+    output = Path(args.output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    table.to_csv(output, index=False, float_format="%.4f")
+
+    overall = table[table["month"] == "all"].sort_values(["variable", "rmse"])
+    for variable, group in overall.groupby("variable", sort=False):
+        print(f"\n{variable}")
+        for rank, row in enumerate(group.itertuples()):
+            print(f"  {'*' if rank == 0 else ' '} {row.method:8s} {row.parameter:18s} n={row.n:<8d} "
+                  f"rmse={row.rmse:.3f} mae={row.mae:.3f} bias={row.bias:+.3f}")
+    print(f"\nTables: {output} ({len(table)} rows, * = lowest RMSE)")
+    if failures:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Producer / consumer export stage of interpolate_surface.py.
+The interpolation loop submits every finished grid with its outputs (stats JSON, GeoTIFFs, raster, GeoJSON, PNG,
+XYZ tiles, zonal stats); a pool of writer threads runs the outputs of this layer and of the previous ones
+concurrently while the next grid is computed (numpy, zlib and GDAL release the GIL for most of the work).
+At most `depth` grids are queued or being written: submit() blocks beyond that (backpressure), so memory stays
+bounded whatever the batch size. Each output reports its own error; a layer with a failed output is returned as
+a failure, not as a record. writers=0 runs the outputs inline, one after the other (the former behaviour).
+"""
+
+import queue
+import threading
+import time
+
+from stage_profiler import StageProfiler
+
+
+class ExportError(Exception):
+    pass
+
+
+class ExportPipeline:
+    def __init__(self, writers=2, depth=2):
+        self.writers = writers
+        self.tasks = queue.Queue()
+        self.slots = threading.BoundedSemaphore(max(depth, 1))
+        self.lock = threading.Lock()
+        self.threads = []
+        self.submitted = 0
+        self.done = []
+        self.failures = []
+
+    def __enter__(self):
+        self.threads = [threading.Thread(target=self.work, daemon=True) for _ in range(self.writers)]
+        for thread in self.threads:
+            thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        # Waits for the queued outputs (also when the producer failed, so no file is left half written).
+        for _ in self.threads:
+            self.tasks.put(None)
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+
+    @property
+    def records(self):
+        # Finished records in submission order.
+        return [record for _, record in sorted(self.done, key=lambda item: item[0])]
+
+    def submit(self, job, record, outputs, finish, profiler):
+        # outputs: (stage, counts, write); write(counts) returns the record fields it fills in, or None.
+        # finish(record, profiler) runs once every output succeeded and returns the final record.
+        layer = {"index": self.submitted, "job": job, "record": record, "finish": finish, "profiler": profiler,
+                 "errors": [], "pending": len(outputs)}
+        self.submitted += 1
+        # Backpressure: time spent waiting for a free slot (the writers' CPU time is theirs, not this thread's).
+        waiting = StageProfiler(profiler.enabled, cpu_clock=time.thread_time)
+        with waiting.stage("export_queue", outputs=len(outputs)):
+            self.slots.acquire()
+        profiler.stages.extend(waiting.stages)
+        for output in outputs:
+            if self.threads:
+                self.tasks.put((layer, output))
+            else:
+                self.run_output(layer, output)
+
+    def work(self):
+        while True:
+            item = self.tasks.get()
+            if item is None:
+                return
+            self.run_output(*item)
+
+    def run_output(self, layer, output):
+        name, counts, write = output
+        # CPU time of this writer thread only: the other threads keep computing / writing meanwhile. No peak RSS:
+        # resetting the process-wide high-water mark here would corrupt the stages of the other threads.
+        profiler = StageProfiler(layer["profiler"].enabled, cpu_clock=time.thread_time, peak_rss=False)
+        fields, error = None, None
+        try:
+            with profiler.stage(name, **counts) as stage_counts:
+                fields = write(stage_counts)
+        except Exception as exc:
+            error = f"{name}: {exc}"
+        with self.lock:
+            layer["profiler"].stages.extend(profiler.stages)
+            if error:
+                layer["errors"].append(error)
+            elif isinstance(fields, dict):
+                layer["record"].update(fields)
+            layer["pending"] -= 1
+            last = layer["pending"] == 0
+        if last:
+            self.complete(layer)
+
+    def fail(self, job, exc):
+        # Per-layer failure (computation or outputs), reported like batch_runner.run_jobs() does.
+        print(f"Failed: {job.get('variable')} {job.get('period')}: {exc}")
+        failure = ({key: job.get(key) for key in ("variable", "period_type", "period")}, ExportError(str(exc)))
+        with self.lock:
+            self.failures.append(failure)
+
+    def complete(self, layer):
+        try:
+            if layer["errors"]:
+                raise ExportError("; ".join(layer["errors"]))
+            record = layer["finish"](layer["record"], layer["profiler"])
+        except Exception as exc:
+            self.fail(layer["job"], exc)
+        else:
+            with self.lock:
+                self.done.append((layer["index"], record))
+        finally:
+            self.slots.release()
@@ -2,18 +2,21 @@
 # -*- coding: utf-8 -*-
 """
 Generate spatial interpolation layers for the dashboard (IDW grid clipped to the department).
-Outputs GeoJSON files in outputs/spatial and updates an index.json for the client.
+Writes each layer to outputs/spatial as a compact raster by default (<stem>.raster.json header + binary payload,
+see raster_layer.py); --format geojson writes GeoJSON points instead and --format both writes the two. --tiles adds
+an XYZ PNG pyramid, --series writes one chunked time-series cube per variable instead of per-layer files.
+Updates an index.json for the client.
 """
 
 import argparse
 import json
+from functools import partial
 from pathlib import Path
 
 import numpy as np
 
 try:
-    from shapely.geometry import shape, Point
-    from shapely.prepared import prep
+    from shapely.geometry import shape
 except ImportError as exc:
     raise SystemExit("Missing dependency: shapely") from exc
 
@@ -22,6 +25,18 @@ try:
 except ImportError as exc:
     raise SystemExit("Missing dependency: pyproj") from exc
 
+from batch_runner import default_workers, run_jobs
+from grid_mask import load_or_compute_mask
+from idw_engine import apply_weights, load_or_build_weights
+from layer_index import update_index
+from layer_series import encode_chunk, series_chunks, series_period, step_stats, write_series_groups
+from png_layer import export_xyz_tiles
+from raster_layer import export_raster_layer
+from stage_profiler import StageProfiler, aggregate_stages, run_profile_path, write_profile
+from station_cube import cube_station_values, load_cube, station_axis
+from station_store import date_range, load_store
+from zonal_stats import load_or_build_zones, zonal_stats
+
 
 VARIABLE_MAP = {
     "temperature": "temp_moy",
@@ -29,18 +44,51 @@ VARIABLE_MAP = {
     "vent": "vent_moy"
 }
 
+INDEX_KEY = ["variable", "period", "period_type"]
+
+WORKER_CONTEXT = {}
+
 
 def parse_args():
     parser = argparse.ArgumentParser(description="Spatial IDW layer generator for department 13.")
     parser.add_argument("--input", default="web/meteo_data.json", help="Path to meteo_data.json")
-    parser.add_argument("--variable", required=True, choices=VARIABLE_MAP.keys())
-    parser.add_argument("--period-type", required=True, choices=["day", "month"])
-    parser.add_argument("--period", required=True, help="YYYYMMDD for day, YYYY-MM for month")
+    parser.add_argument("--variable", choices=VARIABLE_MAP.keys())
+    parser.add_argument("--period-type", choices=["day", "month"])
+    parser.add_argument("--period", help="YYYYMMDD for day, YYYY-MM for month")
+    parser.add_argument("--all", action="store_true",
+                        help="Batch: every variable x every period (restricted by --period-type / --periods)")
+    parser.add_argument("--periods", nargs="+", help="Batch periods: YYYYMMDD, YYYY-MM, or 'days' / 'months'")
+    parser.add_argument("--cube", help="Station cube folder from build_dashboard_csv.py (replaces --input lookups)")
+    parser.add_argument("--store", help="Parquet station store from build_dashboard_csv.py (e.g. data/store)")
+    parser.add_argument("--from", dest="date_from", help="Store: first day YYYYMMDD (default: from the periods)")
+    parser.add_argument("--to", dest="date_to", help="Store: last day YYYYMMDD (default: from the periods)")
+    parser.add_argument("--workers", type=int, default=default_workers(), help="Worker processes for batch runs")
     parser.add_argument("--grid", type=float, default=2000, help="Grid resolution in meters (EPSG:2154)")
     parser.add_argument("--power", type=float, default=2.0, help="IDW power")
+    parser.add_argument("--neighbors", type=int, help="IDW: only use the k nearest stations (KD-tree)")
+    parser.add_argument("--radius", type=float, help="IDW: only use stations within this distance in meters")
     parser.add_argument("--departement", default="data/raw/departement_13.geojson", help="Department GeoJSON (EPSG:2154)")
+    parser.add_argument("--communes", default="data/raw/communes_13.geojson",
+                        help="Commune GeoJSON (EPSG:2154) for per-commune stats in the index ('' to disable)")
     parser.add_argument("--outdir", default="outputs/spatial", help="Output folder")
+    parser.add_argument("--format", default="raster", choices=["raster", "geojson", "both"],
+                        help="Layer output: compact raster (JSON header + binary), GeoJSON points, or both")
+    parser.add_argument("--encoding", default="uint16", choices=["uint16", "float32"], help="Raster payload encoding")
+    parser.add_argument("--no-gzip", action="store_true", help="Do not gzip the raster payload")
+    parser.add_argument("--tiles", type=int, nargs=2, metavar=("MINZOOM", "MAXZOOM"),
+                        help="Also cut a Web-Mercator XYZ PNG pyramid per layer (tiles/<stem>/{z}/{x}/{y}.png) "
+                             "drawn by the dashboard instead of point markers, e.g. --tiles 8 11")
+    parser.add_argument("--series", action="store_true",
+                        help="Batch: one chunked time-series cube per variable / period type "
+                             "(<variable>_<period_type>_series.json + .bin.gz) instead of one file per layer")
+    parser.add_argument("--series-chunk", type=int, default=16, help="Periods per compressed chunk of a series")
     parser.add_argument("--max-points", type=int, default=250000, help="Safety cap for grid points")
+    parser.add_argument("--cache-dir", default="outputs/cache", help="Cache folder for masks and IDW weights ('' to disable)")
+    parser.add_argument("--profile", action="store_true",
+                        help="Per-stage wall / CPU time, peak RSS and counts: <stem>_profile.json per layer and a run "
+                             "report under <outdir>/profiles/")
+    parser.add_argument("--profile-index", action="store_true",
+                        help="Like --profile, and attach each layer profile to its index.json record")
     return parser.parse_args()
 
 
@@ -49,6 +97,53 @@ def load_json(path):
         return json.load(file)
 
 
+def check_period(period_type, period):
+    if period_type == "day" and len(period) != 8:
+        raise SystemExit("Day period must be YYYYMMDD.")
+    if period_type == "month" and len(period) != 7:
+        raise SystemExit("Month period must be YYYY-MM.")
+
+
+def available_dates(data):
+    return sorted({d["date_raw"] for commune in data["communes"].values() for d in commune["donnees"]})
+
+
+def list_periods(dates, period_type):
+    days = sorted(str(d) for d in dates)
+    if period_type == "day":
+        return [("day", day) for day in days]
+    return [("month", month) for month in sorted({f"{day[:4]}-{day[4:6]}" for day in days})]
+
+
+def resolve_jobs(args, dates):
+    if not args.all and not args.periods:
+        if not (args.variable and args.period_type and args.period):
+            raise SystemExit("Provide --variable, --period-type and --period (or --all / --periods).")
+        check_period(args.period_type, args.period)
+        return [(args.variable, args.period_type, args.period)]
+
+    variables = list(VARIABLE_MAP) if args.all else [args.variable]
+    if variables == [None]:
+        raise SystemExit("Provide --variable (or --all).")
+
+    periods = []
+    if args.periods:
+        for value in args.periods:
+            if value in ("days", "months"):
+                periods.extend(list_periods(dates, value[:-1]))
+            else:
+                period_type = "day" if len(value) == 8 else "month"
+                check_period(period_type, value)
+                periods.append((period_type, value))
+    elif args.period_type and args.period:
+        check_period(args.period_type, args.period)
+        periods.append((args.period_type, args.period))
+    else:
+        for period_type in ([args.period_type] if args.period_type else ["day", "month"]):
+            periods.extend(list_periods(dates, period_type))
+    return [(variable, period_type, period) for variable in variables for period_type, period in periods]
+
+
 def select_station_values(data, variable_key, period_type, period):
     points = []
     for commune in data["communes"].values():
@@ -81,7 +176,7 @@ def select_station_values(data, variable_key, period_type, period):
 def load_department_mask(path):
     geo = load_json(path)
     geom = shape(geo["features"][0]["geometry"])
-    return prep(geom), geom.bounds
+    return geom, geom.bounds
 
 
 def build_grid(bounds, resolution):
@@ -91,39 +186,10 @@ def build_grid(bounds, resolution):
     return np.meshgrid(xs, ys)
 
 
-def idw_interpolate(xy, values, grid_points, power=2.0):
-    coords = np.array(xy, dtype=float)
-    vals = np.array(values, dtype=float)
-    grid_x, grid_y = grid_points
-    grid_vals = np.full(grid_x.shape, np.nan, dtype=float)
-
-    flat_x = grid_x.ravel()
-    flat_y = grid_y.ravel()
-    chunk = 10000
-    for start in range(0, flat_x.size, chunk):
-        end = min(start + chunk, flat_x.size)
-        px = flat_x[start:end]
-        py = flat_y[start:end]
-        dist = np.hypot(px[:, None] - coords[:, 0], py[:, None] - coords[:, 1])
-        dist = np.where(dist == 0, 1e-6, dist)
-        weights = 1 / (dist ** power)
-        interp = np.sum(weights * vals[None, :], axis=1) / np.sum(weights, axis=1)
-        grid_vals.ravel()[start:end] = interp
-
-    return grid_vals
-
-
-def mask_grid(grid_x, grid_y, grid_vals, prepared_geom, max_points):
-    flat_x = grid_x.ravel()
-    flat_y = grid_y.ravel()
-    if flat_x.size > max_points:
-        raise SystemExit(f"Grid too large ({flat_x.size} points). Increase resolution.")
-    mask = np.zeros_like(flat_x, dtype=bool)
-    for idx, (x, y) in enumerate(zip(flat_x, flat_y)):
-        mask[idx] = prepared_geom.contains(Point(x, y))
-    mask = mask.reshape(grid_x.shape)
-    masked = np.where(mask, grid_vals, np.nan)
-    return masked
+def build_mask(grid_x, grid_y, geom, bounds, resolution, max_points, cache_dir=None):
+    if grid_x.size > max_points:
+        raise SystemExit(f"Grid too large ({grid_x.size} points). Increase resolution.")
+    return load_or_compute_mask(geom, grid_x, grid_y, bounds, resolution, cache_dir)
 
 
 def build_stats(values):
@@ -138,82 +204,226 @@ def build_stats(values):
 
 
 def export_geojson(path, grid_x, grid_y, grid_vals, transformer):
-    features = []
-    flat_x = grid_x.ravel()
-    flat_y = grid_y.ravel()
-    flat_vals = grid_vals.ravel()
-    for x, y, v in zip(flat_x, flat_y, flat_vals):
-        if np.isnan(v):
-            continue
-        lon, lat = transformer.transform(x, y)
-        features.append({
+    valid = ~np.isnan(grid_vals)
+    lons, lats = transformer.transform(grid_x[valid], grid_y[valid])
+    features = [
+        {
             "type": "Feature",
             "properties": {"value": float(v)},
             "geometry": {"type": "Point", "coordinates": [lon, lat]}
-        })
+        }
+        for lon, lat, v in zip(lons.tolist(), lats.tolist(), grid_vals[valid].tolist())
+    ]
     geo = {"type": "FeatureCollection", "features": features}
     with open(path, "w", encoding="utf-8") as file:
         json.dump(geo, file, ensure_ascii=False)
 
 
-def update_index(path, record):
-    if path.exists():
-        index = load_json(path)
-    else:
-        index = {"layers": []}
-    index["layers"] = [
-        layer for layer in index["layers"]
-        if not (layer["variable"] == record["variable"]
-                and layer["period"] == record["period"]
-                and layer["period_type"] == record["period_type"])
-    ]
-    index["layers"].append(record)
-    with open(path, "w", encoding="utf-8") as file:
-        json.dump(index, file, ensure_ascii=False, indent=2)
+def init_worker(settings, bounds, mask, station_xy):
+    grid_x, grid_y = build_grid(bounds, settings["grid"])
+    WORKER_CONTEXT.update(settings)
+    WORKER_CONTEXT["grid_x"] = grid_x
+    WORKER_CONTEXT["grid_y"] = grid_y
+    WORKER_CONTEXT["mask"] = mask
+    WORKER_CONTEXT["to_wgs84"] = Transformer.from_crs("EPSG:2154", "EPSG:4326", always_xy=True)
+    WORKER_CONTEXT["zones"] = None
+    if settings["communes"]:
+        WORKER_CONTEXT["zones"] = load_or_build_zones(settings["communes"], grid_x, grid_y, bounds,
+                                                      settings["grid"], settings["cache_dir"])
+    WORKER_CONTEXT["weights"] = load_or_build_weights(station_xy, grid_x[mask], grid_y[mask],
+                                                      settings["power"], settings["cache_dir"],
+                                                      settings["neighbors"], settings["radius"])
+
+
+def run_layer(job):
+    ctx = WORKER_CONTEXT
+    profiler = StageProfiler(ctx["profile"])
+    grid_x, grid_y = ctx["grid_x"], ctx["grid_y"]
+    masked_vals = np.full(grid_x.shape, np.nan)
+    with profiler.stage("interpolation", stations=int(np.count_nonzero(~np.isnan(job["values"]))),
+                        cells=int(ctx["mask"].sum())):
+        masked_vals[ctx["mask"]] = apply_weights(ctx["weights"], job["values"])
+
+    stem = f"{job['variable']}_{job['period']}"
+    with profiler.stage("stats"):
+        stats = build_stats(masked_vals)
+    communes = None
+    if ctx["zones"]:
+        with profiler.stage("zonal_stats") as counts:
+            communes = zonal_stats(masked_vals, ctx["zones"])
+            counts["communes"] = len(communes)
+    record = {
+        "variable": job["variable"],
+        "period_type": job["period_type"],
+        "period": job["period"],
+        "stats": stats,
+        "communes": communes,
+        "raster": None,
+        "geojson": None
+    }
+    if ctx["format"] in ("raster", "both"):
+        raster_path = Path(ctx["outdir"]) / f"{stem}.raster.json"
+        with profiler.stage("raster", cells=int(masked_vals.size)):
+            export_raster_layer(raster_path, masked_vals, grid_x[0, :], grid_y[:, 0], ctx["grid"],
+                                encoding=ctx["encoding"], compress=ctx["compress"], stats=stats)
+        record["raster"] = str(raster_path).replace("\\", "/")
+    if ctx["format"] in ("geojson", "both"):
+        geojson_path = Path(ctx["outdir"]) / f"{stem}.geojson"
+        with profiler.stage("geojson", features=int(np.count_nonzero(~np.isnan(masked_vals)))):
+            export_geojson(str(geojson_path), grid_x, grid_y, masked_vals, ctx["to_wgs84"])
+        record["geojson"] = str(geojson_path).replace("\\", "/")
+    if ctx["tiles"]:
+        with profiler.stage("xyz_tiles") as counts:
+            tiles = export_xyz_tiles(Path(ctx["outdir"]) / "tiles" / stem, masked_vals, grid_x[0, :], grid_y[:, 0],
+                                     ctx["grid"], job["variable"], ctx["tiles"], stats["min"], stats["max"])
+            counts["tiles"] = tiles.pop("tile_count")
+        record.update(tiles)
+    if profiler.enabled:
+        write_profile(Path(ctx["outdir"]) / f"{stem}_profile.json",
+                      profiler.report(variable=job["variable"], period=job["period"], grid=ctx["grid"]))
+        record["profile"] = profiler.stages
+    return record
+
+
+def run_series_chunk(chunk):
+    ctx = WORKER_CONTEXT
+    profiler = StageProfiler(ctx["profile"])
+    mask = ctx["mask"]
+    stack = np.full((len(chunk["jobs"]), *mask.shape), np.nan)
+    with profiler.stage("interpolation", layers=len(chunk["jobs"]), cells=int(mask.sum())):
+        for step, job in enumerate(chunk["jobs"]):
+            stack[step][mask] = apply_weights(ctx["weights"], job["values"])
+    with profiler.stage("encode", cells=int(stack.size)) as counts:
+        payload, encoding_info = encode_chunk(stack, ctx["encoding"], ctx["compress"])
+        counts["bytes"] = len(payload)
+    result = {
+        "variable": chunk["variable"],
+        "period_type": chunk["period_type"],
+        "index": chunk["index"],
+        "periods": [job["period"] for job in chunk["jobs"]],
+        "stats": step_stats(stack),
+        "payload": payload,
+        **encoding_info
+    }
+    if profiler.enabled:
+        result["profile"] = profiler.stages
+    return result
+
+
+def save_series(outdir, chunks, results, grid_x, grid_y, args):
+    def series_path(variable, period_type):
+        return outdir / f"{variable}_{period_type}_series.json"
+
+    written = write_series_groups(chunks, results, series_path, grid_x[0, :], grid_y[:, 0], args.grid,
+                                  args.encoding, not args.no_gzip)
+    return [{
+        "variable": variable,
+        "period_type": period_type,
+        "period": series_period(period_type),
+        "periods": [header["periods"][0], header["periods"][-1]],
+        "steps": len(header["periods"]),
+        "stats": header["stats"],
+        "communes": None,
+        "raster": None,
+        "geojson": None,
+        "series": str(path).replace("\\", "/")
+    } for (variable, period_type), path, _, header in written]
 
 
 def main():
     args = parse_args()
-    if args.period_type == "day" and len(args.period) != 8:
-        raise SystemExit("Day period must be YYYYMMDD.")
-    if args.period_type == "month" and len(args.period) != 7:
-        raise SystemExit("Month period must be YYYY-MM.")
-
-    data = load_json(args.input)
-    variable_key = VARIABLE_MAP[args.variable]
-    stations = select_station_values(data, variable_key, args.period_type, args.period)
-    if not stations:
-        raise SystemExit("No stations with data for this period.")
-
-    prepared_geom, bounds = load_department_mask(args.departement)
-    to_l93 = Transformer.from_crs("EPSG:4326", "EPSG:2154", always_xy=True)
-    to_wgs84 = Transformer.from_crs("EPSG:2154", "EPSG:4326", always_xy=True)
-
-    xy = [to_l93.transform(p["lon"], p["lat"]) for p in stations]
-    values = [p["value"] for p in stations]
-
-    grid_x, grid_y = build_grid(bounds, args.grid)
-    grid_vals = idw_interpolate(xy, values, (grid_x, grid_y), power=args.power)
-    masked_vals = mask_grid(grid_x, grid_y, grid_vals, prepared_geom, args.max_points)
+    profiler = StageProfiler(args.profile or args.profile_index)
+    with profiler.stage("load_input") as counts:
+        if args.store:
+            start, end = date_range(args.periods or [args.period])
+            variables = list(VARIABLE_MAP.values()) if args.all or not args.variable else [VARIABLE_MAP[args.variable]]
+            source = load_store(args.store, variables, args.date_from or start, args.date_to or end)
+            dates = source["dates"]
+            select = partial(cube_station_values, source)
+        elif args.cube:
+            source = load_cube(args.cube)
+            dates = source["dates"]
+            select = partial(cube_station_values, source)
+        else:
+            source = load_json(args.input)
+            dates = available_dates(source)
+            select = partial(select_station_values, source)
+        counts["dates"] = len(dates)
+    requested = resolve_jobs(args, dates)
+    batch = args.all or bool(args.periods)
+    if args.series and not batch:
+        raise SystemExit("--series needs a batch run (--all or --periods).")
+
+    with profiler.stage("station_axis") as counts:
+        to_l93 = Transformer.from_crs("EPSG:4326", "EPSG:2154", always_xy=True)
+        names, station_xy = station_axis(source, to_l93)
+        station_index = {name: idx for idx, name in enumerate(names)}
+        counts["stations"] = len(names)
+    jobs = []
+    with profiler.stage("select_stations", requested=len(requested)) as counts:
+        for variable, period_type, period in requested:
+            stations = select(VARIABLE_MAP[variable], period_type, period)
+            if not stations:
+                if not batch:
+                    raise SystemExit("No stations with data for this period.")
+                print(f"Skipped: {variable} {period} (no stations with data)")
+                continue
+            values = np.full(len(names), np.nan)
+            for p in stations:
+                values[station_index[p["name"]]] = p["value"]
+            jobs.append({"variable": variable, "period_type": period_type, "period": period, "values": values})
+        counts["layers"] = len(jobs)
+
+    with profiler.stage("grid_mask") as counts:
+        geom, bounds = load_department_mask(args.departement)
+        grid_x, grid_y = build_grid(bounds, args.grid)
+        mask = build_mask(grid_x, grid_y, geom, bounds, args.grid, args.max_points, args.cache_dir)
+        counts.update(cells=int(grid_x.size), masked_cells=int(mask.sum()))
 
     outdir = Path(args.outdir)
     outdir.mkdir(parents=True, exist_ok=True)
-
-    stem = f\"{args.variable}_{args.period}\"
-    geojson_path = outdir / f\"{stem}.geojson\"
-    export_geojson(str(geojson_path), grid_x, grid_y, masked_vals, to_wgs84)
-
-    stats = build_stats(masked_vals)
-    record = {
-        \"variable\": args.variable,
-        \"period_type\": args.period_type,
-        \"period\": args.period,
-        \"stats\": stats,
-        \"geojson\": str(geojson_path).replace(\"\\\\\", \"/\")
-    }
-    update_index(outdir / \"index.json\", record)
-    print(\"Generated:\", record)
-
-
-if __name__ == \"__main__\":
+    settings = {"outdir": str(outdir), "power": args.power, "grid": args.grid, "cache_dir": args.cache_dir,
+                "neighbors": args.neighbors, "radius": args.radius, "format": args.format,
+                "encoding": args.encoding, "compress": not args.no_gzip, "communes": args.communes,
+                "tiles": args.tiles, "profile": profiler.enabled}
+    if args.cache_dir:
+        with profiler.stage("precompute", stations=len(names)):
+            load_or_build_weights(station_xy, grid_x[mask], grid_y[mask], args.power, args.cache_dir,
+                                  args.neighbors, args.radius)
+            if args.communes:
+                load_or_build_zones(args.communes, grid_x, grid_y, bounds, args.grid, args.cache_dir)
+
+    workers = args.workers if batch else 1
+    initargs = (settings, bounds, mask, station_xy)
+    if args.series:
+        chunks = series_chunks(jobs, args.series_chunk)
+        with profiler.stage("series_chunks", layers=len(jobs), chunks=len(chunks), workers=workers) as counts:
+            results, failures = run_jobs(chunks, run_series_chunk, init_worker, initargs, workers)
+            counts["failures"] = len(failures)
+        with profiler.stage("write_series") as counts:
+            records = save_series(outdir, chunks, results, grid_x, grid_y, args)
+            counts["series"] = len(records)
+    else:
+        with profiler.stage("layers", layers=len(jobs), workers=workers) as counts:
+            records, failures = run_jobs(jobs, run_layer, init_worker, initargs, workers)
+            counts["failures"] = len(failures)
+    if profiler.enabled:
+        layer_profiles = [item["profile"] for item in (results if args.series else records) if "profile" in item]
+        report = profiler.report(script="generate_spatial_layers", args=vars(args), layers=len(records),
+                                 failures=len(failures), layer_stages=aggregate_stages(layer_profiles))
+        print(f"Profile: {write_profile(run_profile_path(outdir, 'generate_spatial_layers'), report)}")
+    if not args.profile_index:
+        for record in records:
+            record.pop("profile", None)
+    if records:
+        update_index(outdir, records, INDEX_KEY)
+    if batch:
+        print(f"Generated: {len(records)} {'series' if args.series else 'layers'}, {len(failures)} failed.")
+    elif records:
+        print("Generated:", records[0])
+    if failures:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
     main()
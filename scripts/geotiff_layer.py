@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+GeoTIFF writer for interpolated grids (--geotiff cog | plain).
+The cog profile follows the Cloud-Optimized GeoTIFF layout (GDAL COG driver): 256 x 256 internal tiles,
+DEFLATE / ZSTD / LZW compression with a predictor (floating-point for float data, horizontal for int16),
+averaged internal overviews down to one tile, and the IFDs / overviews ahead of the full-resolution data,
+so a window or an overview level is read (locally or over HTTP ranges) without touching the rest of the file.
+plain keeps the former layout (uncompressed strips). Encodings: float32, float16 (half floats, ~3 significant
+digits) or int16 scaled to the layer range (scale / offset in the band metadata, nodata -32768).
+Streamed grids (--tile-size, series) are written block by block to a tiled float32 staging file, then copied to
+the requested profile (float32 / float16 only: the int16 scale needs the whole range up front).
+"""
+
+import os
+from pathlib import Path
+
+import numpy as np
+
+try:
+    import rasterio
+    import rasterio.shutil
+    from rasterio.enums import Resampling
+    from rasterio.io import MemoryFile
+except ImportError:
+    rasterio = None
+
+
+GEOTIFF_PROFILES = ["cog", "plain"]
+GEOTIFF_COMPRESS = ["deflate", "zstd", "lzw"]
+GEOTIFF_ENCODINGS = ["float32", "float16", "int16"]
+BLOCK_SIZE = 256
+INT16_NODATA = -32768
+INT16_MAX = 32767
+
+
+def tmp_path(path, tag="tmp"):
+    path = Path(path)
+    return path.with_name(f".{path.name}.{os.getpid()}.{tag}")
+
+
+def int16_scale(vmin, vmax):
+    # value = offset + code * scale, codes in [-32767, 32767] (-32768 is nodata).
+    scale = (vmax - vmin) / (2 * INT16_MAX) or 1.0
+    return scale, vmin + INT16_MAX * scale
+
+
+def encode_bands(bands, encoding):
+    # bands: (count, rows north -> south, cols) floats, NaN = nodata -> (array, dtype, nodata, scale, offset).
+    data = np.asarray(bands, dtype=float)
+    if encoding != "int16":
+        return data.astype(np.float32), "float32", np.nan, 1.0, 0.0
+    valid = ~np.isnan(data)
+    vmin = float(data[valid].min()) if valid.any() else 0.0
+    vmax = float(data[valid].max()) if valid.any() else 0.0
+    scale, offset = int16_scale(vmin, vmax)
+    codes = np.full(data.shape, INT16_NODATA, dtype=np.int16)
+    codes[valid] = np.clip(np.rint((data[valid] - offset) / scale), -INT16_MAX, INT16_MAX)
+    return codes, "int16", INT16_NODATA, scale, offset
+
+
+def creation_options(profile, compress, encoding, blocksize=BLOCK_SIZE):
+    options = {"NBITS": 16} if encoding == "float16" else {}
+    if profile == "cog":
+        options.update({"COMPRESS": compress.upper(), "PREDICTOR": "YES", "BLOCKSIZE": blocksize,
+                        "OVERVIEWS": "AUTO", "RESAMPLING": "AVERAGE", "BIGTIFF": "IF_SAFER"})
+    return options
+
+
+def write_geotiff(path, grid, transform, crs, profile="cog", compress="deflate", encoding="float32",
+                  descriptions=None, tags=None):
+    # grid: (rows south -> north, cols) or (bands, rows, cols); GeoTIFF rows go north -> south.
+    grid = np.asarray(grid)
+    bands = (grid[None] if grid.ndim == 2 else grid)[:, ::-1]
+    data, dtype, nodata, scale, offset = encode_bands(bands, encoding)
+    count, height, width = data.shape
+    meta = {"driver": "GTiff", "height": height, "width": width, "count": count, "dtype": dtype, "crs": crs,
+            "transform": transform, "nodata": nodata}
+    target = tmp_path(path)
+    with MemoryFile() as memfile:
+        # The COG driver only copies an existing dataset: the cog profile stages the grid in memory first.
+        with (memfile.open(**meta) if profile == "cog" else
+              rasterio.open(str(target), "w", **meta, **creation_options(profile, compress, encoding))) as dst:
+            dst.write(data)
+            if encoding == "int16":
+                dst.scales = (scale,) * count
+                dst.offsets = (offset,) * count
+            for band, description in enumerate(descriptions or [], start=1):
+                dst.set_band_description(band, description)
+            if tags:
+                dst.update_tags(**tags)
+        if profile == "cog":
+            with memfile.open() as src:
+                rasterio.shutil.copy(src, str(target), driver="COG", **creation_options(profile, compress, encoding))
+    os.replace(target, path)
+    return path
+
+
+def open_staging_geotiff(path, height, width, transform, crs, compress="deflate", count=1):
+    # Tiled float32 file written block by block; finish_geotiff() turns it into the requested profile.
+    return rasterio.open(
+        str(tmp_path(path, "stage.tif")),
+        "w",
+        driver="GTiff",
+        height=height,
+        width=width,
+        count=count,
+        dtype="float32",
+        crs=crs,
+        transform=transform,
+        nodata=np.nan,
+        tiled=True,
+        blockxsize=BLOCK_SIZE,
+        blockysize=BLOCK_SIZE,
+        compress=compress,
+        predictor=3,
+        interleave="band",
+        BIGTIFF="IF_SAFER"
+    )
+
+
+def overview_factors(height, width, blocksize=BLOCK_SIZE):
+    # Halvings until the grid fits in one block (what OVERVIEWS=AUTO does).
+    factors, factor = [], 2
+    while max(height, width) / (factor // 2) > blocksize:
+        factors.append(factor)
+        factor *= 2
+    return factors
+
+
+def finish_geotiff(path, profile="cog", compress="deflate", encoding="float32"):
+    # Staging file -> path. Blocks are copied (and overviews built from the file) without loading the grid.
+    staging = tmp_path(path, "stage.tif")
+    target = tmp_path(path)
+    try:
+        with rasterio.open(str(staging)) as src:
+            count = src.count
+        if profile == "cog" and count > 1:
+            # The COG driver (GDAL < 3.11) only interleaves by pixel, and a series is read one band (period) at
+            # a time: overviews are built in the staging file and copied ahead of the band-interleaved tiles.
+            with rasterio.open(str(staging), "r+") as dst:
+                dst.build_overviews(overview_factors(dst.height, dst.width), Resampling.average)
+            options = {"TILED": "YES", "BLOCKXSIZE": BLOCK_SIZE, "BLOCKYSIZE": BLOCK_SIZE, "COMPRESS": compress.upper(),
+                       "PREDICTOR": 3, "INTERLEAVE": "BAND", "COPY_SRC_OVERVIEWS": "YES", "BIGTIFF": "IF_SAFER",
+                       **({"NBITS": 16} if encoding == "float16" else {})}
+            driver = "GTiff"
+        else:
+            options = creation_options(profile, compress, encoding)
+            driver = "COG" if profile == "cog" else "GTiff"
+        with rasterio.open(str(staging)) as src:
+            rasterio.shutil.copy(src, str(target), driver=driver, **options)
+        os.replace(target, path)
+    finally:
+        staging.unlink(missing_ok=True)
+    return path
+
+
+def read_geotiff(path, window=None, overview_level=None):
+    # Decoded float values (scale / offset applied, nodata -> NaN), rows north -> south, first band.
+    # overview_level 0 is the first internal overview (half resolution for the COG profile).
+    with rasterio.open(str(path), overview_level=overview_level) as src:
+        data = src.read(1, window=window, masked=True).astype(float)
+        return (data * src.scales[0] + src.offsets[0]).filled(np.nan)
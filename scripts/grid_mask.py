@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Department mask helpers shared by the interpolation scripts.
+Vectorized point-in-polygon on the grid + on-disk cache keyed by (geometry, bounds, resolution).
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+try:
+    import shapely
+    from shapely.geometry import Point
+    from shapely.prepared import prep
+except ImportError as exc:
+    raise SystemExit("Missing dependency: shapely") from exc
+
+
+HAS_VECTORIZED = hasattr(shapely, "contains_xy")
+
+
+def geometry_hash(geom):
+    return hashlib.sha1(geom.wkb).hexdigest()[:16]
+
+
+def mask_key(geom_hash, bounds, resolution):
+    payload = json.dumps({
+        "geometry": geom_hash,
+        "bounds": [round(float(v), 3) for v in bounds],
+        "resolution": float(resolution)
+    }, sort_keys=True)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:20]
+
+
+def contains_points(geom, flat_x, flat_y):
+    if HAS_VECTORIZED:
+        shapely.prepare(geom)
+        return shapely.contains_xy(geom, flat_x, flat_y)
+    prepared_geom = prep(geom)
+    mask = np.zeros(flat_x.shape, dtype=bool)
+    for idx, (x, y) in enumerate(zip(flat_x, flat_y)):
+        mask[idx] = prepared_geom.contains(Point(x, y))
+    return mask
+
+
+def compute_mask(geom, grid_x, grid_y):
+    # Cells whose centre is outside the bounding box never need an exact test.
+    minx, miny, maxx, maxy = geom.bounds
+    flat_x = grid_x.ravel()
+    flat_y = grid_y.ravel()
+    mask = np.zeros(flat_x.shape, dtype=bool)
+    candidates = np.flatnonzero((flat_x >= minx) & (flat_x <= maxx) & (flat_y >= miny) & (flat_y <= maxy))
+    if candidates.size:
+        mask[candidates] = contains_points(geom, flat_x[candidates], flat_y[candidates])
+    return mask.reshape(grid_x.shape)
+
+
+def mask_path(cache_dir, geom, bounds, resolution, geom_hash=None):
+    geom_hash = geom_hash or geometry_hash(geom)
+    return Path(cache_dir) / f"mask_{mask_key(geom_hash, bounds, resolution)}.npy"
+
+
+def load_or_compute_mask(geom, grid_x, grid_y, bounds, resolution, cache_dir=None, geom_hash=None):
+    if not cache_dir:
+        return compute_mask(geom, grid_x, grid_y)
+
+    cache_dir = Path(cache_dir)
+    path = mask_path(cache_dir, geom, bounds, resolution, geom_hash)
+    if path.exists():
+        try:
+            mask = np.load(path)
+        except (OSError, ValueError):
+            mask = None
+        if mask is not None and mask.shape == grid_x.shape:
+            return mask
+
+    mask = compute_mask(geom, grid_x, grid_y)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f"{path.stem}.{os.getpid()}.tmp.npy")
+    np.save(tmp_path, mask)
+    os.replace(tmp_path, path)
+    return mask
+
+
+def build_tiled_mask(geom, xs, ys, bounds, resolution, cache_dir, tile_size, geom_hash=None):
+    # Same cache file as load_or_compute_mask, filled tile by tile through a memmap.
+    path = mask_path(cache_dir, geom, bounds, resolution, geom_hash)
+    shape = (len(ys), len(xs))
+    if path.exists():
+        try:
+            if np.load(path, mmap_mode="r").shape == shape:
+                return path
+        except (OSError, ValueError):
+            pass
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f"{path.stem}.{os.getpid()}.tmp.npy")
+    mask = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=bool, shape=shape)
+    for r0 in range(0, shape[0], tile_size):
+        for c0 in range(0, shape[1], tile_size):
+            grid_x, grid_y = np.meshgrid(xs[c0:c0 + tile_size], ys[r0:r0 + tile_size])
+            mask[r0:r0 + tile_size, c0:c0 + tile_size] = compute_mask(geom, grid_x, grid_y)
+    mask.flush()
+    del mask
+    os.replace(tmp_path, path)
+    return path
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+IDW weight operator shared by the interpolation scripts.
+The (cells x stations) weights only depend on the station positions, the grid cells and the power,
+so they are built once, cached on disk and applied to any number of value vectors.
+Missing station values are handled by renormalising the weights, not by rebuilding the operator.
+With --neighbors / --radius the operator only keeps the nearest stations of each cell (KD-tree), stored as
+(index, weights, k) with (cells x candidates) arrays sorted by distance. With --neighbors the candidates are the
+NEIGHBOR_SPARE * k nearest stations and the first k of them with a value are used for each value vector, so a
+missing station is replaced by the next one (exact while at most (NEIGHBOR_SPARE - 1) * k candidates are missing).
+"""
+
+import hashlib
+import os
+from pathlib import Path
+
+import numpy as np
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:
+    cKDTree = None
+
+NEIGHBOR_SPARE = 2
+
+
+def build_weights(station_xy, cell_x, cell_y, power=2.0, chunk=10000):
+    coords = np.asarray(station_xy, dtype=float)
+    cell_x = np.asarray(cell_x, dtype=float).ravel()
+    cell_y = np.asarray(cell_y, dtype=float).ravel()
+    weights = np.empty((cell_x.size, coords.shape[0]), dtype=float)
+    for start in range(0, cell_x.size, chunk):
+        end = min(start + chunk, cell_x.size)
+        dist = np.hypot(cell_x[start:end, None] - coords[:, 0], cell_y[start:end, None] - coords[:, 1])
+        dist = np.where(dist == 0, 1e-6, dist)
+        weights[start:end] = 1 / (dist ** power)
+    return weights
+
+
+def build_neighbor_weights(station_xy, cell_x, cell_y, power=2.0, neighbors=None, radius=None):
+    if cKDTree is None:
+        raise SystemExit("Missing dependency: scipy for --neighbors/--radius.")
+    coords = np.asarray(station_xy, dtype=float)
+    cells = np.column_stack([np.asarray(cell_x, dtype=float).ravel(), np.asarray(cell_y, dtype=float).ravel()])
+    k = min(neighbors * NEIGHBOR_SPARE if neighbors else coords.shape[0], coords.shape[0])
+    upper = radius if radius else np.inf
+    dist, index = cKDTree(coords).query(cells, k=k, distance_upper_bound=upper)
+    if k == 1:
+        dist, index = dist[:, None], index[:, None]
+    # Out-of-radius neighbours come back as (inf, n_stations): zero weight, index of the padding slot.
+    dist = np.where(dist == 0, 1e-6, dist)
+    weights = np.where(np.isinf(dist), 0.0, 1 / (dist ** power))
+    return index.astype(np.int32), weights, neighbors or 0
+
+
+def weights_key(station_xy, cell_x, cell_y, power, neighbors=None, radius=None):
+    digest = hashlib.sha1()
+    digest.update(np.ascontiguousarray(station_xy, dtype=float).tobytes())
+    digest.update(np.ascontiguousarray(cell_x, dtype=float).tobytes())
+    digest.update(np.ascontiguousarray(cell_y, dtype=float).tobytes())
+    digest.update(repr((float(power), neighbors, radius, NEIGHBOR_SPARE)).encode("ascii"))
+    return digest.hexdigest()[:20]
+
+
+def load_or_build_weights(station_xy, cell_x, cell_y, power=2.0, cache_dir=None, neighbors=None, radius=None):
+    local = bool(neighbors or radius)
+    if not cache_dir:
+        if local:
+            return build_neighbor_weights(station_xy, cell_x, cell_y, power, neighbors, radius)
+        return build_weights(station_xy, cell_x, cell_y, power)
+
+    cache_dir = Path(cache_dir)
+    key = weights_key(station_xy, cell_x, cell_y, power, neighbors, radius)
+    if local:
+        path = cache_dir / f"idw_knn_{key}.npz"
+        if path.exists():
+            try:
+                with np.load(path) as cached:
+                    return cached["index"], cached["weights"], int(cached["neighbors"])
+            except (OSError, ValueError, KeyError):
+                pass
+        index, weights, k = build_neighbor_weights(station_xy, cell_x, cell_y, power, neighbors, radius)
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{path.stem}.{os.getpid()}.tmp.npz")
+        np.savez(tmp_path, index=index, weights=weights, neighbors=k)
+        os.replace(tmp_path, path)
+        return index, weights, k
+
+    path = cache_dir / f"idw_{key}.npy"
+    expected = (np.asarray(cell_x).size, len(station_xy))
+    if path.exists():
+        try:
+            weights = np.load(path, mmap_mode="r")
+        except (OSError, ValueError):
+            weights = None
+        if weights is not None and weights.shape == expected:
+            return weights
+
+    weights = build_weights(station_xy, cell_x, cell_y, power)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f"{path.stem}.{os.getpid()}.tmp.npy")
+    np.save(tmp_path, weights)
+    os.replace(tmp_path, path)
+    return weights
+
+
+def apply_neighbor_weights(index, weights, values, neighbors=0):
+    # index / weights: (cells x candidates) sorted by distance, index len(values) = padding (out of radius).
+    vals = np.asarray(values, dtype=float)
+    padded = np.concatenate([vals, np.full((1,) + vals.shape[1:], np.nan)])
+    gathered = padded[index]
+    present = ~np.isnan(gathered)
+    if neighbors:
+        # First k candidates with a value, per value vector.
+        present &= np.cumsum(present, axis=1) <= neighbors
+    if gathered.ndim == 3:
+        weights = weights[:, :, None]
+    numerator = np.sum(weights * np.where(present, gathered, 0.0), axis=1)
+    denominator = np.sum(weights * present, axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(denominator > 0, numerator / denominator, np.nan)
+
+
+def apply_weights(weights, values):
+    # values: (stations,) or (stations, layers), NaN where a station has no data.
+    if isinstance(weights, tuple):
+        index, neighbor_weights, neighbors = weights
+        return apply_neighbor_weights(index, neighbor_weights, values, neighbors)
+    vals = np.asarray(values, dtype=float)
+    present = ~np.isnan(vals)
+    numerator = weights @ np.where(present, vals, 0.0)
+    denominator = weights @ present.astype(float)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(denominator > 0, numerator / denominator, np.nan)
@@ -2,20 +2,22 @@
 # -*- coding: utf-8 -*-
 """
 Interpolation spatiale des stations meteo (IDW + option Kriging).
-Exporte GeoTIFF/GeoJSON/PNG + stats et index pour le dashboard.
+Exporte GeoTIFF (COG)/GeoJSON/PNG + stats et index pour le dashboard.
 """
 
 import argparse
 import json
 import math
+import threading
+from contextlib import ExitStack
 from datetime import datetime
+from functools import partial
 from pathlib import Path
 
 import numpy as np
 
 try:
-    from shapely.geometry import shape, Point
-    from shapely.prepared import prep
+    from shapely.geometry import shape
 except ImportError as exc:
     raise SystemExit("Missing dependency: shapely. Please install it in your env.") from exc
 
@@ -27,29 +29,101 @@ except ImportError as exc:
 try:
     import rasterio
     from rasterio.transform import from_origin
+    from rasterio.windows import Window
 except ImportError:
     rasterio = None
 
-try:
-    import matplotlib.pyplot as plt
-except ImportError:
-    plt = None
+from batch_runner import default_workers, run_jobs
+from export_pipeline import ExportPipeline
+from geotiff_layer import (GEOTIFF_COMPRESS, GEOTIFF_ENCODINGS, GEOTIFF_PROFILES, finish_geotiff, open_staging_geotiff,
+                           write_geotiff)
+from grid_mask import build_tiled_mask, compute_mask, geometry_hash, load_or_compute_mask
+from idw_engine import apply_weights, build_weights, load_or_build_weights
+from kriging_engine import build_distances, fit_linear_variogram, krige_layers, load_or_build_distances
+from layer_cache import PATH_FIELDS, evict_layers, layer_key, lookup_layer, restore_layer, store_layer
+from layer_index import load_index, update_index
+from layer_series import decode_chunk, encode_chunk, series_chunks, series_period, step_stats, write_series_groups
+from png_layer import export_png_layer, export_xyz_tiles
+from raster_layer import export_raster_layer
+from stage_profiler import StageProfiler, aggregate_stages, run_profile_path, write_profile
+from station_cube import cube_station_values, load_cube, station_axis
+from station_store import date_range, load_store
+from tiled_grid import finish_stats, grid_axes, iter_tiles, new_stats, tile_grid, update_stats
+from zonal_stats import file_hash, load_or_build_zones, zonal_stats
+
+
+VARIABLES = ["temp_min", "temp_max", "temp_moy", "precipitation", "vent_moy", "vent_max"]
+INDEX_KEY = ["variable", "period", "method"]
+
+WORKER_CONTEXT = {}
+EXPORT_LOCAL = threading.local()
 
 
 def parse_args():
     parser = argparse.ArgumentParser(description="Interpolation IDW/Kriging sur le 13.")
     parser.add_argument("--input", default="web/meteo_data.json", help="Path meteo_data.json or CSV")
-    parser.add_argument("--variable", required=True,
-                        choices=["temp_min", "temp_max", "temp_moy", "precipitation", "vent_moy", "vent_max"])
+    parser.add_argument("--variable", choices=VARIABLES)
     parser.add_argument("--date", help="Date AAAAMMJJ (ex: 20250115)")
     parser.add_argument("--month", help="Mois AAAA-MM (ex: 2025-01)")
+    parser.add_argument("--all", action="store_true",
+                        help="Batch: every variable (and every date + month unless --periods is given)")
+    parser.add_argument("--periods", nargs="+",
+                        help="Batch periods: AAAAMMJJ, AAAA-MM, or 'dates' / 'months' for all available")
+    parser.add_argument("--cube", help="Station cube folder from build_dashboard_csv.py (replaces --input lookups)")
+    parser.add_argument("--store", help="Parquet station store from build_dashboard_csv.py (e.g. data/store)")
+    parser.add_argument("--from", dest="date_from", help="Store: first day AAAAMMJJ (default: from the periods)")
+    parser.add_argument("--to", dest="date_to", help="Store: last day AAAAMMJJ (default: from the periods)")
+    parser.add_argument("--workers", type=int, default=default_workers(), help="Worker processes for batch runs")
+    parser.add_argument("--export-writers", type=int, default=2,
+                        help="Writer threads per process exporting finished layers while the next one is computed "
+                             "(0: write inline)")
+    parser.add_argument("--export-queue", type=int, default=2,
+                        help="Finished layers queued or being written per process before the computation waits")
     parser.add_argument("--method", default="idw", choices=["idw", "kriging"])
+    parser.add_argument("--kriging-engine", default="native", choices=["native", "pykrige"],
+                        help="Kriging: batched native solver (cached distances) or pykrige per layer")
+    parser.add_argument("--variogram", default="layer", choices=["layer", "month"],
+                        help="Native kriging: fit the linear variogram per layer or per variable and month")
     parser.add_argument("--power", type=float, default=2.0, help="IDW power")
+    parser.add_argument("--neighbors", type=int, help="IDW: only use the k nearest stations (KD-tree)")
+    parser.add_argument("--radius", type=float, help="IDW: only use stations within this distance in meters")
     parser.add_argument("--grid", type=float, default=2000, help="Grid resolution in meters (EPSG:2154)")
     parser.add_argument("--outdir", default="outputs/interpolation", help="Output folder")
     parser.add_argument("--departement", default="data/raw/departement_13.geojson",
                         help="GeoJSON departement in EPSG:2154")
+    parser.add_argument("--communes", default="data/raw/communes_13.geojson",
+                        help="Commune GeoJSON (EPSG:2154) for per-commune stats in the index ('' to disable, not tiled)")
+    parser.add_argument("--format", default="raster", choices=["raster", "geojson", "both"],
+                        help="Layer output: compact raster (JSON header + binary), GeoJSON points, or both")
+    parser.add_argument("--encoding", default="uint16", choices=["uint16", "float32"], help="Raster payload encoding")
+    parser.add_argument("--no-gzip", action="store_true", help="Do not gzip the raster payload")
+    parser.add_argument("--geotiff", default="cog", choices=GEOTIFF_PROFILES,
+                        help="GeoTIFF layout: cog (tiled, compressed, overviews) or plain (uncompressed strips)")
+    parser.add_argument("--geotiff-compress", default="deflate", choices=GEOTIFF_COMPRESS,
+                        help="GeoTIFF compression of the cog profile (with predictor)")
+    parser.add_argument("--geotiff-encoding", default="float32", choices=GEOTIFF_ENCODINGS,
+                        help="GeoTIFF values: float32, float16, or int16 scaled to the layer range "
+                             "(not with --tile-size / --series)")
+    parser.add_argument("--tiles", type=int, nargs=2, metavar=("MINZOOM", "MAXZOOM"),
+                        help="Also cut a Web-Mercator XYZ PNG pyramid per layer (tiles/<stem>/{z}/{x}/{y}.png), "
+                             "e.g. --tiles 8 11; not tiled")
+    parser.add_argument("--series", action="store_true",
+                        help="Batch: one chunked time-series cube per variable / period type (+ a multi-band GeoTIFF, "
+                             "one band per period) instead of one file set per layer; not tiled")
+    parser.add_argument("--series-chunk", type=int, default=16, help="Periods per compressed chunk of a series")
     parser.add_argument("--max-points", type=int, default=250000, help="Safety cap for grid points")
+    parser.add_argument("--tile-size", type=int,
+                        help="Process the grid in tiles of N x N cells (lifts --max-points, GeoTIFF + stats only)")
+    parser.add_argument("--cache-dir", default="outputs/cache",
+                        help="Cache folder for department masks, IDW weights and finished layers ('' to disable)")
+    parser.add_argument("--layer-cache-mb", type=float, default=1024,
+                        help="Size limit of the finished-layer cache in MB (LRU eviction, 0 to disable)")
+    parser.add_argument("--force", action="store_true", help="Recompute layers even when their inputs are unchanged")
+    parser.add_argument("--profile", action="store_true",
+                        help="Per-stage wall / CPU time, peak RSS and counts: <stem>_profile.json per layer and a run "
+                             "report under <outdir>/profiles/ (peak RSS is only exact with --export-writers 0)")
+    parser.add_argument("--profile-index", action="store_true",
+                        help="Like --profile, and attach each layer profile to its index.json record")
     return parser.parse_args()
 
 
@@ -77,6 +151,55 @@ def normalize_period(args):
     return "month", args.month
 
 
+def parse_period(value):
+    if len(value) == 8:
+        try:
+            datetime.strptime(value, "%Y%m%d")
+        except ValueError as exc:
+            raise SystemExit(f"Invalid date {value}, expected AAAAMMJJ.") from exc
+        return "date", value
+    try:
+        datetime.strptime(value, "%Y-%m")
+    except ValueError as exc:
+        raise SystemExit(f"Invalid period {value}, expected AAAAMMJJ or AAAA-MM.") from exc
+    return "month", value
+
+
+def available_dates(data):
+    return sorted({d["date_raw"] for commune in data["communes"].values() for d in commune["donnees"]})
+
+
+def list_periods(dates, period_type):
+    dates = sorted(str(d) for d in dates)
+    if period_type == "date":
+        return [("date", d) for d in dates]
+    return [("month", m) for m in sorted({f"{d[:4]}-{d[4:6]}" for d in dates})]
+
+
+def resolve_jobs(args, dates):
+    if not args.all and not args.periods:
+        if not args.variable:
+            raise SystemExit("Provide --variable (or --all).")
+        return [(args.variable, *normalize_period(args))]
+
+    variables = VARIABLES if args.all else [args.variable]
+    if variables == [None]:
+        raise SystemExit("Provide --variable (or --all).")
+
+    periods = []
+    if args.periods:
+        for value in args.periods:
+            if value in ("dates", "months"):
+                periods.extend(list_periods(dates, value[:-1]))
+            else:
+                periods.append(parse_period(value))
+    elif args.date or args.month:
+        periods.append(normalize_period(args))
+    else:
+        periods = list_periods(dates, "date") + list_periods(dates, "month")
+    return [(variable, period_type, period) for variable in variables for period_type, period in periods]
+
+
 def select_station_values(data, variable, period_type, period_value):
     points = []
     for commune in data["communes"].values():
@@ -109,117 +232,71 @@ def load_department_mask(path):
     with open(path, "r", encoding="utf-8") as f:
         geo = json.load(f)
     geom = shape(geo["features"][0]["geometry"])
-    return prep(geom), geom.bounds
+    return geom, geom.bounds
 
 
 def build_grid(bounds, resolution):
-    minx, miny, maxx, maxy = bounds
-    xs = np.arange(minx, maxx + resolution, resolution)
-    ys = np.arange(miny, maxy + resolution, resolution)
+    xs, ys = grid_axes(bounds, resolution)
     grid_x, grid_y = np.meshgrid(xs, ys)
     return grid_x, grid_y
 
 
 def idw_interpolate(xy, values, grid_points, power=2.0):
-    coords = np.array(xy, dtype=float)
-    vals = np.array(values, dtype=float)
     gx, gy = grid_points
-    grid_vals = np.full(gx.shape, np.nan, dtype=float)
-
-    flat_x = gx.ravel()
-    flat_y = gy.ravel()
-    chunk = 10000
-    for start in range(0, flat_x.size, chunk):
-        end = min(start + chunk, flat_x.size)
-        px = flat_x[start:end]
-        py = flat_y[start:end]
-        dist = np.hypot(px[:, None] - coords[:, 0], py[:, None] - coords[:, 1])
-        dist = np.where(dist == 0, 1e-6, dist)
-        weights = 1 / (dist ** power)
-        interp = np.sum(weights * vals[None, :], axis=1) / np.sum(weights, axis=1)
-        grid_vals.ravel()[start:end] = interp
-
-    return grid_vals
+    weights = build_weights(xy, gx, gy, power)
+    return apply_weights(weights, values).reshape(gx.shape)
 
 
-def kriging_interpolate(xy, values, grid_points):
+def kriging_model(xy, values):
     try:
         from pykrige.ok import OrdinaryKriging
     except ImportError as exc:
         raise SystemExit("Missing dependency: pykrige for kriging.") from exc
     coords = np.array(xy, dtype=float)
     vals = np.array(values, dtype=float)
+    return OrdinaryKriging(coords[:, 0], coords[:, 1], vals, variogram_model="linear", verbose=False)
+
+
+def kriging_interpolate(xy, values, grid_points):
     gx, gy = grid_points
-    ok = OrdinaryKriging(coords[:, 0], coords[:, 1], vals, variogram_model="linear", verbose=False)
-    z, _ = ok.execute("grid", gx[0, :], gy[:, 0])
-    return np.array(z)
+    z, ss = kriging_model(xy, values).execute("grid", gx[0, :], gy[:, 0])
+    return np.array(z), np.array(ss)
+
+
+def build_mask(grid_x, grid_y, geom, bounds, resolution, max_points, cache_dir=None):
+    if grid_x.size > max_points:
+        raise SystemExit(f"Grid too large ({grid_x.size} points). Increase resolution or use --tile-size.")
+    return load_or_compute_mask(geom, grid_x, grid_y, bounds, resolution, cache_dir)
 
 
-def mask_grid(grid_x, grid_y, grid_vals, prepared_geom, max_points):
-    flat_x = grid_x.ravel()
-    flat_y = grid_y.ravel()
-    if flat_x.size > max_points:
-        raise SystemExit(f"Grid too large ({flat_x.size} points). Increase resolution.")
-    mask = np.zeros_like(flat_x, dtype=bool)
-    for idx, (x, y) in enumerate(zip(flat_x, flat_y)):
-        mask[idx] = prepared_geom.contains(Point(x, y))
-    mask = mask.reshape(grid_x.shape)
-    masked = np.where(mask, grid_vals, np.nan)
-    return masked, mask
+def raster_transform(xs, ys, resolution):
+    # Grid values are cell centres; the raster origin is the north-west corner of the first cell.
+    return from_origin(xs[0] - resolution / 2, ys[-1] + resolution / 2, resolution, resolution)
 
 
-def export_geotiff(path, grid, transform, crs):
+def export_geotiff(path, grid, transform, crs, profile="cog", compress="deflate", encoding="float32"):
     if rasterio is None:
         print("rasterio not available, skipping GeoTIFF.")
         return
-    data = grid.astype(np.float32)
-    height, width = data.shape
-    with rasterio.open(
-        path,
-        "w",
-        driver="GTiff",
-        height=height,
-        width=width,
-        count=1,
-        dtype="float32",
-        crs=crs,
-        transform=transform,
-        nodata=np.nan
-    ) as dst:
-        dst.write(data, 1)
+    write_geotiff(path, grid, transform, crs, profile, compress, encoding)
 
 
 def export_geojson(path, grid_x, grid_y, grid_vals, transformer):
-    features = []
-    flat_x = grid_x.ravel()
-    flat_y = grid_y.ravel()
-    flat_vals = grid_vals.ravel()
-    for x, y, v in zip(flat_x, flat_y, flat_vals):
-        if np.isnan(v):
-            continue
-        lon, lat = transformer.transform(x, y)
-        features.append({
+    valid = ~np.isnan(grid_vals)
+    lons, lats = transformer.transform(grid_x[valid], grid_y[valid])
+    features = [
+        {
             "type": "Feature",
             "properties": {"value": float(v)},
             "geometry": {"type": "Point", "coordinates": [lon, lat]}
-        })
+        }
+        for lon, lat, v in zip(lons.tolist(), lats.tolist(), grid_vals[valid].tolist())
+    ]
     geo = {"type": "FeatureCollection", "features": features}
     with open(path, "w", encoding="utf-8") as f:
         json.dump(geo, f, ensure_ascii=False)
 
 
-def export_png(path, grid_vals):
-    if plt is None:
-        print("matplotlib not available, skipping PNG.")
-        return
-    plt.figure(figsize=(7, 6))
-    plt.imshow(grid_vals, cmap="inferno", origin="lower")
-    plt.colorbar(label="Valeur")
-    plt.tight_layout()
-    plt.savefig(path, dpi=150)
-    plt.close()
-
-
 def build_stats(grid_vals):
     valid = grid_vals[~np.isnan(grid_vals)]
     if valid.size == 0:
@@ -231,78 +308,598 @@ def build_stats(grid_vals):
     }
 
 
-def update_index(index_path, record):
-    if index_path.exists():
-        with open(index_path, "r", encoding="utf-8") as f:
-            index = json.load(f)
-    else:
-        index = {"layers": []}
-    index["layers"] = [r for r in index["layers"] if not (
-        r["variable"] == record["variable"]
-        and r["period"] == record["period"]
-        and r["method"] == record["method"]
-    )]
-    index["layers"].append(record)
-    with open(index_path, "w", encoding="utf-8") as f:
-        json.dump(index, f, ensure_ascii=False, indent=2)
-
+def layer_stem(variable, period, method, grid):
+    return f"{variable}_{period}_{method}_grid{int(grid)}"
 
-def main():
-    args = parse_args()
-    period_type, period_value = normalize_period(args)
-    data = load_meteo_json(args.input)
 
-    stations = select_station_values(data, args.variable, period_type, period_value)
-    if not stations:
-        raise SystemExit("No stations with data for this period/variable.")
+def layer_files(record, outdir):
+    stem = layer_stem(record["variable"], record["period"], record["method"], record["grid"])
+    files = [str(Path(outdir) / f"{stem}_stats.json")]
+    files.extend(record[field] for field in PATH_FIELDS if record.get(field))
+    if record.get("png"):
+        files.append(str(Path(record["png"]).with_suffix(".pgw")))
+    if record.get("raster") and Path(record["raster"]).exists():
+        with open(record["raster"], "r", encoding="utf-8") as f:
+            files.append(str(Path(record["raster"]).with_name(json.load(f)["data"])))
+    return files
 
-    prepared_geom, bounds = load_department_mask(args.departement)
-    transformer = Transformer.from_crs("EPSG:4326", "EPSG:2154", always_xy=True)
-    inv_transformer = Transformer.from_crs("EPSG:2154", "EPSG:4326", always_xy=True)
 
-    xy = [transformer.transform(p["lon"], p["lat"]) for p in stations]
-    values = [p["value"] for p in stations]
+def tile_dir(outdir, record):
+    return Path(outdir) / "tiles" / layer_stem(record["variable"], record["period"], record["method"], record["grid"])
 
-    grid_x, grid_y = build_grid(bounds, args.grid)
-    if args.method == "idw":
-        grid_vals = idw_interpolate(xy, values, (grid_x, grid_y), power=args.power)
-    else:
-        grid_vals = kriging_interpolate(xy, values, (grid_x, grid_y))
 
-    masked_vals, mask = mask_grid(grid_x, grid_y, grid_vals, prepared_geom, args.max_points)
+def cached_jobs(jobs, outdir, cache_dir, station_xy, geom_hash, communes_hash, settings, force):
+    # Splits jobs into (still to compute, restored from the layer cache, count already up to date in outdir).
+    current = {(r["variable"], r["period"], r["method"]): r for r in load_index(outdir)["layers"]}
+    pending, restored, unchanged = [], [], 0
+    for job in jobs:
+        job["cache_key"] = layer_key(job, station_xy, geom_hash, communes_hash, settings)
+        if force:
+            pending.append(job)
+            continue
+        entry = lookup_layer(cache_dir, job["cache_key"])
+        previous = current.get((job["variable"], job["period"], settings["method"]))
+        if previous and previous.get("cache_key") == job["cache_key"] and \
+                all(Path(path).exists() for path in layer_files(previous, outdir)) and \
+                (not previous.get("tiles") or tile_dir(outdir, previous).exists()):
+            unchanged += 1
+        elif entry is not None and not settings["tiles"]:
+            # Tile pyramids are not kept in the layer cache: such layers are recomputed.
+            restored.append(restore_layer(cache_dir, job["cache_key"], entry, outdir))
+        else:
+            pending.append(job)
+    return pending, restored, unchanged
+
+
+def init_worker(settings, bounds, mask, station_xy):
+    WORKER_CONTEXT.update(settings)
+    WORKER_CONTEXT["station_xy"] = station_xy
+    if settings["tile_size"]:
+        WORKER_CONTEXT["xs"], WORKER_CONTEXT["ys"] = grid_axes(bounds, settings["grid"])
+        # mask is the path of the cached full-size mask (memory-mapped), or None to test tile by tile.
+        if mask is not None:
+            WORKER_CONTEXT["mask"] = np.load(mask, mmap_mode="r")
+        else:
+            WORKER_CONTEXT["mask"] = None
+            WORKER_CONTEXT["geom"] = load_department_mask(settings["departement"])[0]
+        return
 
-    outdir = Path(args.outdir)
-    outdir.mkdir(parents=True, exist_ok=True)
-    stem = f"{args.variable}_{period_value}_{args.method}_grid{int(args.grid)}"
+    grid_x, grid_y = build_grid(bounds, settings["grid"])
+    WORKER_CONTEXT["grid_x"] = grid_x
+    WORKER_CONTEXT["grid_y"] = grid_y
+    WORKER_CONTEXT["mask"] = mask
+    WORKER_CONTEXT["zones"] = None
+    if settings["communes"]:
+        WORKER_CONTEXT["zones"] = load_or_build_zones(settings["communes"], grid_x, grid_y, bounds,
+                                                      settings["grid"], settings["cache_dir"])
+    if settings["method"] == "idw":
+        WORKER_CONTEXT["weights"] = load_or_build_weights(station_xy, grid_x[mask], grid_y[mask],
+                                                          settings["power"], settings["cache_dir"],
+                                                          settings["neighbors"], settings["radius"])
+    elif settings["kriging_engine"] == "native":
+        WORKER_CONTEXT["distances"] = load_or_build_distances(station_xy, grid_x[mask], grid_y[mask],
+                                                              settings["cache_dir"])
+
+
+def open_tiled_geotiff(path, xs, ys, resolution):
+    return open_staging_geotiff(path, len(ys), len(xs), raster_transform(xs, ys, resolution), "EPSG:2154",
+                                WORKER_CONTEXT["geotiff_compress"])
+
+
+def run_tiled_layer(job, profiler):
+    if rasterio is None:
+        raise SystemExit("Missing dependency: rasterio for --tile-size.")
+    ctx = WORKER_CONTEXT
+    xs, ys = ctx["xs"], ctx["ys"]
+    height, width = len(ys), len(xs)
+    values = np.asarray(job["values"], dtype=float)
+    present = ~np.isnan(values)
+    kriging = ctx["method"] == "kriging"
+    model = None
+    if kriging and ctx["kriging_engine"] == "pykrige":
+        model = kriging_model(ctx["station_xy"][present], values[present])
+
+    outdir = Path(ctx["outdir"])
+    stem = layer_stem(job["variable"], job["period"], ctx["method"], ctx["grid"])
+    geotiff_path = outdir / f"{stem}.tif"
+    variance_path = outdir / f"{stem}_variance.tif" if kriging else None
+    acc = new_stats()
+    with profiler.stage("tiles", stations=int(present.sum()), cells=height * width) as counts, ExitStack() as stack:
+        dst = stack.enter_context(open_tiled_geotiff(geotiff_path, xs, ys, ctx["grid"]))
+        var_dst = stack.enter_context(open_tiled_geotiff(variance_path, xs, ys, ctx["grid"])) if kriging else None
+        for window in iter_tiles(height, width, ctx["tile_size"]):
+            r0, r1, c0, c1 = window
+            grid_x, grid_y = tile_grid(xs, ys, window)
+            if ctx["mask"] is not None:
+                tile_mask = np.asarray(ctx["mask"][r0:r1, c0:c1])
+            else:
+                tile_mask = compute_mask(ctx["geom"], grid_x, grid_y)
+            block = np.full(grid_x.shape, np.nan, dtype=np.float32)
+            var_block = np.full(grid_x.shape, np.nan, dtype=np.float32)
+            if tile_mask.any():
+                if not kriging:
+                    weights = load_or_build_weights(ctx["station_xy"], grid_x[tile_mask], grid_y[tile_mask],
+                                                    ctx["power"], None, ctx["neighbors"], ctx["radius"])
+                    block[tile_mask] = apply_weights(weights, values)
+                elif model is None:
+                    distances = build_distances(ctx["station_xy"], grid_x[tile_mask], grid_y[tile_mask])
+                    estimates, variances = krige_layers(ctx["station_xy"], distances, values, [job["variogram"]])
+                    block[tile_mask] = estimates[:, 0]
+                    var_block[tile_mask] = variances[:, 0]
+                else:
+                    z, ss = model.execute("grid", xs[c0:c1], ys[r0:r1])
+                    block = np.where(tile_mask, np.asarray(z, dtype=np.float32), np.nan)
+                    var_block = np.where(tile_mask, np.asarray(ss, dtype=np.float32), np.nan)
+            update_stats(acc, block)
+            target = Window(c0, height - r1, c1 - c0, r1 - r0)
+            dst.write(block[::-1], 1, window=target)
+            if var_dst is not None:
+                var_dst.write(var_block[::-1], 1, window=target)
+            counts["tiles"] = counts.get("tiles", 0) + 1
+
+    with profiler.stage("geotiff", cells=height * width):
+        for path in (geotiff_path, variance_path):
+            if path is not None:
+                finish_geotiff(path, ctx["geotiff_profile"], ctx["geotiff_compress"], ctx["geotiff_encoding"])
+
+    with profiler.stage("stats"):
+        stats = finish_stats(acc)
+        stats_path = outdir / f"{stem}_stats.json"
+        with open(stats_path, "w", encoding="utf-8") as f:
+            json.dump(stats, f, ensure_ascii=False, indent=2)
 
+    record = {
+        "variable": job["variable"],
+        "period": job["period"],
+        "period_type": job["period_type"],
+        "method": ctx["method"],
+        "grid": ctx["grid"],
+        "stats": stats,
+        "communes": None,
+        "raster": None,
+        "geojson": None,
+        "geotiff": str(geotiff_path).replace("\\", "/"),
+        "variance": str(variance_path).replace("\\", "/") if variance_path else None,
+        "png": None,
+        "cache_key": job.get("cache_key")
+    }
+    return finish_layer_profile(record, profiler, outdir / f"{stem}_profile.json")
+
+
+def finish_layer_profile(record, profiler, path):
+    # The profile travels back with the record; main() drops it unless --profile-index.
+    if profiler.enabled:
+        write_profile(path, profiler.report(variable=record["variable"], period=record["period"],
+                                            method=record["method"], grid=record["grid"]))
+        record["profile"] = profiler.stages
+    return record
+
+
+def export_layer(job, masked_vals, variance=None):
+    # Record of a finished grid and its outputs, as (stage, counts, write) tasks for the export pipeline;
+    # write(counts) returns the record fields it fills in.
+    ctx = WORKER_CONTEXT
+    grid_x, grid_y = ctx["grid_x"], ctx["grid_y"]
+    xs, ys = grid_x[0, :], grid_y[:, 0]
+    outdir = Path(ctx["outdir"])
+    stem = layer_stem(job["variable"], job["period"], ctx["method"], ctx["grid"])
+    cells = int(masked_vals.size)
+    valid = int(np.count_nonzero(~np.isnan(masked_vals)))
     stats = build_stats(masked_vals)
-    stats_path = outdir / f"{stem}_stats.json"
-    with open(stats_path, "w", encoding="utf-8") as f:
-        json.dump(stats, f, ensure_ascii=False, indent=2)
+    transform = raster_transform(xs, ys, ctx["grid"]) if rasterio else None
 
-    transform = from_origin(grid_x.min(), grid_y.max(), args.grid, args.grid)
+    stats_path = outdir / f"{stem}_stats.json"
     geotiff_path = outdir / f"{stem}.tif"
-    export_geotiff(str(geotiff_path), masked_vals, transform, "EPSG:2154")
-
-    geojson_path = outdir / f"{stem}.geojson"
-    export_geojson(str(geojson_path), grid_x, grid_y, masked_vals, inv_transformer)
-
+    variance_path = outdir / f"{stem}_variance.tif" if variance is not None else None
+    raster_path = outdir / f"{stem}.raster.json" if ctx["format"] in ("raster", "both") else None
+    geojson_path = outdir / f"{stem}.geojson" if ctx["format"] in ("geojson", "both") else None
     png_path = outdir / f"{stem}.png"
-    export_png(str(png_path), masked_vals)
+
+    def write_stats(counts):
+        with open(stats_path, "w", encoding="utf-8") as f:
+            json.dump(stats, f, ensure_ascii=False, indent=2)
+
+    def write_layer_geotiff(counts):
+        export_geotiff(str(geotiff_path), masked_vals, transform, "EPSG:2154", ctx["geotiff_profile"],
+                       ctx["geotiff_compress"], ctx["geotiff_encoding"])
+
+    def write_variance(counts):
+        export_geotiff(str(variance_path), variance, transform, "EPSG:2154", ctx["geotiff_profile"],
+                       ctx["geotiff_compress"], ctx["geotiff_encoding"])
+
+    def write_raster(counts):
+        export_raster_layer(raster_path, masked_vals, xs, ys, ctx["grid"], encoding=ctx["encoding"],
+                            compress=ctx["compress"], stats=stats)
+
+    def write_geojson(counts):
+        export_geojson(str(geojson_path), grid_x, grid_y, masked_vals, wgs84_transformer())
+
+    def write_png(counts):
+        export_png_layer(png_path, masked_vals, xs, ys, ctx["grid"], job["variable"], stats["min"], stats["max"])
+
+    def write_xyz_tiles(counts):
+        tiles = export_xyz_tiles(tile_dir(outdir, {**job, "method": ctx["method"], "grid": ctx["grid"]}),
+                                 masked_vals, xs, ys, ctx["grid"], job["variable"], ctx["tiles"],
+                                 stats["min"], stats["max"])
+        counts["tiles"] = tiles.pop("tile_count")
+        return tiles
+
+    def write_zonal_stats(counts):
+        communes = zonal_stats(masked_vals, ctx["zones"])
+        counts["communes"] = len(communes)
+        return {"communes": communes}
+
+    outputs = [("stats", {"cells": valid}, write_stats), ("geotiff", {"cells": cells}, write_layer_geotiff)]
+    if variance_path:
+        outputs.append(("variance_geotiff", {"cells": int(variance.size)}, write_variance))
+    if raster_path:
+        outputs.append(("raster", {"cells": cells}, write_raster))
+    if geojson_path:
+        outputs.append(("geojson", {"features": valid}, write_geojson))
+    outputs.append(("png", {"cells": cells}, write_png))
+    if ctx["tiles"]:
+        outputs.append(("xyz_tiles", {}, write_xyz_tiles))
+    if ctx["zones"]:
+        outputs.append(("zonal_stats", {}, write_zonal_stats))
 
     record = {
-        "variable": args.variable,
-        "period": period_value,
-        "period_type": period_type,
-        "method": args.method,
-        "grid": args.grid,
+        "variable": job["variable"],
+        "period": job["period"],
+        "period_type": job["period_type"],
+        "method": ctx["method"],
+        "grid": ctx["grid"],
         "stats": stats,
-        "geojson": str(geojson_path).replace("\\", "/"),
+        "communes": None,
+        "raster": str(raster_path).replace("\\", "/") if raster_path else None,
+        "geojson": str(geojson_path).replace("\\", "/") if geojson_path else None,
         "geotiff": str(geotiff_path).replace("\\", "/"),
-        "png": str(png_path).replace("\\", "/")
+        "variance": str(variance_path).replace("\\", "/") if variance_path else None,
+        "png": str(png_path).replace("\\", "/"),
+        "cache_key": job.get("cache_key")
     }
-    update_index(outdir / "index.json", record)
-    print("Done:", record)
+    return record, outputs, partial(finish_layer_profile, path=outdir / f"{stem}_profile.json")
+
+
+def wgs84_transformer():
+    # pyproj transformers are not shared between the export writer threads.
+    if not hasattr(EXPORT_LOCAL, "transformer"):
+        EXPORT_LOCAL.transformer = Transformer.from_crs("EPSG:2154", "EPSG:4326", always_xy=True)
+    return EXPORT_LOCAL.transformer
+
+
+def interpolate_layer(job, profiler):
+    # Masked grid (and kriging variance, or None) of one layer.
+    ctx = WORKER_CONTEXT
+    grid_x, grid_y = ctx["grid_x"], ctx["grid_y"]
+    values = np.asarray(job["values"], dtype=float)
+    present = ~np.isnan(values)
+    masked_vals = np.full(grid_x.shape, np.nan)
+    if ctx["method"] == "idw":
+        with profiler.stage("interpolation", stations=int(present.sum()), cells=int(ctx["mask"].sum())):
+            masked_vals[ctx["mask"]] = apply_weights(ctx["weights"], values)
+        return masked_vals, None
+
+    with profiler.stage("interpolation", stations=int(present.sum()), cells=int(grid_x.size)):
+        grid_vals, grid_var = kriging_interpolate(ctx["station_xy"][present], values[present], (grid_x, grid_y))
+        masked_vals = np.where(ctx["mask"], grid_vals, np.nan)
+    return masked_vals, np.where(ctx["mask"], grid_var, np.nan)
+
+
+def run_layer(job):
+    # --tile-size: the grid is streamed tile by tile to its GeoTIFF, outside the export pipeline.
+    return run_tiled_layer(job, StageProfiler(WORKER_CONTEXT["profile"]))
+
+
+def run_layer_batch(batch):
+    # Layers of one variable and month. Each finished grid goes to the export pipeline, whose writer threads
+    # write it while the next layer is interpolated; a layer that fails (computation or outputs) comes back as
+    # its own failure, the other layers of the batch are still returned.
+    ctx = WORKER_CONTEXT
+    mask = ctx["mask"]
+    jobs = batch["jobs"]
+    with ExportPipeline(ctx["export_writers"], ctx["export_queue"]) as pipeline:
+        if ctx["method"] == "idw" or ctx["kriging_engine"] != "native":
+            for job in jobs:
+                profiler = StageProfiler(ctx["profile"])
+                try:
+                    masked_vals, variance = interpolate_layer(job, profiler)
+                    layer = export_layer(job, masked_vals, variance)
+                except Exception as exc:
+                    pipeline.fail(job, exc)
+                    continue
+                pipeline.submit(job, *layer, profiler)
+        else:
+            # Native kriging: every layer of the batch shares the cached distances, layers with the same
+            # variogram and stations share one solve.
+            batch_profiler = StageProfiler(ctx["profile"])
+            values = np.column_stack([np.asarray(job["values"], dtype=float) for job in jobs])
+            try:
+                with batch_profiler.stage("interpolation", layers=len(jobs), stations=int(values.shape[0]),
+                                          cells=int(mask.sum())):
+                    estimates, variances = krige_layers(ctx["station_xy"], ctx["distances"], values,
+                                                        [job["variogram"] for job in jobs])
+            except Exception as exc:
+                for job in jobs:
+                    pipeline.fail(job, exc)
+                jobs = []
+            for idx, job in enumerate(jobs):
+                # Each layer profile starts with the batch solve; copies after the first are flagged so that
+                # aggregate_stages() counts the solve once.
+                profiler = StageProfiler(ctx["profile"])
+                profiler.stages = [dict(entry, shared=True) if idx else entry for entry in batch_profiler.stages]
+                masked_vals = np.full(mask.shape, np.nan)
+                masked_var = np.full(mask.shape, np.nan)
+                masked_vals[mask] = estimates[:, idx]
+                masked_var[mask] = variances[:, idx]
+                try:
+                    layer = export_layer(job, masked_vals, masked_var)
+                except Exception as exc:
+                    pipeline.fail(job, exc)
+                    continue
+                pipeline.submit(job, *layer, profiler)
+    return {"records": pipeline.records, "failures": pipeline.failures}
+
+
+def run_series_chunk(chunk):
+    ctx = WORKER_CONTEXT
+    profiler = StageProfiler(ctx["profile"])
+    grid_x, grid_y, mask = ctx["grid_x"], ctx["grid_y"], ctx["mask"]
+    jobs = chunk["jobs"]
+    stack = np.full((len(jobs), *mask.shape), np.nan)
+    with profiler.stage("interpolation", layers=len(jobs), cells=int(mask.sum())):
+        if ctx["method"] == "idw":
+            for step, job in enumerate(jobs):
+                stack[step][mask] = apply_weights(ctx["weights"], np.asarray(job["values"], dtype=float))
+        elif ctx["kriging_engine"] == "native":
+            values = np.column_stack([np.asarray(job["values"], dtype=float) for job in jobs])
+            estimates, _ = krige_layers(ctx["station_xy"], ctx["distances"], values,
+                                        [job["variogram"] for job in jobs])
+            for step in range(len(jobs)):
+                stack[step][mask] = estimates[:, step]
+        else:
+            for step, job in enumerate(jobs):
+                values = np.asarray(job["values"], dtype=float)
+                present = ~np.isnan(values)
+                grid_vals, _ = kriging_interpolate(ctx["station_xy"][present], values[present], (grid_x, grid_y))
+                stack[step] = np.where(mask, grid_vals, np.nan)
+    with profiler.stage("encode", cells=int(stack.size)) as counts:
+        payload, encoding_info = encode_chunk(stack, ctx["encoding"], ctx["compress"])
+        counts["bytes"] = len(payload)
+    result = {
+        "variable": chunk["variable"],
+        "period_type": chunk["period_type"],
+        "index": chunk["index"],
+        "periods": [job["period"] for job in jobs],
+        "stats": step_stats(stack),
+        "payload": payload,
+        **encoding_info
+    }
+    if profiler.enabled:
+        result["profile"] = profiler.stages
+    return result
+
+
+def export_series_geotiff(path, header, parts, xs, ys, resolution, args):
+    # Time as bands (band description = period); values as stored in the series (--encoding float32 for exact ones).
+    if rasterio is None:
+        print("rasterio not available, skipping the series GeoTIFF.")
+        return None
+    with open_staging_geotiff(path, len(ys), len(xs), raster_transform(xs, ys, resolution), header["crs"],
+                              args.geotiff_compress, count=len(header["periods"])) as dst:
+        for part, chunk in zip(parts, header["chunks"]):
+            values = decode_chunk(part["payload"], header, chunk)
+            for step, grid in enumerate(values):
+                band = chunk["start"] + step + 1
+                dst.write(grid[::-1].astype(np.float32), band)
+                dst.set_band_description(band, header["periods"][band - 1])
+        dst.update_tags(periods=",".join(header["periods"]))
+    return finish_geotiff(path, args.geotiff, args.geotiff_compress, args.geotiff_encoding)
+
+
+def save_series(outdir, chunks, results, grid_x, grid_y, args):
+    def series_path(variable, period_type):
+        return outdir / f"{layer_stem(variable, period_type, args.method, args.grid)}_series.json"
+
+    xs, ys = grid_x[0, :], grid_y[:, 0]
+    records = []
+    for (variable, period_type), path, parts, header in write_series_groups(
+            chunks, results, series_path, xs, ys, args.grid, args.encoding, not args.no_gzip):
+        geotiff_path = export_series_geotiff(path.with_name(path.name.replace(".json", ".tif")), header, parts,
+                                             xs, ys, args.grid, args)
+        records.append({
+            "variable": variable,
+            "period": series_period(period_type),
+            "period_type": period_type,
+            "method": args.method,
+            "grid": args.grid,
+            "periods": [header["periods"][0], header["periods"][-1]],
+            "steps": len(header["periods"]),
+            "stats": header["stats"],
+            "communes": None,
+            "raster": None,
+            "geojson": None,
+            "geotiff": str(geotiff_path).replace("\\", "/") if geotiff_path else None,
+            "variance": None,
+            "png": None,
+            "series": str(path).replace("\\", "/"),
+            "cache_key": None
+        })
+    return records
+
+
+def layer_month(job):
+    return job["period"] if job["period_type"] == "month" else f"{job['period'][:4]}-{job['period'][4:6]}"
+
+
+def fit_variograms(jobs, station_xy, mode):
+    # One linear variogram per layer, or one per (variable, month) pooled over the month's layers.
+    groups = {}
+    for idx, job in enumerate(jobs):
+        key = (job["variable"], layer_month(job)) if mode == "month" else idx
+        groups.setdefault(key, []).append(job)
+    for group in groups.values():
+        slope, nugget = fit_linear_variogram(station_xy, np.column_stack([job["values"] for job in group]))
+        for job in group:
+            job["variogram"] = [slope, nugget]
+
+
+def layer_batches(jobs):
+    batches = {}
+    for job in jobs:
+        batches.setdefault((job["variable"], layer_month(job)), []).append(job)
+    return [{"variable": variable, "period": month, "jobs": group} for (variable, month), group in batches.items()]
+
+
+def write_run_profile(profiler, args, outdir, records, failures, profiled):
+    # Run stages of this process plus the per-stage aggregate of the layer (or series chunk) profiles,
+    # measured in the workers.
+    layer_profiles = [item["profile"] for item in profiled if "profile" in item]
+    report = profiler.report(script="interpolate_surface", args=vars(args), layers=len(records),
+                             failures=len(failures), layer_stages=aggregate_stages(layer_profiles))
+    print(f"Profile: {write_profile(run_profile_path(outdir, 'interpolate_surface'), report)}")
+
+
+def main():
+    args = parse_args()
+    profiler = StageProfiler(args.profile or args.profile_index)
+    with profiler.stage("load_input") as counts:
+        if args.store:
+            start, end = date_range(args.periods or [args.date or args.month])
+            variables = VARIABLES if args.all or not args.variable else [args.variable]
+            source = load_store(args.store, variables, args.date_from or start, args.date_to or end)
+            dates = source["dates"]
+            select = partial(cube_station_values, source)
+        elif args.cube:
+            source = load_cube(args.cube)
+            dates = source["dates"]
+            select = partial(cube_station_values, source)
+        else:
+            source = load_meteo_json(args.input)
+            dates = available_dates(source)
+            select = partial(select_station_values, source)
+        counts["dates"] = len(dates)
+    requested = resolve_jobs(args, dates)
+    batch = args.all or bool(args.periods)
+    if args.series and (not batch or args.tile_size):
+        raise SystemExit("--series needs a batch run (--all or --periods) and does not support --tile-size.")
+    if args.geotiff_encoding == "int16" and (args.series or args.tile_size):
+        raise SystemExit("--geotiff-encoding int16 is not available with --tile-size / --series (streamed GeoTIFFs).")
+
+    with profiler.stage("station_axis") as counts:
+        transformer = Transformer.from_crs("EPSG:4326", "EPSG:2154", always_xy=True)
+        names, station_xy = station_axis(source, transformer)
+        station_index = {name: idx for idx, name in enumerate(names)}
+        counts["stations"] = len(names)
+    jobs = []
+    with profiler.stage("select_stations", requested=len(requested)) as counts:
+        for variable, period_type, period_value in requested:
+            stations = select(variable, period_type, period_value)
+            if not stations:
+                if not batch:
+                    raise SystemExit("No stations with data for this period/variable.")
+                print(f"Skipped: {variable} {period_value} (no stations with data)")
+                continue
+            values = np.full(len(names), np.nan)
+            for p in stations:
+                values[station_index[p["name"]]] = p["value"]
+            jobs.append({"variable": variable, "period_type": period_type, "period": period_value, "values": values})
+        counts["layers"] = len(jobs)
+
+    outdir = Path(args.outdir)
+    outdir.mkdir(parents=True, exist_ok=True)
+    settings = {"outdir": str(outdir), "method": args.method, "power": args.power, "grid": args.grid,
+                "cache_dir": args.cache_dir, "neighbors": args.neighbors, "radius": args.radius,
+                "tile_size": args.tile_size, "departement": args.departement, "format": args.format,
+                "encoding": args.encoding, "compress": not args.no_gzip,
+                "kriging_engine": args.kriging_engine, "variogram": args.variogram, "communes": args.communes,
+                "tiles": args.tiles, "geotiff_profile": args.geotiff, "geotiff_compress": args.geotiff_compress,
+                "geotiff_encoding": args.geotiff_encoding, "export_writers": args.export_writers,
+                "export_queue": args.export_queue, "profile": profiler.enabled}
+    native_kriging = args.method == "kriging" and args.kriging_engine == "native"
+    if native_kriging:
+        with profiler.stage("variogram_fit", layers=len(jobs)):
+            fit_variograms(jobs, station_xy, args.variogram)
+
+    with profiler.stage("load_departement"):
+        geom, bounds = load_department_mask(args.departement)
+    restored, unchanged = [], 0
+    # The layer cache holds finished single layers; a series is rebuilt as a whole.
+    layer_cache = bool(args.cache_dir) and args.layer_cache_mb > 0 and not args.series
+    if layer_cache:
+        with profiler.stage("layer_cache_lookup", layers=len(jobs)) as counts:
+            communes_hash = file_hash(settings["communes"]) if settings["communes"] else None
+            jobs, restored, unchanged = cached_jobs(jobs, outdir, args.cache_dir, station_xy, geometry_hash(geom),
+                                                    communes_hash, settings, args.force)
+            counts.update(unchanged=unchanged, restored=len(restored))
+        if restored or unchanged:
+            print(f"Layer cache: {unchanged} unchanged, {len(restored)} restored, {len(jobs)} to compute.")
+        if not jobs:
+            if restored:
+                update_index(outdir, restored, INDEX_KEY)
+            if profiler.enabled:
+                write_run_profile(profiler, args, outdir, restored, [], restored)
+            return
+
+    with profiler.stage("grid_mask") as counts:
+        if args.tile_size:
+            xs, ys = grid_axes(bounds, args.grid)
+            mask = None
+            if args.cache_dir:
+                mask = str(build_tiled_mask(geom, xs, ys, bounds, args.grid, args.cache_dir, args.tile_size))
+            counts["cells"] = len(xs) * len(ys)
+        else:
+            grid_x, grid_y = build_grid(bounds, args.grid)
+            mask = build_mask(grid_x, grid_y, geom, bounds, args.grid, args.max_points, args.cache_dir)
+            counts.update(cells=int(grid_x.size), masked_cells=int(mask.sum()))
+    if not args.tile_size and args.cache_dir:
+        with profiler.stage("precompute", stations=len(names)):
+            if args.method == "idw":
+                load_or_build_weights(station_xy, grid_x[mask], grid_y[mask], args.power, args.cache_dir,
+                                      args.neighbors, args.radius)
+            elif native_kriging:
+                load_or_build_distances(station_xy, grid_x[mask], grid_y[mask], args.cache_dir)
+            if args.communes:
+                load_or_build_zones(args.communes, grid_x, grid_y, bounds, args.grid, args.cache_dir)
+
+    workers = args.workers if batch else 1
+    initargs = (settings, bounds, mask, station_xy)
+    if args.series:
+        chunks = series_chunks(jobs, args.series_chunk)
+        with profiler.stage("series_chunks", layers=len(jobs), chunks=len(chunks), workers=workers) as counts:
+            results, failures = run_jobs(chunks, run_series_chunk, init_worker, initargs, workers)
+            counts["failures"] = len(failures)
+        with profiler.stage("write_series") as counts:
+            records = save_series(outdir, chunks, results, grid_x, grid_y, args)
+            counts["series"] = len(records)
+    else:
+        with profiler.stage("layers", layers=len(jobs), workers=workers, writers=args.export_writers) as counts:
+            if args.tile_size:
+                records, failures = run_jobs(jobs, run_layer, init_worker, initargs, workers)
+            else:
+                results, failures = run_jobs(layer_batches(jobs), run_layer_batch, init_worker, initargs, workers)
+                records = [record for result in results for record in result["records"]]
+                failures += [failure for result in results for failure in result["failures"]]
+            counts["failures"] = len(failures)
+    if layer_cache:
+        with profiler.stage("layer_cache_store", layers=len(records)):
+            for record in records:
+                entry = {key: value for key, value in record.items() if key != "profile"}
+                store_layer(args.cache_dir, record["cache_key"], entry, layer_files(record, outdir))
+            evict_layers(args.cache_dir, args.layer_cache_mb * 1024 * 1024)
+    records += restored
+    if profiler.enabled:
+        write_run_profile(profiler, args, outdir, records, failures, results if args.series else records)
+    if not args.profile_index:
+        for record in records:
+            record.pop("profile", None)
+    if records:
+        update_index(outdir, records, INDEX_KEY)
+    if batch:
+        print(f"Done: {len(records)} {'series' if args.series else 'layers'}, {len(failures)} failed.")
+    elif records:
+        print("Done:", records[0])
+    if failures:
+        raise SystemExit(1)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Native ordinary kriging (linear variogram) batched over many layers.
+The station -> cell distances only depend on the geometry, so they are cached on disk like the IDW weights.
+The kriging system is tiny (stations + 1): it is solved once per (variogram, stations with data) and the
+resulting (cells x stations) operator is applied to every layer sharing them, together with the kriging
+variance. The variogram fit follows pykrige (binned semivariogram, soft-L1 least squares, nlags=6).
+"""
+
+import hashlib
+import os
+from pathlib import Path
+
+import numpy as np
+
+try:
+    from scipy.optimize import least_squares
+except ImportError:
+    least_squares = None
+
+
+def pair_distances(station_xy):
+    coords = np.asarray(station_xy, dtype=float)
+    return np.hypot(coords[:, None, 0] - coords[None, :, 0], coords[:, None, 1] - coords[None, :, 1])
+
+
+def experimental_variogram(station_xy, values, nlags=6):
+    # values: (stations,) or (stations, layers); pairs are pooled over the layers.
+    vals = np.asarray(values, dtype=float)
+    if vals.ndim == 1:
+        vals = vals[:, None]
+    dist = pair_distances(station_xy)
+    upper = np.triu_indices(dist.shape[0], k=1)
+    lags, gammas = [], []
+    for column in vals.T:
+        both = ~np.isnan(column[upper[0]]) & ~np.isnan(column[upper[1]])
+        lags.append(dist[upper][both])
+        gammas.append(0.5 * (column[upper[0]][both] - column[upper[1]][both]) ** 2)
+    lags, gammas = np.concatenate(lags), np.concatenate(gammas)
+    if lags.size < 2:
+        return np.array([]), np.array([])
+
+    dmin, dmax = lags.min(), lags.max()
+    edges = [dmin + n * (dmax - dmin) / nlags for n in range(nlags)] + [dmax + 0.001]
+    bin_lags, bin_gammas = [], []
+    for low, high in zip(edges[:-1], edges[1:]):
+        inside = (lags >= low) & (lags < high)
+        if inside.any():
+            bin_lags.append(lags[inside].mean())
+            bin_gammas.append(gammas[inside].mean())
+    return np.array(bin_lags), np.array(bin_gammas)
+
+
+def fit_linear_variogram(station_xy, values, nlags=6):
+    lags, gammas = experimental_variogram(station_xy, values, nlags)
+    if lags.size < 2 or np.ptp(lags) == 0:
+        return 0.0, float(gammas.mean()) if gammas.size else 0.0
+    x0 = [(gammas.max() - gammas.min()) / (lags.max() - lags.min()), gammas.min()]
+    if least_squares is not None:
+        result = least_squares(lambda p: p[0] * lags + p[1] - gammas, x0,
+                               bounds=([0.0, 0.0], [np.inf, max(gammas.max(), 1e-12)]), loss="soft_l1")
+        return float(result.x[0]), float(result.x[1])
+    slope, nugget = np.polyfit(lags, gammas, 1)
+    if nugget < 0:
+        slope, nugget = float(np.sum(lags * gammas) / np.sum(lags * lags)), 0.0
+    return max(float(slope), 0.0), float(np.clip(nugget, 0.0, gammas.max()))
+
+
+def build_distances(station_xy, cell_x, cell_y, chunk=10000):
+    coords = np.asarray(station_xy, dtype=float)
+    cell_x = np.asarray(cell_x, dtype=float).ravel()
+    cell_y = np.asarray(cell_y, dtype=float).ravel()
+    dist = np.empty((cell_x.size, coords.shape[0]), dtype=float)
+    for start in range(0, cell_x.size, chunk):
+        end = min(start + chunk, cell_x.size)
+        dist[start:end] = np.hypot(cell_x[start:end, None] - coords[:, 0], cell_y[start:end, None] - coords[:, 1])
+    return dist
+
+
+def distances_key(station_xy, cell_x, cell_y):
+    digest = hashlib.sha1()
+    digest.update(np.ascontiguousarray(station_xy, dtype=float).tobytes())
+    digest.update(np.ascontiguousarray(cell_x, dtype=float).tobytes())
+    digest.update(np.ascontiguousarray(cell_y, dtype=float).tobytes())
+    return digest.hexdigest()[:20]
+
+
+def load_or_build_distances(station_xy, cell_x, cell_y, cache_dir=None):
+    if not cache_dir:
+        return build_distances(station_xy, cell_x, cell_y)
+
+    cache_dir = Path(cache_dir)
+    path = cache_dir / f"krig_dist_{distances_key(station_xy, cell_x, cell_y)}.npy"
+    expected = (np.asarray(cell_x).size, len(station_xy))
+    if path.exists():
+        try:
+            dist = np.load(path, mmap_mode="r")
+        except (OSError, ValueError):
+            dist = None
+        if dist is not None and dist.shape == expected:
+            return dist
+
+    dist = build_distances(station_xy, cell_x, cell_y)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f"{path.stem}.{os.getpid()}.tmp.npy")
+    np.save(tmp_path, dist)
+    os.replace(tmp_path, path)
+    return dist
+
+
+def linear_variogram(dist, slope, nugget):
+    return np.where(dist > 0, nugget + slope * dist, 0.0)
+
+
+def kriging_operator(station_xy, distances, variogram, present):
+    # Returns (cells x present stations) weights and the kriging variance of each cell.
+    slope, nugget = variogram
+    flat = not (slope or nugget)
+    if flat:
+        # Constant field: any valid variogram gives the same weights, the variance is zero.
+        slope = 1.0
+    idx = np.flatnonzero(present)
+    n = idx.size
+    system = np.zeros((n + 1, n + 1))
+    system[:n, :n] = linear_variogram(pair_distances(np.asarray(station_xy)[idx]), slope, nugget)
+    system[:n, n] = 1.0
+    system[n, :n] = 1.0
+    rhs = np.ones((distances.shape[0], n + 1))
+    rhs[:, :n] = linear_variogram(np.asarray(distances)[:, idx], slope, nugget)
+    solution = np.linalg.solve(system, rhs.T).T
+    variance = np.sum(solution * rhs, axis=1)
+    if flat:
+        variance[:] = 0.0
+    return solution[:, :n], variance
+
+
+def krige_layers(station_xy, distances, values, variograms):
+    # values: (stations, layers) with NaN for missing stations; variograms: one (slope, nugget) per layer.
+    vals = np.asarray(values, dtype=float)
+    if vals.ndim == 1:
+        vals = vals[:, None]
+    estimates = np.full((distances.shape[0], vals.shape[1]), np.nan)
+    variances = np.full_like(estimates, np.nan)
+    groups = {}
+    for layer, variogram in enumerate(variograms):
+        present = ~np.isnan(vals[:, layer])
+        if present.any():
+            key = (float(variogram[0]), float(variogram[1]), present.tobytes())
+            groups.setdefault(key, (present, []))[1].append(layer)
+
+    for (slope, nugget, _), (present, layers) in groups.items():
+        weights, variance = kriging_operator(station_xy, distances, (slope, nugget), present)
+        estimates[:, layers] = weights @ vals[present][:, layers]
+        variances[:, layers] = variance[:, None]
+    return estimates, variances
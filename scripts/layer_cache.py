@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Content-addressed cache of finished interpolation layers.
+A layer key hashes everything that shapes its outputs: the station values selected for the period
+(with the station positions), variable, period, method, grid, power, department geometry, commune file
+content and export options. Each entry keeps a copy of the layer files + its index record under <cache_dir>/layers/<key>/
+and entries are evicted least-recently-used once the cache grows past its size limit.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+from pathlib import Path
+
+import numpy as np
+
+
+KEY_SETTINGS = ["method", "grid", "power", "neighbors", "radius", "tile_size", "format", "encoding", "compress",
+                "kriging_engine", "variogram", "tiles", "geotiff_profile", "geotiff_compress",
+                "geotiff_encoding"]
+PATH_FIELDS = ["raster", "geojson", "geotiff", "variance", "png"]
+
+
+def layer_key(job, station_xy, geom_hash, communes_hash, settings):
+    digest = hashlib.sha1()
+    digest.update(np.ascontiguousarray(station_xy, dtype=float).tobytes())
+    digest.update(np.ascontiguousarray(job["values"], dtype=float).tobytes())
+    params = {name: settings.get(name) for name in KEY_SETTINGS}
+    # Input files by content (a file rebuilt at the same path gives new keys), like the department geometry.
+    params.update({"variable": job["variable"], "period": job["period"], "geometry": geom_hash,
+                   "communes": communes_hash, "variogram_fit": job.get("variogram")})
+    digest.update(json.dumps(params, sort_keys=True).encode("utf-8"))
+    return digest.hexdigest()[:24]
+
+
+def entry_dir(cache_dir, key):
+    return Path(cache_dir) / "layers" / key
+
+
+def lookup_layer(cache_dir, key):
+    record_path = entry_dir(cache_dir, key) / "record.json"
+    try:
+        with open(record_path, "r", encoding="utf-8") as f:
+            entry = json.load(f)
+    except (OSError, ValueError):
+        return None
+    os.utime(record_path.parent)
+    return entry
+
+
+def restore_layer(cache_dir, key, entry, outdir):
+    # Copies the cached files back into outdir and rewrites the record paths accordingly.
+    source = entry_dir(cache_dir, key)
+    outdir = Path(outdir)
+    for name in entry["files"]:
+        shutil.copy2(source / name, outdir / name)
+    record = dict(entry["record"])
+    for field, name in entry["paths"].items():
+        record[field] = str(outdir / name).replace("\\", "/")
+    return record
+
+
+def store_layer(cache_dir, key, record, files):
+    target = entry_dir(cache_dir, key)
+    tmp_dir = target.with_name(f"{key}.{os.getpid()}.tmp")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir(parents=True)
+    existing = [Path(path) for path in files if path and Path(path).exists()]
+    for path in existing:
+        shutil.copy2(path, tmp_dir / path.name)
+    entry = {
+        "record": record,
+        "files": [path.name for path in existing],
+        "paths": {field: Path(record[field]).name for field in PATH_FIELDS
+                  if record.get(field) and Path(record[field]) in existing}
+    }
+    with open(tmp_dir / "record.json", "w", encoding="utf-8") as f:
+        json.dump(entry, f, ensure_ascii=False)
+    shutil.rmtree(target, ignore_errors=True)
+    os.replace(tmp_dir, target)
+
+
+def entry_size(path):
+    return sum(item.stat().st_size for item in path.iterdir() if item.is_file())
+
+
+def evict_layers(cache_dir, max_bytes):
+    root = Path(cache_dir) / "layers"
+    if not root.exists():
+        return []
+    entries = sorted((p for p in root.iterdir() if p.is_dir() and not p.name.endswith(".tmp")),
+                     key=lambda p: p.stat().st_mtime)
+    sizes = {p: entry_size(p) for p in entries}
+    total = sum(sizes.values())
+    evicted = []
+    for path in entries:
+        if total <= max_bytes:
+            break
+        shutil.rmtree(path, ignore_errors=True)
+        total -= sizes[path]
+        evicted.append(path.name)
+    return evicted
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Layer index shared by the interpolation scripts, safe for concurrent runs.
+Writers drop one record file per layer under <outdir>/index.d/ (atomic rename, no lock needed).
+Compaction merges them into index.json under an exclusive lock: layers sorted by
+(variable, period_type, period) plus a lookup table of row ranges per variable / period type.
+
+Standalone compaction: python scripts/layer_index.py outputs/spatial --key variable period period_type
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+INDEX_NAME = "index.json"
+PENDING_DIR = "index.d"
+LOCK_NAME = "index.lock"
+
+
+def record_key(record, key_fields):
+    return tuple(str(record.get(field)) for field in key_fields)
+
+
+def write_record(outdir, record, key_fields):
+    pending = Path(outdir) / PENDING_DIR
+    pending.mkdir(parents=True, exist_ok=True)
+    name = hashlib.sha1("|".join(record_key(record, key_fields)).encode("utf-8")).hexdigest()[:20]
+    path = pending / f"{name}.json"
+    tmp_path = pending / f".{name}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(record, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+    return path
+
+
+@contextmanager
+def index_lock(outdir, timeout=120):
+    path = Path(outdir) / LOCK_NAME
+    if fcntl is not None:
+        with open(path, "a+") as handle:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+        return
+
+    # No flock (Windows): exclusive creation of the lock file.
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            if time.monotonic() > deadline:
+                raise SystemExit(f"Index lock busy: {path} (remove it if no run is active).")
+            time.sleep(0.1)
+    try:
+        yield
+    finally:
+        os.close(fd)
+        os.remove(path)
+
+
+def load_index(outdir):
+    path = Path(outdir) / INDEX_NAME
+    if path.exists():
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return {"layers": []}
+
+
+def build_lookup(layers):
+    lookup = {}
+    for row, record in enumerate(layers):
+        period_types = lookup.setdefault(record["variable"], {})
+        start, _ = period_types.get(record.get("period_type"), (row, row))
+        period_types[record.get("period_type")] = [start, row + 1]
+    return lookup
+
+
+def compact_index(outdir, key_fields):
+    outdir = Path(outdir)
+    pending = outdir / PENDING_DIR
+    outdir.mkdir(parents=True, exist_ok=True)
+    with index_lock(outdir):
+        index = load_index(outdir)
+        layers = {record_key(record, key_fields): record for record in index["layers"]}
+
+        # Claims left over by an interrupted compaction are older than the pending records.
+        claimed = sorted(pending.glob("*.merging"), key=lambda p: p.stat().st_mtime) if pending.exists() else []
+        for path in sorted(pending.glob("*.json"), key=lambda p: p.stat().st_mtime) if pending.exists() else []:
+            claim = path.with_name(f"{path.stem}.{os.getpid()}.merging")
+            try:
+                os.replace(path, claim)
+            except FileNotFoundError:
+                continue
+            claimed.append(claim)
+        for claim in claimed:
+            with open(claim, "r", encoding="utf-8") as f:
+                record = json.load(f)
+            layers[record_key(record, key_fields)] = record
+
+        ordered = sorted(layers.values(), key=lambda r: (r["variable"], str(r.get("period_type")), r["period"],
+                                                          record_key(r, key_fields)))
+        index = {"layers": ordered, "lookup": build_lookup(ordered)}
+        tmp_path = outdir / f".{INDEX_NAME}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(index, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, outdir / INDEX_NAME)
+        for claim in claimed:
+            claim.unlink()
+    return index
+
+
+def update_index(outdir, records, key_fields):
+    for record in records:
+        write_record(outdir, record, key_fields)
+    return compact_index(outdir, key_fields)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compact the pending layer records into index.json.")
+    parser.add_argument("outdir", help="Layer output folder (outputs/spatial, outputs/interpolation)")
+    parser.add_argument("--key", nargs="+", default=["variable", "period", "period_type"],
+                        help="Record fields identifying a layer")
+    args = parser.parse_args()
+    index = compact_index(args.outdir, args.key)
+    print(f"{Path(args.outdir) / INDEX_NAME}: {len(index['layers'])} layers")
+
+
+if __name__ == "__main__":
+    main()
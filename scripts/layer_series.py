@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Time-series layer cube (--series): one file pair per variable / period type instead of one file set per layer.
+The header (JSON) holds the grid georeference, the period coordinate array, per-step stats and a chunk table;
+the payload is the stack of masked grids, time-major (step, row, col), north-up like raster_layer.py.
+Steps are grouped in chunks of --series-chunk periods, each encoded (uint16 with its own scale / offset,
+or float32) and gzip-compressed on its own, so one day or a time slice is read with a seek (or an HTTP
+Range request in the dashboard) over the chunks it overlaps only.
+"""
+
+import gzip
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+from raster_layer import UINT16_NODATA
+
+
+SERIES_FORMAT = "meteo-series"
+SERIES_VERSION = 1
+
+
+def series_chunks(jobs, chunk_steps):
+    # Jobs grouped per (variable, period_type), sorted by period and cut in runs of chunk_steps periods.
+    groups = {}
+    for job in jobs:
+        groups.setdefault((job["variable"], job["period_type"]), []).append(job)
+    chunks = []
+    for (variable, period_type), group in sorted(groups.items()):
+        group.sort(key=lambda job: job["period"])
+        for index, start in enumerate(range(0, len(group), chunk_steps)):
+            chunks.append({"variable": variable, "period_type": period_type, "index": index,
+                           "jobs": group[start:start + chunk_steps]})
+    return chunks
+
+
+def step_stats(stack):
+    stats = []
+    for grid in stack:
+        valid = grid[~np.isnan(grid)]
+        stats.append([float(valid.min()), float(valid.max()), float(valid.mean())] if valid.size else None)
+    return stats
+
+
+def encode_chunk(stack, encoding="uint16", compress=True):
+    # stack: (steps, rows south -> north, cols) -> compressed bytes + encoding fields of the chunk table.
+    data = np.asarray(stack, dtype=float)[:, ::-1]
+    valid = ~np.isnan(data)
+    if encoding == "float32":
+        payload, info = data.astype("<f4").tobytes(), {"scale": 1.0, "offset": 0.0}
+    else:
+        vmin = float(data[valid].min()) if valid.any() else 0.0
+        vmax = float(data[valid].max()) if valid.any() else 0.0
+        scale = (vmax - vmin) / (UINT16_NODATA - 1) or 1.0
+        quantized = np.full(data.shape, UINT16_NODATA, dtype="<u2")
+        quantized[valid] = np.rint((data[valid] - vmin) / scale).astype("<u2")
+        payload, info = quantized.tobytes(), {"scale": scale, "offset": vmin}
+    if compress:
+        payload = gzip.compress(payload, compresslevel=6, mtime=0)
+    return payload, info
+
+
+def decode_chunk(payload, header, chunk):
+    # Inverse of encode_chunk, returns (steps, rows south -> north, cols).
+    rows, cols = header["shape"]
+    if header.get("compression") == "gzip":
+        payload = gzip.decompress(payload)
+    if header["dtype"] == "float32":
+        values = np.frombuffer(payload, dtype="<f4").astype(float)
+    else:
+        data = np.frombuffer(payload, dtype="<u2")
+        values = np.where(data == header["nodata"], np.nan, chunk["offset"] + data * chunk["scale"])
+    return values.reshape(chunk["count"], rows, cols)[:, ::-1]
+
+
+def series_period(period_type):
+    # Index period of a series record: one record per variable / period type, sorted after the dated layers.
+    return f"series-{period_type}"
+
+
+def write_series(path, chunks, xs, ys, resolution, crs="EPSG:2154", encoding="uint16", compress=True):
+    # chunks: worker results ({"periods", "payload", "scale", "offset", "stats"}) in time order.
+    header_path = Path(path)
+    data_name = header_path.name.replace(".json", ".bin") + (".gz" if compress else "")
+    data_path = header_path.with_name(data_name)
+    tmp_path = data_path.with_name(f".{data_name}.{os.getpid()}.tmp")
+    table, periods, stats = [], [], []
+    with open(tmp_path, "wb") as file:
+        for chunk in chunks:
+            table.append({"start": len(periods), "count": len(chunk["periods"]), "byte_offset": file.tell(),
+                          "byte_length": len(chunk["payload"]), "scale": chunk["scale"], "offset": chunk["offset"]})
+            file.write(chunk["payload"])
+            periods.extend(chunk["periods"])
+            stats.extend(chunk["stats"])
+    os.replace(tmp_path, data_path)
+
+    valid = [item for item in stats if item is not None]
+    header = {
+        "format": SERIES_FORMAT,
+        "version": SERIES_VERSION,
+        "crs": crs,
+        "origin": [float(xs[0] - resolution / 2), float(ys[-1] + resolution / 2)],
+        "resolution": float(resolution),
+        "shape": [len(ys), len(xs)],
+        "dtype": encoding,
+        "nodata": UINT16_NODATA if encoding == "uint16" else None,
+        "compression": "gzip" if compress else None,
+        "data": data_name,
+        "periods": periods,
+        "chunks": table,
+        "step_stats": stats,
+        # One colour scale for the whole series, so animated frames stay comparable.
+        "stats": {"min": min(item[0] for item in valid), "max": max(item[1] for item in valid),
+                  "mean": float(np.mean([item[2] for item in valid]))} if valid else None
+    }
+    tmp_path = header_path.with_name(f".{header_path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as file:
+        json.dump(header, file, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp_path, header_path)
+    return header
+
+
+def load_series_header(path):
+    with open(path, "r", encoding="utf-8") as file:
+        return json.load(file)
+
+
+def read_series(path, start=None, end=None):
+    # Periods in [start, end] (inclusive, same format as the header periods) -> (periods, values[step, row, col]).
+    # Only the chunks overlapping the slice are read.
+    header_path = Path(path)
+    header = load_series_header(header_path)
+    periods = header["periods"]
+    first = 0 if start is None else int(np.searchsorted(periods, start, side="left"))
+    last = len(periods) if end is None else int(np.searchsorted(periods, end, side="right"))
+    if first >= last:
+        return [], np.empty((0, *header["shape"]))
+    parts = []
+    with open(header_path.with_name(header["data"]), "rb") as file:
+        for chunk in header["chunks"]:
+            lo, hi = chunk["start"], chunk["start"] + chunk["count"]
+            if hi <= first or lo >= last:
+                continue
+            file.seek(chunk["byte_offset"])
+            values = decode_chunk(file.read(chunk["byte_length"]), header, chunk)
+            parts.append(values[max(first - lo, 0):min(last, hi) - lo])
+    return periods[first:last], np.concatenate(parts)
+
+
+def write_series_groups(chunks, results, path_for, xs, ys, resolution, encoding="uint16", compress=True):
+    # One series per (variable, period_type); a series with a failed chunk would have a gap and is not written.
+    expected = {}
+    for chunk in chunks:
+        key = (chunk["variable"], chunk["period_type"])
+        expected[key] = expected.get(key, 0) + 1
+    groups = {}
+    for result in results:
+        groups.setdefault((result["variable"], result["period_type"]), []).append(result)
+    written = []
+    for key, parts in sorted(groups.items()):
+        if len(parts) != expected[key]:
+            print(f"Series not written: {key[0]} {key[1]} ({expected[key] - len(parts)} chunk(s) failed)")
+            continue
+        parts.sort(key=lambda part: part["index"])
+        path = path_for(*key)
+        written.append((key, path, parts,
+                        write_series(path, parts, xs, ys, resolution, encoding=encoding, compress=compress)))
+    return written
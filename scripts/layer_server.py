@@ -0,0 +1,399 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Local interpolation service for the dashboard (long-running, standard library HTTP server).
+The station data, department mask, transformers and the IDW weights / kriging distances of each grid are
+loaded once and stay in memory; any (variable, day or month, method, grid) layer is computed on demand and
+kept in an LRU cache bounded by --cache-mb. Every request runs in its own thread: concurrent requests for the
+same layer wait for a single computation, and at most --workers layers are computed at once.
+The dashboard folder is served as static files next to the API (with Range requests, for the series chunks),
+so the outputs/spatial/index.json workflow keeps working; app.js adds the live layers when api/index.json
+answers.
+
+  GET api/index.json     live records: one per variable x period type, listing every period
+  GET api/layer.json     ?variable=temperature&period=20250115[&method=idw&grid=2000]: raster header
+                         (raster_layer.py format) with the layer stats and per-commune stats
+  GET api/layer.bin      same parameters: the raster payload
+  GET api/status         cache and grid counters
+
+Example: python scripts/layer_server.py --cube web/meteo_cube --port 8000, then open http://localhost:8000/
+"""
+
+import argparse
+import json
+import math
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from datetime import datetime
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlencode, urlsplit
+
+import numpy as np
+
+try:
+    from pyproj import Transformer
+except ImportError as exc:
+    raise SystemExit("Missing dependency: pyproj. Please install it in your env.") from exc
+
+from batch_runner import default_workers
+from generate_spatial_layers import VARIABLE_MAP, available_dates, list_periods, load_json, select_station_values
+from grid_mask import load_or_compute_mask
+from idw_engine import apply_weights, load_or_build_weights
+from interpolate_surface import VARIABLES, build_grid, build_stats, load_department_mask
+from kriging_engine import fit_linear_variogram, krige_layers, load_or_build_distances
+from raster_layer import raster_payload
+from station_cube import cube_station_values, load_cube, station_axis
+from station_store import load_store
+from tiled_grid import grid_shape
+from zonal_stats import load_or_build_zones, zonal_stats
+
+
+PERIOD_TYPES = ["day", "month"]
+
+
+class LayerError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="On-demand interpolation server for the dashboard.")
+    parser.add_argument("--input", default="web/meteo_data.json", help="Path to meteo_data.json")
+    parser.add_argument("--cube", help="Station cube folder from build_dashboard_csv.py (replaces --input)")
+    parser.add_argument("--store", help="Parquet station store from build_dashboard_csv.py (e.g. data/store)")
+    parser.add_argument("--from", dest="date_from", help="Store: first day YYYYMMDD")
+    parser.add_argument("--to", dest="date_to", help="Store: last day YYYYMMDD")
+    parser.add_argument("--departement", default="data/raw/departement_13.geojson",
+                        help="Department GeoJSON (EPSG:2154)")
+    parser.add_argument("--communes", default="data/raw/communes_13.geojson",
+                        help="Commune GeoJSON (EPSG:2154) for per-commune stats ('' to disable)")
+    parser.add_argument("--method", default="idw", choices=["idw", "kriging"], help="Default method of the requests")
+    parser.add_argument("--grid", type=float, default=2000, help="Default grid resolution in meters (EPSG:2154)")
+    parser.add_argument("--power", type=float, default=2.0, help="IDW power")
+    parser.add_argument("--neighbors", type=int, help="IDW: only use the k nearest stations (KD-tree)")
+    parser.add_argument("--radius", type=float, help="IDW: only use stations within this distance in meters")
+    parser.add_argument("--encoding", default="uint16", choices=["uint16", "float32"], help="Raster payload encoding")
+    parser.add_argument("--no-gzip", action="store_true", help="Do not gzip the raster payload")
+    parser.add_argument("--max-points", type=int, default=250000, help="Safety cap for grid points")
+    parser.add_argument("--cache-dir", default="outputs/cache",
+                        help="Cache folder for masks, zones and operators ('' to disable)")
+    parser.add_argument("--cache-mb", type=float, default=256, help="Memory limit of the finished-layer LRU cache")
+    parser.add_argument("--max-grids", type=int, default=3,
+                        help="Grid resolutions kept warm (mask, zones, operators), least recently used dropped first")
+    parser.add_argument("--workers", type=int, default=default_workers(), help="Layers computed at the same time")
+    parser.add_argument("--root", default=".", help="Folder served as static files (dashboard + outputs/)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    return parser.parse_args()
+
+
+def load_source(args):
+    # (source, dates, select(variable, period_type, period) -> station points), as in the batch scripts.
+    if args.store:
+        source = load_store(args.store, VARIABLES, args.date_from, args.date_to)
+        return source, source["dates"], partial(cube_station_values, source)
+    if args.cube:
+        source = load_cube(args.cube)
+        return source, source["dates"], partial(cube_station_values, source)
+    source = load_json(args.input)
+    return source, available_dates(source), partial(select_station_values, source)
+
+
+class LayerService:
+    def __init__(self, args):
+        self.args = args
+        source, dates, self.select = load_source(args)
+        to_l93 = Transformer.from_crs("EPSG:4326", "EPSG:2154", always_xy=True)
+        self.names, self.station_xy = station_axis(source, to_l93)
+        self.station_index = {name: idx for idx, name in enumerate(self.names)}
+        self.periods = {period_type: [period for _, period in list_periods(dates, period_type)]
+                        for period_type in PERIOD_TYPES}
+        self.geom, self.bounds = load_department_mask(args.departement)
+
+        self.grids = OrderedDict()
+        self.grids_lock = threading.Lock()
+        self.layers = OrderedDict()
+        self.layers_bytes = 0
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.slots = threading.BoundedSemaphore(max(1, args.workers))
+        self.hits = 0
+        self.misses = 0
+
+    def grid_context(self, grid):
+        # Mask, commune zones and operators of one grid, built once by the first request that needs them.
+        args = self.args
+        try:
+            points = math.prod(grid_shape(self.bounds, grid))
+        except OverflowError:
+            points = math.inf
+        if points > args.max_points:
+            # Checked on the axis lengths: nothing is allocated (nor any warm grid evicted) for a refused grid.
+            raise LayerError(400, f"Grid too large ({min(points, 1e300):.3g} points), see --max-points.")
+        with self.grids_lock:
+            ctx = self.grids.get(grid)
+            if ctx is None:
+                ctx = self.grids[grid] = {"lock": threading.Lock(), "mask": None, "operators": {}}
+            self.grids.move_to_end(grid)
+        with ctx["lock"]:
+            if ctx["mask"] is None:
+                try:
+                    grid_x, grid_y = build_grid(self.bounds, grid)
+                    ctx["zones"] = None
+                    if args.communes:
+                        ctx["zones"] = load_or_build_zones(args.communes, grid_x, grid_y, self.bounds, grid,
+                                                           args.cache_dir)
+                    ctx.update(grid_x=grid_x, grid_y=grid_y,
+                               mask=load_or_compute_mask(self.geom, grid_x, grid_y, self.bounds, grid, args.cache_dir))
+                except (Exception, SystemExit):
+                    # A grid that could not be built does not stay in the LRU (the next request retries).
+                    with self.grids_lock:
+                        if self.grids.get(grid) is ctx:
+                            del self.grids[grid]
+                    raise
+        with self.grids_lock:
+            # Warm grids are only evicted for a grid that is actually ready.
+            while len(self.grids) > max(1, args.max_grids):
+                self.grids.popitem(last=False)
+        return ctx
+
+    def operator(self, ctx, method):
+        with ctx["lock"]:
+            if method not in ctx["operators"]:
+                args = self.args
+                cell_x, cell_y = ctx["grid_x"][ctx["mask"]], ctx["grid_y"][ctx["mask"]]
+                if method == "idw":
+                    ctx["operators"][method] = load_or_build_weights(self.station_xy, cell_x, cell_y, args.power,
+                                                                     args.cache_dir, args.neighbors, args.radius)
+                else:
+                    ctx["operators"][method] = load_or_build_distances(self.station_xy, cell_x, cell_y, args.cache_dir)
+            return ctx["operators"][method]
+
+    def parse_request(self, query):
+        variable = query.get("variable")
+        if VARIABLE_MAP.get(variable, variable) not in VARIABLES:
+            raise LayerError(400, f"Unknown variable: {variable}")
+        period = query.get("period", "")
+        period_type = {8: "day", 7: "month"}.get(len(period))
+        try:
+            datetime.strptime(period, {"day": "%Y%m%d", "month": "%Y-%m"}[period_type])
+        except (KeyError, ValueError):
+            raise LayerError(400, "Period must be YYYYMMDD or YYYY-MM.") from None
+        method = query.get("method", self.args.method)
+        if method not in ("idw", "kriging"):
+            raise LayerError(400, f"Unknown method: {method}")
+        try:
+            grid = float(query.get("grid", self.args.grid))
+        except ValueError:
+            grid = 0.0
+        if not 0 < grid < math.inf:
+            raise LayerError(400, "Grid must be a positive resolution in meters.")
+        return variable, period_type, period, method, grid
+
+    def station_values(self, variable, period_type, period):
+        stations = self.select(VARIABLE_MAP.get(variable, variable), period_type, period)
+        if not stations:
+            raise LayerError(404, "No stations with data for this period/variable.")
+        values = np.full(len(self.names), np.nan)
+        for p in stations:
+            values[self.station_index[p["name"]]] = p["value"]
+        return values
+
+    def compute(self, variable, period_type, period, method, grid):
+        values = self.station_values(variable, period_type, period)
+        ctx = self.grid_context(grid)
+        mask = ctx["mask"]
+        masked_vals = np.full(mask.shape, np.nan)
+        if method == "idw":
+            masked_vals[mask] = apply_weights(self.operator(ctx, "idw"), values)
+        else:
+            variogram = fit_linear_variogram(self.station_xy, values)
+            estimates, _ = krige_layers(self.station_xy, self.operator(ctx, "kriging"), values, [variogram])
+            masked_vals[mask] = estimates[:, 0]
+
+        stats = build_stats(masked_vals)
+        query = urlencode({"variable": variable, "period": period, "method": method, "grid": f"{grid:g}"})
+        header, payload = raster_payload(masked_vals, ctx["grid_x"][0, :], ctx["grid_y"][:, 0], grid,
+                                         f"layer.bin?{query}", encoding=self.args.encoding,
+                                         compress=not self.args.no_gzip, stats=stats)
+        header.update({"variable": variable, "period_type": period_type, "period": period, "method": method,
+                       "grid": grid, "communes": zonal_stats(masked_vals, ctx["zones"]) if ctx["zones"] else None})
+        body = json.dumps(header, ensure_ascii=False).encode("utf-8")
+        return {"header": body, "payload": payload, "size": len(body) + len(payload)}
+
+    def layer(self, query):
+        variable, period_type, period, method, grid = self.parse_request(query)
+        # Dashboard and script variable names share the cache entries (temperature = temp_moy).
+        key = (VARIABLE_MAP.get(variable, variable), period, method, grid)
+        with self.lock:
+            entry = self.layers.get(key)
+            if entry is not None:
+                self.layers.move_to_end(key)
+                self.hits += 1
+                return entry
+            future = self.pending.get(key)
+            owner = future is None
+            if owner:
+                future = self.pending[key] = Future()
+                self.misses += 1
+        if not owner:
+            return future.result()
+
+        try:
+            with self.slots:
+                entry = self.compute(variable, period_type, period, method, grid)
+        except (Exception, SystemExit) as exc:
+            # Helpers of the batch scripts stop with SystemExit on bad input; here it fails this request only.
+            with self.lock:
+                del self.pending[key]
+            future.set_exception(exc)
+            raise
+        with self.lock:
+            del self.pending[key]
+            self.store(key, entry)
+        future.set_result(entry)
+        return entry
+
+    def store(self, key, entry):
+        limit = self.args.cache_mb * 1e6
+        if entry["size"] > limit:
+            return
+        self.layers[key] = entry
+        self.layers_bytes += entry["size"]
+        while self.layers_bytes > limit:
+            _, dropped = self.layers.popitem(last=False)
+            self.layers_bytes -= dropped["size"]
+
+    def live_index(self):
+        args = self.args
+        return {"layers": [{
+            "variable": variable,
+            "period_type": period_type,
+            "period": f"live-{period_type}",
+            "method": args.method,
+            "grid": args.grid,
+            "periods": self.periods[period_type],
+            "live": "api/layer.json"
+        } for variable in VARIABLE_MAP for period_type in PERIOD_TYPES if self.periods[period_type]]}
+
+    def status(self):
+        with self.lock:
+            return {
+                "stations": len(self.names),
+                "layers": len(self.layers),
+                "cache_mb": round(self.layers_bytes / 1e6, 2),
+                "cache_limit_mb": self.args.cache_mb,
+                "hits": self.hits,
+                "misses": self.misses,
+                "computing": len(self.pending),
+                "grids": list(self.grids)
+            }
+
+
+class LayerRequestHandler(SimpleHTTPRequestHandler):
+    def __init__(self, *args, service=None, **kwargs):
+        self.service = service
+        super().__init__(*args, **kwargs)
+
+    def do_GET(self):
+        parts = urlsplit(self.path)
+        if parts.path.startswith("/api/"):
+            query = {key: values[-1] for key, values in parse_qs(parts.query).items()}
+            self.handle_api(parts.path[len("/api/"):], query)
+        elif "Range" in self.headers:
+            self.send_range()
+        else:
+            super().do_GET()
+
+    def handle_api(self, name, query):
+        try:
+            if name == "index.json":
+                self.send_body(200, json.dumps(self.service.live_index()).encode("utf-8"), "application/json")
+            elif name == "status":
+                self.send_body(200, json.dumps(self.service.status()).encode("utf-8"), "application/json")
+            elif name in ("layer.json", "layer.bin"):
+                entry = self.service.layer(query)
+                if name == "layer.json":
+                    self.send_body(200, entry["header"], "application/json")
+                else:
+                    self.send_body(200, entry["payload"], "application/octet-stream")
+            else:
+                raise LayerError(404, f"Unknown endpoint: api/{name}")
+        except LayerError as exc:
+            self.send_body(exc.status, json.dumps({"error": str(exc)}).encode("utf-8"), "application/json")
+        except SystemExit as exc:
+            self.send_body(400, json.dumps({"error": str(exc)}).encode("utf-8"), "application/json")
+        except Exception as exc:
+            # Unexpected failure (MemoryError, I/O...): the client gets a JSON error, the traceback goes to the log.
+            self.log_error("api/%s failed: %r", name, exc)
+            self.send_body(500, json.dumps({"error": f"Internal error: {exc!r}"}).encode("utf-8"),
+                           "application/json")
+
+    def send_body(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_range(self):
+        # Single byte range of a static file (series chunks); anything else falls back to the full file.
+        path = Path(self.translate_path(self.path))
+        match = re.fullmatch(r"bytes=(\d*)-(\d*)", self.headers["Range"].strip())
+        if not path.is_file() or match is None or match.groups() == ("", ""):
+            super().do_GET()
+            return
+        size = path.stat().st_size
+        first, last = match.groups()
+        if first:
+            start, end = int(first), min(int(last) if last else size - 1, size - 1)
+        else:
+            start, end = max(size - int(last), 0), size - 1
+        if start > end:
+            self.send_response(416)
+            self.send_header("Content-Range", f"bytes */{size}")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        with open(path, "rb") as file:
+            file.seek(start)
+            body = file.read(end - start + 1)
+        self.send_response(206)
+        self.send_header("Content-Type", self.guess_type(str(path)))
+        self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Accept-Ranges", "bytes")
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def main():
+    args = parse_args()
+    service = LayerService(args)
+    print(f"Stations: {len(service.names)}, days: {len(service.periods['day'])}, "
+          f"months: {len(service.periods['month'])}")
+    # Default grid and method warm before the first request.
+    try:
+        service.operator(service.grid_context(args.grid), args.method)
+    except LayerError as exc:
+        raise SystemExit(str(exc)) from exc
+
+    handler = partial(LayerRequestHandler, service=service, directory=str(Path(args.root).resolve()))
+    server = ThreadingHTTPServer((args.host, args.port), handler)
+    server.daemon_threads = True
+    print(f"Serving {Path(args.root).resolve()} and api/ on http://{args.host}:{args.port}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
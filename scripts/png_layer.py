@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Map-overlay PNG renderer for interpolated grids (no matplotlib).
+A 256-entry colour lookup table built from the dashboard palettes (paletteForMetric in app.js) is applied
+to the masked grid; cells outside the mask are transparent. export_png_layer() writes a north-up RGBA PNG
+in the grid CRS with its world file (.pgw); export_xyz_tiles() cuts a Web-Mercator XYZ pyramid
+(tiles/<stem>/{z}/{x}/{y}.png, empty tiles skipped) for L.tileLayer.
+Tile pixels sample the nearest grid cell; the pixel -> cell index of each tile only depends on the grid and
+the zoom, so it is computed once per process (from a 17 x 17 lattice of exact reprojections, bilinearly
+refined) and shared by every layer.
+"""
+
+import os
+import struct
+import zlib
+from pathlib import Path
+
+import numpy as np
+
+try:
+    from pyproj import Transformer
+except ImportError as exc:
+    raise SystemExit("Missing dependency: pyproj. Please install it in your env.") from exc
+
+
+# Same colours as paletteForMetric() in app.js (start -> end of the scale).
+PALETTES = {
+    "temperature": ("#2f5bff", "#ff8a3d"),
+    "precipitation": ("#6b2cff", "#2f5bff"),
+    "vent": ("#ff8a3d", "#12b981")
+}
+LUT_SIZE = 256
+TILE_SIZE = 256
+MERCATOR_EXTENT = 20037508.342789244
+LATTICE = 17
+
+TILE_INDEX = {}
+
+
+def palette_for(variable):
+    # temp_min / temp_moy / temperature -> temperature, vent_moy / vent_max -> vent; like app.js, default temperature.
+    for prefix, metric in (("temp", "temperature"), ("precip", "precipitation"), ("vent", "vent")):
+        if str(variable).startswith(prefix):
+            return PALETTES[metric]
+    return PALETTES["temperature"]
+
+
+def hex_to_rgb(color):
+    raw = int(color.lstrip("#"), 16)
+    return np.array([(raw >> 16) & 255, (raw >> 8) & 255, raw & 255], dtype=float)
+
+
+def color_lut(variable, size=LUT_SIZE):
+    # RGBA rows blended start -> end (blendColor() in app.js), fully opaque; opacity is left to the map.
+    start, end = (hex_to_rgb(color) for color in palette_for(variable))
+    ratio = np.linspace(0.0, 1.0, size)[:, None]
+    lut = np.empty((size, 4), dtype=np.uint8)
+    lut[:, :3] = np.floor(start + (end - start) * ratio + 0.5)
+    lut[:, 3] = 255
+    return lut
+
+
+def colorize(grid_vals, variable, vmin=None, vmax=None):
+    # Grid rows go south -> north; the image is north-up. Returns (rows, cols, 4) uint8.
+    data = np.asarray(grid_vals, dtype=float)[::-1]
+    valid = ~np.isnan(data)
+    rgba = np.zeros(data.shape + (4,), dtype=np.uint8)
+    if not valid.any():
+        return rgba
+    values = data[valid]
+    vmin = float(values.min()) if vmin is None else vmin
+    vmax = float(values.max()) if vmax is None else vmax
+    ratio = (values - vmin) / (vmax - vmin) if vmax > vmin else np.full(values.shape, 0.5)
+    codes = np.clip(np.floor(ratio * (LUT_SIZE - 1) + 0.5), 0, LUT_SIZE - 1).astype(np.intp)
+    rgba[valid] = color_lut(variable)[codes]
+    return rgba
+
+
+def encode_png(rgba, level=6):
+    height, width = rgba.shape[:2]
+    # Filter type 0 (none) in front of every scanline.
+    raw = np.concatenate([np.zeros((height, 1), dtype=np.uint8), rgba.reshape(height, width * 4)], axis=1)
+
+    def chunk(kind, data):
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+    return b"".join([
+        b"\x89PNG\r\n\x1a\n",
+        chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0)),
+        chunk(b"IDAT", zlib.compress(raw.tobytes(), level)),
+        chunk(b"IEND", b"")
+    ])
+
+
+def write_bytes(path, payload):
+    path = Path(path)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "wb") as file:
+        file.write(payload)
+    os.replace(tmp_path, path)
+
+
+def export_png_layer(path, grid_vals, xs, ys, resolution, variable, vmin=None, vmax=None):
+    write_bytes(path, encode_png(colorize(grid_vals, variable, vmin, vmax)))
+    # World file: pixel size, rotation terms, centre of the upper-left pixel (grid CRS).
+    world = [resolution, 0.0, 0.0, -resolution, float(xs[0]), float(ys[-1])]
+    with open(Path(path).with_suffix(".pgw"), "w", encoding="ascii") as file:
+        file.write("\n".join(f"{value:.6f}" for value in world) + "\n")
+    return path
+
+
+def grid_corners(xs, ys, resolution, steps=16):
+    # Points along the grid outline (its reprojection is not a rectangle).
+    half = resolution / 2
+    west, east, south, north = xs[0] - half, xs[-1] + half, ys[0] - half, ys[-1] + half
+    line = np.linspace(0.0, 1.0, steps + 1)
+    px = np.concatenate([west + (east - west) * line, np.full(steps + 1, east),
+                         west + (east - west) * line, np.full(steps + 1, west)])
+    py = np.concatenate([np.full(steps + 1, south), south + (north - south) * line,
+                         np.full(steps + 1, north), south + (north - south) * line])
+    return px, py
+
+
+def interpolation_matrix(size=TILE_SIZE, nodes=LATTICE):
+    # (size, nodes) linear interpolation weights from lattice nodes to pixel centres.
+    positions = np.linspace(0.5, size - 0.5, nodes)
+    pixels = np.arange(size) + 0.5
+    weights = np.zeros((size, nodes))
+    upper = np.clip(np.searchsorted(positions, pixels, side="right"), 1, nodes - 1)
+    frac = (pixels - positions[upper - 1]) / (positions[upper] - positions[upper - 1])
+    weights[np.arange(size), upper - 1] = 1 - frac
+    weights[np.arange(size), upper] = frac
+    return weights, positions
+
+
+def tile_index(xs, ys, resolution, zooms, crs="EPSG:2154"):
+    # [(z, x, y, flat cell index per pixel, -1 outside the grid)] for the tiles overlapping the grid.
+    key = (float(xs[0]), float(ys[0]), len(xs), len(ys), float(resolution), tuple(zooms), crs)
+    if key in TILE_INDEX:
+        return TILE_INDEX[key]
+    to_mercator = Transformer.from_crs(crs, "EPSG:3857", always_xy=True)
+    from_mercator = Transformer.from_crs("EPSG:3857", crs, always_xy=True)
+    mx, my = to_mercator.transform(*grid_corners(xs, ys, resolution))
+    weights, positions = interpolation_matrix()
+    rows, cols = len(ys), len(xs)
+    west, north = xs[0] - resolution / 2, ys[-1] + resolution / 2
+
+    tiles = []
+    for zoom in range(zooms[0], zooms[1] + 1):
+        span = 2 * MERCATOR_EXTENT / 2 ** zoom
+        pixel = span / TILE_SIZE
+        x_range = range(int((min(mx) + MERCATOR_EXTENT) // span), int((max(mx) + MERCATOR_EXTENT) // span) + 1)
+        y_range = range(int((MERCATOR_EXTENT - max(my)) // span), int((MERCATOR_EXTENT - min(my)) // span) + 1)
+        for tx in x_range:
+            for ty in y_range:
+                lx = -MERCATOR_EXTENT + tx * span + positions * pixel
+                ly = MERCATOR_EXTENT - ty * span - positions * pixel
+                gx, gy = from_mercator.transform(*np.meshgrid(lx, ly))
+                # Lattice (rows = y nodes, cols = x nodes) -> every pixel centre.
+                px = weights @ gx @ weights.T
+                py = weights @ gy @ weights.T
+                col = np.floor((px - west) / resolution).astype(np.int64)
+                row = np.floor((north - py) / resolution).astype(np.int64)
+                inside = (col >= 0) & (col < cols) & (row >= 0) & (row < rows)
+                if not inside.any():
+                    continue
+                tiles.append((zoom, tx, ty, np.where(inside, row * cols + col, -1).astype(np.int32)))
+    TILE_INDEX[key] = tiles
+    return tiles
+
+
+def tile_bounds(xs, ys, resolution, crs="EPSG:2154"):
+    # [[south, west], [north, east]] in WGS84 (L.latLngBounds) of the grid outline.
+    lon, lat = Transformer.from_crs(crs, "EPSG:4326", always_xy=True).transform(*grid_corners(xs, ys, resolution))
+    return [[float(min(lat)), float(min(lon))], [float(max(lat)), float(max(lon))]]
+
+
+def export_xyz_tiles(tile_dir, grid_vals, xs, ys, resolution, variable, zooms, vmin=None, vmax=None,
+                     crs="EPSG:2154"):
+    rgba = colorize(grid_vals, variable, vmin, vmax).reshape(-1, 4)
+    # Index -1 (outside the grid) picks the transparent row appended at the end.
+    rgba = np.vstack([rgba, np.zeros((1, 4), dtype=np.uint8)])
+    tile_dir = Path(tile_dir)
+    written = 0
+    for zoom, tx, ty, index in tile_index(xs, ys, resolution, zooms, crs):
+        pixels = rgba[index]
+        if not pixels[..., 3].any():
+            continue
+        path = tile_dir / str(zoom) / str(tx) / f"{ty}.png"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        write_bytes(path, encode_png(pixels))
+        written += 1
+    return {
+        "tiles": str(tile_dir / "{z}" / "{x}" / "{y}.png").replace("\\", "/"),
+        "tile_zooms": [int(zooms[0]), int(zooms[1])],
+        "tile_bounds": tile_bounds(xs, ys, resolution, crs),
+        "tile_count": written
+    }
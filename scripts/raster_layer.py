@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Compact raster layer format for the dashboard: a small JSON header + a binary payload.
+The payload is the masked grid, north-up, row-major, either float32 or uint16 quantized
+(value = offset + q * scale, nodata = 65535), optionally gzip-compressed.
+"""
+
+import gzip
+import json
+from pathlib import Path
+
+import numpy as np
+
+
+RASTER_FORMAT = "meteo-raster"
+RASTER_VERSION = 1
+UINT16_NODATA = 65535
+
+
+def encode_grid(grid_vals, encoding="uint16"):
+    # Grid rows go south -> north, the payload is north-up like a GeoTIFF.
+    data = np.asarray(grid_vals, dtype=float)[::-1]
+    valid = ~np.isnan(data)
+    if encoding == "float32":
+        return data.astype("<f4"), {"dtype": "float32", "scale": 1.0, "offset": 0.0, "nodata": None}
+
+    vmin = float(data[valid].min()) if valid.any() else 0.0
+    vmax = float(data[valid].max()) if valid.any() else 0.0
+    scale = (vmax - vmin) / (UINT16_NODATA - 1) or 1.0
+    quantized = np.full(data.shape, UINT16_NODATA, dtype="<u2")
+    quantized[valid] = np.rint((data[valid] - vmin) / scale).astype("<u2")
+    return quantized, {"dtype": "uint16", "scale": scale, "offset": vmin, "nodata": UINT16_NODATA}
+
+
+def decode_grid(payload, header):
+    # Inverse of encode_grid, returns the grid in the script orientation (rows south -> north).
+    rows, cols = header["shape"]
+    data = np.frombuffer(payload, dtype="<f4" if header["dtype"] == "float32" else "<u2").reshape(rows, cols)
+    if header["dtype"] == "float32":
+        values = data.astype(float)
+    else:
+        values = np.where(data == header["nodata"], np.nan, header["offset"] + data * header["scale"])
+    return values[::-1]
+
+
+def raster_payload(grid_vals, xs, ys, resolution, data_name, crs="EPSG:2154", encoding="uint16", compress=True,
+                   stats=None):
+    # (header, payload bytes) of a layer; data_name is where the header points the client for the payload.
+    data, encoding_info = encode_grid(grid_vals, encoding)
+    payload = data.tobytes()
+    if compress:
+        payload = gzip.compress(payload, compresslevel=6, mtime=0)
+    header = {
+        "format": RASTER_FORMAT,
+        "version": RASTER_VERSION,
+        "crs": crs,
+        "origin": [float(xs[0] - resolution / 2), float(ys[-1] + resolution / 2)],
+        "resolution": float(resolution),
+        "shape": [int(data.shape[0]), int(data.shape[1])],
+        "compression": "gzip" if compress else None,
+        "data": data_name,
+        "stats": stats
+    }
+    header.update(encoding_info)
+    return header, payload
+
+
+def export_raster_layer(path, grid_vals, xs, ys, resolution, crs="EPSG:2154", encoding="uint16",
+                        compress=True, stats=None):
+    header_path = Path(path)
+    data_name = header_path.name.replace(".json", ".bin") + (".gz" if compress else "")
+    header, payload = raster_payload(grid_vals, xs, ys, resolution, data_name, crs, encoding, compress, stats)
+    with open(header_path.with_name(data_name), "wb") as file:
+        file.write(payload)
+    with open(header_path, "w", encoding="utf-8") as file:
+        json.dump(header, file, ensure_ascii=False)
+    return header
+
+
+def load_raster_layer(path):
+    header_path = Path(path)
+    with open(header_path, "r", encoding="utf-8") as file:
+        header = json.load(file)
+    with open(header_path.with_name(header["data"]), "rb") as file:
+        payload = file.read()
+    if header.get("compression") == "gzip":
+        payload = gzip.decompress(payload)
+    return header, decode_grid(payload, header)
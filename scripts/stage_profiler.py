@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Per-stage profiling for the pipeline scripts (--profile).
+Each stage records wall time, CPU time (this process, or this thread with cpu_clock=time.thread_time),
+peak RSS during the stage and item counts (rows, stations, cells, features...). Run profiles are written
+under <outdir>/profiles/, layer profiles next to the layer outputs (computed in the worker that produced
+the layer), and aggregate_stages() summarizes the layer profiles of a batch run.
+Peak RSS is per stage on Linux (the high-water mark is reset when a stage starts), process-wide elsewhere.
+The reset is process-wide too: stages running on other threads (peak_rss=False, e.g. the export writers of
+interpolate_surface.py) record no peak, and the peaks of the other stages are only exact when no such thread runs.
+"""
+
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def memory_status():
+    # VmRSS / VmHWM in MB from /proc (Linux only).
+    try:
+        with open("/proc/self/status", "r", encoding="ascii") as f:
+            lines = [line.split() for line in f if line.startswith(("VmRSS", "VmHWM"))]
+    except OSError:
+        return {}
+    return {fields[0].rstrip(":"): round(int(fields[1]) / 1024, 1) for fields in lines}
+
+
+def reset_peak_rss():
+    # Writing 5 to clear_refs resets VmHWM to the current RSS (Linux >= 4.0).
+    try:
+        with open("/proc/self/clear_refs", "w", encoding="ascii") as f:
+            f.write("5")
+    except OSError:
+        return False
+    return True
+
+
+def peak_rss_mb():
+    peak = memory_status().get("VmHWM")
+    if peak is not None or resource is None:
+        return peak
+    # ru_maxrss is in kB on Linux, bytes on macOS; process-wide high-water mark.
+    scale = 1 if sys.platform == "darwin" else 1024
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 1e6, 1)
+
+
+class StageProfiler:
+    def __init__(self, enabled=True, cpu_clock=time.process_time, peak_rss=True):
+        self.enabled = enabled
+        self.cpu_clock = cpu_clock
+        self.peak_rss = peak_rss
+        self.stages = []
+
+    @contextmanager
+    def stage(self, name, **counts):
+        # Yields the counts dict so the stage body can fill in counts known only at the end.
+        if not self.enabled:
+            yield counts
+            return
+        if self.peak_rss:
+            reset_peak_rss()
+        wall, cpu = time.perf_counter(), self.cpu_clock()
+        try:
+            yield counts
+        finally:
+            self.stages.append({
+                "stage": name,
+                "wall_s": round(time.perf_counter() - wall, 4),
+                "cpu_s": round(self.cpu_clock() - cpu, 4),
+                "peak_rss_mb": peak_rss_mb() if self.peak_rss else None,
+                **counts
+            })
+
+    def report(self, **fields):
+        peaks = [s["peak_rss_mb"] for s in self.stages if s["peak_rss_mb"] is not None]
+        return {
+            **fields,
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "total_wall_s": round(sum(s["wall_s"] for s in self.stages), 4),
+            "total_cpu_s": round(sum(s["cpu_s"] for s in self.stages), 4),
+            "peak_rss_mb": max(peaks) if peaks else None,
+            "stages": self.stages
+        }
+
+
+def aggregate_stages(profiles):
+    # profiles: stage lists (one per layer) -> per-stage calls, totals, mean / max wall time, summed counts.
+    # Entries flagged "shared" repeat a stage measured once for several layers and are skipped.
+    summary = {}
+    for stages in profiles:
+        for entry in stages:
+            if entry.get("shared"):
+                continue
+            item = summary.setdefault(entry["stage"], {"calls": 0, "wall_s": 0.0, "wall_max_s": 0.0, "cpu_s": 0.0,
+                                                       "peak_rss_mb": None})
+            item["calls"] += 1
+            item["wall_s"] += entry["wall_s"]
+            item["wall_max_s"] = max(item["wall_max_s"], entry["wall_s"])
+            item["cpu_s"] += entry["cpu_s"]
+            if entry.get("peak_rss_mb") is not None:
+                item["peak_rss_mb"] = max(item["peak_rss_mb"] or 0, entry["peak_rss_mb"])
+            for key, value in entry.items():
+                if key not in ("stage", "wall_s", "cpu_s", "peak_rss_mb") and isinstance(value, (int, float)):
+                    item[key] = item.get(key, 0) + value
+    for item in summary.values():
+        item["wall_mean_s"] = round(item["wall_s"] / item["calls"], 4)
+        item["wall_s"] = round(item["wall_s"], 4)
+        item["cpu_s"] = round(item["cpu_s"], 4)
+    return summary
+
+
+def write_profile(path, profile):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(profile, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+    return path
+
+
+def run_profile_path(outdir, script):
+    # One report per run: concurrent runs writing to the same outdir must not overwrite each other.
+    stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+    return Path(outdir) / "profiles" / f"{script}_{stamp}_{os.getpid()}.json"
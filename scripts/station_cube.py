@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Reader for the station x date x variable cube written by build_dashboard_csv.py.
+values.npy is memory-mapped, so selecting a day or a month is a plain array slice.
+Month / season / year aggregates are read from rollups.npz when it matches the cube, instead of being
+re-aggregated from the daily values.
+"""
+
+from pathlib import Path
+
+import numpy as np
+
+
+def load_cube(path):
+    folder = Path(path)
+    if not (folder / "values.npy").exists():
+        raise SystemExit(f"Station cube not found in {folder} (run build_dashboard_csv.py).")
+    axes = np.load(folder / "axes.npz")
+    dates = axes["dates"].astype(str)
+    variables = [str(v) for v in axes["variables"]]
+    names = [str(n) for n in axes["names"]]
+    return {
+        "values": np.load(folder / "values.npy", mmap_mode="r"),
+        "names": names,
+        "lat": axes["lat"],
+        "lon": axes["lon"],
+        "dates": dates,
+        "date_index": {str(d): idx for idx, d in enumerate(dates)},
+        "variables": variables,
+        "variable_index": {v: idx for idx, v in enumerate(variables)},
+        "rollups": load_rollups(folder, names, dates)
+    }
+
+
+def load_rollups(folder, names, dates):
+    # Rollups written with an older cube (other stations or dates) are ignored.
+    path = folder / "rollups.npz"
+    if not path.exists():
+        return {}
+    with np.load(path) as data:
+        if [str(n) for n in data["names"]] != names or not np.array_equal(data["dates"].astype(str), dates):
+            return {}
+        rollups = {}
+        for key in data.files:
+            if key.endswith("_periods"):
+                level = key[:-len("_periods")]
+                periods = [str(p) for p in data[key]]
+                rollups[level] = {
+                    "index": {p: idx for idx, p in enumerate(periods)},
+                    "values": data[f"{level}_values"]
+                }
+    return rollups
+
+
+def station_axis(source, transformer):
+    # Full station list (meteo_data.json dict or cube) projected with transformer.
+    if "communes" in source:
+        names = list(source["communes"])
+        lonlat = [(c["longitude"], c["latitude"]) for c in source["communes"].values()]
+    else:
+        names = source["names"]
+        lonlat = zip(source["lon"], source["lat"])
+    xy = np.array([transformer.transform(lon, lat) for lon, lat in lonlat], dtype=float)
+    return names, xy
+
+
+def month_slice(cube, month):
+    key = month.replace("-", "")
+    dates = cube["dates"]
+    start = int(np.searchsorted(dates, key + "00"))
+    end = int(np.searchsorted(dates, key + "99"))
+    return slice(start, end)
+
+
+def period_values(cube, variable, period_type, period):
+    var_idx = cube["variable_index"][variable]
+    rollup = cube.get("rollups", {}).get(period_type)
+    if rollup is not None:
+        idx = rollup["index"].get(period)
+        if idx is None:
+            return np.full(len(cube["names"]), np.nan)
+        return np.asarray(rollup["values"][:, idx, var_idx], dtype=float)
+    if period_type == "month":
+        block = np.asarray(cube["values"][:, month_slice(cube, period), var_idx], dtype=float)
+        counts = np.sum(~np.isnan(block), axis=1)
+        if variable == "precipitation":
+            values = np.nansum(block, axis=1)
+        else:
+            values = np.nansum(block, axis=1) / np.maximum(counts, 1)
+        return np.where(counts > 0, values, np.nan)
+    col = cube["date_index"].get(period)
+    if col is None:
+        return np.full(len(cube["names"]), np.nan)
+    return np.asarray(cube["values"][:, col, var_idx], dtype=float)
+
+
+def cube_station_values(cube, variable, period_type, period):
+    values = period_values(cube, variable, period_type, period)
+    return [
+        {
+            "name": cube["names"][idx],
+            "lat": float(cube["lat"][idx]),
+            "lon": float(cube["lon"][idx]),
+            "value": float(values[idx])
+        }
+        for idx in np.flatnonzero(~np.isnan(values))
+    ]
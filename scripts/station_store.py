@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Reader for the partitioned station store written by build_dashboard_csv.py
+(Parquet, hive partitions departement=XX/annee=AAAA).
+Only the requested variables and the partitions overlapping the date range are read; the result has the
+same layout as load_cube(), so the cube helpers (station_axis, cube_station_values) work unchanged.
+"""
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+except ImportError:
+    pa = None
+    ds = None
+
+
+STATION_FIELDS = ["NUM_POSTE", "NOM_USUEL", "LAT", "LON", "AAAAMMJJ"]
+
+
+def store_partitioning():
+    return ds.partitioning(pa.schema([("departement", pa.string()), ("annee", pa.int32())]), flavor="hive")
+
+
+def date_range(periods):
+    # (first AAAAMMJJ, last AAAAMMJJ) covering the periods, or (None, None) for 'dates' / 'months' / none.
+    days = []
+    for period in periods or []:
+        if period is None or period in ("dates", "months", "days"):
+            return None, None
+        if len(period) == 8:
+            days.extend([period, period])
+        else:
+            month = period.replace("-", "")
+            days.extend([month + "01", month + "31"])
+    if not days:
+        return None, None
+    return min(days), max(days)
+
+
+def store_filter(start=None, end=None, departements=None):
+    expression = None
+    conditions = []
+    if start:
+        conditions += [ds.field("annee") >= int(start[:4]), ds.field("AAAAMMJJ") >= start]
+    if end:
+        conditions += [ds.field("annee") <= int(end[:4]), ds.field("AAAAMMJJ") <= end]
+    if departements:
+        conditions.append(ds.field("departement").isin([str(d) for d in departements]))
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+    return expression
+
+
+def load_store(path, variables, start=None, end=None, departements=None):
+    if ds is None:
+        raise SystemExit("Missing dependency: pyarrow for --store.")
+    try:
+        dataset = ds.dataset(path, format="parquet", partitioning=store_partitioning())
+    except (FileNotFoundError, pa.ArrowInvalid) as exc:
+        raise SystemExit(f"Station store not found in {path} (run build_dashboard_csv.py).") from exc
+    table = dataset.to_table(columns=STATION_FIELDS + list(variables),
+                             filter=store_filter(start, end, departements))
+    if table.num_rows == 0:
+        raise SystemExit("No station data in the store for this date range.")
+    df = table.to_pandas()
+
+    stations = df.drop_duplicates("NOM_USUEL").sort_values("NUM_POSTE")
+    names = [str(name) for name in stations["NOM_USUEL"]]
+    rows = pd.Categorical(df["NOM_USUEL"].astype(str), categories=names).codes
+    dates, cols = np.unique(df["AAAAMMJJ"].to_numpy(dtype=str), return_inverse=True)
+
+    values = np.full((len(names), len(dates), len(variables)), np.nan, dtype=np.float32)
+    for var_idx, variable in enumerate(variables):
+        values[rows, cols, var_idx] = df[variable].to_numpy(dtype=np.float32)
+
+    return {
+        "values": values,
+        "names": names,
+        "lat": stations["LAT"].to_numpy(dtype=float),
+        "lon": stations["LON"].to_numpy(dtype=float),
+        "dates": dates,
+        "date_index": {str(d): idx for idx, d in enumerate(dates)},
+        "variables": list(variables),
+        "variable_index": {v: idx for idx, v in enumerate(variables)}
+    }
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Synthetic Meteo-France daily files for benchmarks (Q_<dept>_..._RR-T-Vent.csv layout, 58 columns).
+Stations are drawn uniformly inside the department polygon (EPSG:2154); daily series follow a seasonal
+cycle with altitude lapse rate, gamma-distributed rain and wind, and a small share of missing values.
+Rows are written station block by station block, so thousands of stations x decades fit in memory.
+
+Example: python scripts/synthetic_data.py --stations 500 --years 30 --output data/synthetic/Q_13_synth.csv.gz
+"""
+
+import argparse
+import gzip
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from generate_spatial_layers import load_department_mask
+from grid_mask import contains_points
+
+try:
+    from pyproj import Transformer
+except ImportError as exc:
+    raise SystemExit("Missing dependency: pyproj. Please install it in your env.") from exc
+
+
+METEO_FRANCE_COLUMNS = [
+    "NUM_POSTE", "NOM_USUEL", "LAT", "LON", "ALTI", "AAAAMMJJ", "RR", "QRR", "TN", "QTN", "HTN", "QHTN",
+    "TX", "QTX", "HTX", "QHTX", "TM", "QTM", "TNTXM", "QTNTXM", "TAMPLI", "QTAMPLI", "TNSOL", "QTNSOL",
+    "TN50", "QTN50", "DG", "QDG", "FFM", "QFFM", "FF2M", "QFF2M", "FXY", "QFXY", "DXY", "QDXY", "HXY", "QHXY",
+    "FXI", "QFXI", "DXI", "QDXI", "HXI", "QHXI", "FXI2", "QFXI2", "DXI2", "QDXI2", "HXI2", "QHXI2",
+    "FXI3S", "QFXI3S", "DXI3S", "QDXI3S", "HXI3S", "QHXI3S", "DRR", "QDRR"
+]
+MEASURES = ["RR", "TN", "TX", "TM", "FFM", "FXI"]
+
+
+def synthetic_stations(geom, n_stations, rng, departement="13"):
+    minx, miny, maxx, maxy = geom.bounds
+    xs, ys = [], []
+    while sum(len(x) for x in xs) < n_stations:
+        cand_x = rng.uniform(minx, maxx, 2 * n_stations)
+        cand_y = rng.uniform(miny, maxy, 2 * n_stations)
+        inside = contains_points(geom, cand_x, cand_y)
+        xs.append(cand_x[inside])
+        ys.append(cand_y[inside])
+    x = np.concatenate(xs)[:n_stations]
+    y = np.concatenate(ys)[:n_stations]
+    lon, lat = Transformer.from_crs("EPSG:2154", "EPSG:4326", always_xy=True).transform(x, y)
+    # Relief rising towards the north-east of the department, plus noise.
+    relief = (x - minx) / max(maxx - minx, 1) + (y - miny) / max(maxy - miny, 1)
+    return pd.DataFrame({
+        "NUM_POSTE": [f"{departement}{idx:06d}" for idx in range(n_stations)],
+        "NOM_USUEL": [f"STATION {idx:05d}" for idx in range(n_stations)],
+        "LAT": np.round(lat, 6),
+        "LON": np.round(lon, 6),
+        "ALTI": np.clip(relief * 400 + rng.normal(0, 80, n_stations), 0, 1100).astype(int),
+        "x": x,
+        "y": y
+    })
+
+
+def synthetic_days(stations, dates, rng, missing=0.02):
+    n_days = len(dates)
+    n_rows = len(stations) * n_days
+    doy = np.tile(dates.dayofyear.to_numpy(), len(stations))
+    alti = np.repeat(stations["ALTI"].to_numpy(), n_days)
+
+    tm = 15 - 0.0065 * alti - 8 * np.cos(2 * np.pi * (doy - 15) / 365.25) + rng.normal(0, 2.5, n_rows)
+    spread = rng.uniform(3, 7, n_rows)
+    wet = rng.random(n_rows) < 0.25
+    ffm = rng.gamma(2.0, 1.6, n_rows)
+    columns = {
+        "RR": np.where(wet, rng.gamma(0.8, 8.0, n_rows), 0.0),
+        "TN": tm - spread,
+        "TX": tm + spread,
+        "TM": tm,
+        "FFM": ffm,
+        "FXI": ffm * rng.uniform(1.5, 3.0, n_rows)
+    }
+    frame = pd.DataFrame({
+        "NUM_POSTE": np.repeat(stations["NUM_POSTE"].to_numpy(), n_days),
+        "NOM_USUEL": np.repeat(stations["NOM_USUEL"].to_numpy(), n_days),
+        "LAT": np.repeat(stations["LAT"].map("{:.6f}".format).to_numpy(), n_days),
+        "LON": np.repeat(stations["LON"].map("{:.6f}".format).to_numpy(), n_days),
+        "ALTI": alti,
+        "AAAAMMJJ": np.tile(dates.strftime("%Y%m%d").to_numpy(), len(stations))
+    })
+    for column in MEASURES:
+        values = np.round(columns[column], 1)
+        values[rng.random(n_rows) < missing] = np.nan
+        frame[column] = values
+        frame[f"Q{column}"] = pd.array(np.where(np.isnan(values), None, 1), dtype="Int8")
+    return frame.reindex(columns=METEO_FRANCE_COLUMNS)
+
+
+def write_meteo_csv(path, stations, end_year, years, rng, block_rows=2000000):
+    dates = pd.date_range(f"{end_year - years + 1}-01-01", f"{end_year}-12-31", freq="D")
+    per_block = max(1, block_rows // len(dates))
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    opener = gzip.open if path.suffix == ".gz" else open
+    rows = 0
+    with opener(tmp_path, "wt", encoding="utf-8", newline="") as handle:
+        for start in range(0, len(stations), per_block):
+            block = synthetic_days(stations.iloc[start:start + per_block], dates, rng)
+            block.to_csv(handle, sep=";", index=False, header=start == 0, float_format="%.1f")
+            rows += len(block)
+    os.replace(tmp_path, path)
+    return rows
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Write a synthetic Meteo-France daily CSV.")
+    parser.add_argument("--departement", default="data/raw/departement_13.geojson", help="Department GeoJSON (EPSG:2154)")
+    parser.add_argument("--stations", type=int, default=21, help="Number of stations")
+    parser.add_argument("--years", type=int, default=1, help="Number of years")
+    parser.add_argument("--end-year", type=int, default=2024, help="Last year of the series")
+    parser.add_argument("--seed", type=int, default=13)
+    parser.add_argument("--output", required=True, help="CSV path (.csv or .csv.gz)")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    rng = np.random.default_rng(args.seed)
+    geom, _ = load_department_mask(args.departement)
+    stations = synthetic_stations(geom, args.stations, rng)
+    rows = write_meteo_csv(args.output, stations, args.end_year, args.years, rng)
+    print(f"{args.output}: {args.stations} stations, {args.years} years, {rows} rows")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Tile helpers for grids too large to hold in memory (--tile-size).
+The grid is never materialised: each (row, column) block is rebuilt from the 1D axes on demand.
+"""
+
+import math
+
+import numpy as np
+
+
+def grid_axes(bounds, resolution):
+    minx, miny, maxx, maxy = bounds
+    xs = np.arange(minx, maxx + resolution, resolution)
+    ys = np.arange(miny, maxy + resolution, resolution)
+    return xs, ys
+
+
+def grid_shape(bounds, resolution):
+    # (rows, cols) of grid_axes() without allocating the axes (np.arange length).
+    minx, miny, maxx, maxy = bounds
+    return math.ceil((maxy + resolution - miny) / resolution), math.ceil((maxx + resolution - minx) / resolution)
+
+
+def iter_tiles(height, width, tile_size):
+    for r0 in range(0, height, tile_size):
+        for c0 in range(0, width, tile_size):
+            yield r0, min(r0 + tile_size, height), c0, min(c0 + tile_size, width)
+
+
+def tile_grid(xs, ys, window):
+    r0, r1, c0, c1 = window
+    return np.meshgrid(xs[c0:c1], ys[r0:r1])
+
+
+def new_stats():
+    return {"min": np.inf, "max": -np.inf, "sum": 0.0, "count": 0}
+
+
+def update_stats(acc, block):
+    valid = block[~np.isnan(block)]
+    if valid.size:
+        acc["min"] = min(acc["min"], float(valid.min()))
+        acc["max"] = max(acc["max"], float(valid.max()))
+        acc["sum"] += float(valid.sum(dtype=np.float64))
+        acc["count"] += int(valid.size)
+
+
+def finish_stats(acc):
+    if not acc["count"]:
+        return {"min": None, "max": None, "mean": None}
+    return {"min": acc["min"], "max": acc["max"], "mean": acc["sum"] / acc["count"]}
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Per-commune zonal statistics of the interpolated grids.
+The communes are rasterized once into a label grid aligned with the interpolation grid (cell centre inside
+the commune), cached on disk, and every layer is reduced per label with bincount / reduceat.
+Communes too small to contain a cell centre fall back to the cell under their representative point.
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+
+import numpy as np
+
+from grid_mask import compute_mask, mask_key
+
+try:
+    from shapely.geometry import shape
+except ImportError as exc:
+    raise SystemExit("Missing dependency: shapely") from exc
+
+
+def load_communes(path):
+    with open(path, "r", encoding="utf-8") as f:
+        geo = json.load(f)
+    codes = [str(feat["properties"].get("insee")) for feat in geo["features"]]
+    geoms = [shape(feat["geometry"]) for feat in geo["features"]]
+    return codes, geoms
+
+
+def file_hash(path):
+    with open(path, "rb") as f:
+        return hashlib.sha1(f.read()).hexdigest()[:16]
+
+
+def rasterize_communes(codes, geoms, grid_x, grid_y, resolution):
+    labels = np.full(grid_x.shape, -1, dtype=np.int16)
+    fallback = np.full(len(codes), -1, dtype=np.int64)
+    xs, ys = grid_x[0, :], grid_y[:, 0]
+    for label, geom in enumerate(geoms):
+        inside = compute_mask(geom, grid_x, grid_y) & (labels < 0)
+        labels[inside] = label
+        if not inside.any():
+            point = geom.representative_point()
+            col = int(round((point.x - xs[0]) / resolution))
+            row = int(round((point.y - ys[0]) / resolution))
+            if 0 <= row < len(ys) and 0 <= col < len(xs):
+                fallback[label] = row * len(xs) + col
+    return labels, fallback
+
+
+def load_or_build_zones(communes_path, grid_x, grid_y, bounds, resolution, cache_dir=None):
+    codes, geoms = load_communes(communes_path)
+    if not cache_dir:
+        labels, fallback = rasterize_communes(codes, geoms, grid_x, grid_y, resolution)
+        return {"codes": codes, "labels": labels.ravel(), "fallback": fallback}
+
+    path = Path(cache_dir) / f"zones_{mask_key(file_hash(communes_path), bounds, resolution)}.npz"
+    if path.exists():
+        try:
+            with np.load(path) as cached:
+                if cached["labels"].shape == grid_x.shape and list(cached["codes"]) == codes:
+                    return {"codes": codes, "labels": cached["labels"].ravel(), "fallback": cached["fallback"]}
+        except (OSError, ValueError, KeyError):
+            pass
+
+    labels, fallback = rasterize_communes(codes, geoms, grid_x, grid_y, resolution)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f"{path.stem}.{os.getpid()}.tmp.npz")
+    np.savez(tmp_path, labels=labels, fallback=fallback, codes=np.array(codes))
+    os.replace(tmp_path, path)
+    return {"codes": codes, "labels": labels.ravel(), "fallback": fallback}
+
+
+def zonal_stats(grid_vals, zones, digits=3):
+    # {insee: [mean, min, max, cells]}; cells == 0 means the value of the cell under the commune's point.
+    values = np.asarray(grid_vals, dtype=float).ravel()
+    labels = zones["labels"]
+    n = len(zones["codes"])
+    valid = (labels >= 0) & ~np.isnan(values)
+    lab, vals = labels[valid].astype(np.int64), values[valid]
+
+    counts = np.bincount(lab, minlength=n)
+    sums = np.bincount(lab, weights=vals, minlength=n)
+    mins = np.full(n, np.nan)
+    maxs = np.full(n, np.nan)
+    if lab.size:
+        order = np.argsort(lab, kind="stable")
+        lab, vals = lab[order], vals[order]
+        starts = np.flatnonzero(np.r_[True, lab[1:] != lab[:-1]])
+        mins[lab[starts]] = np.minimum.reduceat(vals, starts)
+        maxs[lab[starts]] = np.maximum.reduceat(vals, starts)
+
+    result = {}
+    for label, code in enumerate(zones["codes"]):
+        if counts[label]:
+            mean = sums[label] / counts[label]
+            result[code] = [round(float(mean), digits), round(float(mins[label]), digits),
+                            round(float(maxs[label]), digits), int(counts[label])]
+        elif zones["fallback"][label] >= 0 and not np.isnan(values[zones["fallback"][label]]):
+            value = round(float(values[zones["fallback"][label]]), digits)
+            result[code] = [value, value, value, 0]
+    return result